@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+"""
+    This file defines the database access of the tornado handlers.
+    SQL_wrapper blocks, so its queries run on a bounded thread pool and the
+    handlers yield the returned futures: the IOLoop keeps serving the other
+    clients, the log streams and the push channel while a query is in flight.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from tornado.concurrent import run_on_executor
+import farmer_log
+
+
+class AsyncDatabase(object):
+    """
+        Coroutine-friendly front of a SQL_wrapper
+        Attributes:
+            max_workers: queries in flight at once, one pooled connection each
+    """
+    max_workers = 8
+
+    def __init__(self, sql_wrapper, max_workers=None):
+        self.sql_wrapper = sql_wrapper
+        self.max_workers = max_workers if max_workers is not None else self.__class__.max_workers
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+
+    @run_on_executor
+    def run(self, function, *args, **kwargs):
+        """
+            run any blocking function on the database threads
+            Returns:
+                Future of the function result
+        """
+        farmer_log.debug("run %s on the database executor" % function.__name__)
+        return function(*args, **kwargs)
+
+    @run_on_executor
+    def get_request_reports(self, count, older=None, newer=None, filters=None):
+        return self.sql_wrapper.get_request_reports(count, older=older, newer=newer, filters=filters)
+
+    @run_on_executor
+    def get_result_by_request_id(self, request_id):
+        return self.sql_wrapper.get_result_by_request_id(request_id)
+
+    @run_on_executor
+    def exists_mail(self, mail):
+        return self.sql_wrapper.exists_mail(mail)
+
+    @run_on_executor
+    def account_login(self, mail, password):
+        return self.sql_wrapper.account_login(mail, password)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
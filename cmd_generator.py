@@ -89,6 +89,59 @@ def kill_docker(container):
     result = sudo_wrapper("%s kill %s" % (DOCKER_COMMAND, container))
     return result    
 
+def remove_docker(container):
+    """
+    Remove one container, stop it first if it is running
+
+    Args:
+        container: the container id
+
+    Returns:
+        The command to remove the container.
+    """
+    result = sudo_wrapper("%s rm -f %s" % (DOCKER_COMMAND, container))
+    return result
+
+def inspect_docker_running(container):
+    """
+    Check if one container is running
+
+    Args:
+        container: the container id
+
+    Returns:
+        The command printing "true" when the container is running.
+    """
+    result = sudo_wrapper("%s inspect -f '{{.State.Running}}' %s" % (DOCKER_COMMAND, container))
+    return result
+
+def exec_docker(container, command):
+    """
+    Run a command in a running container
+
+    Args:
+        container: the container id
+        command: the command run in the container
+
+    Returns:
+        The command to run the command in the container.
+    """
+    result = sudo_wrapper("%s exec %s %s" % (DOCKER_COMMAND, container, command))
+    return result
+
+def list_containers(prefix):
+    """
+    List the ids of all containers, running or not, whose name starts with prefix
+
+    Args:
+        prefix: the prefix of the container names
+
+    Returns:
+        The command to list the containers.
+    """
+    result = sudo_wrapper("%s ps -a -q --filter name=^/%s" % (DOCKER_COMMAND, prefix))
+    return result
+
 def execute(command):
     """
     Open a pipe to/from a command returning a file object.
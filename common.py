@@ -1,6 +1,7 @@
 #!usr/bin/env python
 
 import os
+from itertools import izip, repeat
 
 class requests(object):
 
@@ -25,10 +26,12 @@ class BinaryInfo(object):
         self.date        = date
 
 class ResultObject(object):
+    __slots__ = ('request_id', 'docker_id', 'gpu_model', 'email', 'framework', 'topology',
+                 'batch_size', 'source', 'iteration', 'score', 'images_pre_sec', 'cached')
 
     def __init__(self, request_id, docker_id, gpu_model,\
                  email, framework, topology, batch_size, \
-                 source, iteration, score, images_pre_sec):
+                 source, iteration, score, images_pre_sec, cached = False):
         self.request_id     = request_id
         self.docker_id      = docker_id
         self.gpu_model      = gpu_model
@@ -40,8 +43,11 @@ class ResultObject(object):
         self.iteration      = iteration
         self.score          = score
         self.images_pre_sec = images_pre_sec
+        self.cached         = cached
 
 class RequestObject(object):
+    __slots__ = ('request_id', 'docker_id', 'gpu_model', 'mail_addr', 'framework', 'topology',
+                 'batch_size', 'iteration', 'request_time')
 
     def __init__(self, request_id, docker_id, gpu_model,\
                  mail_addr, framework, topology, batch_size, \
@@ -63,57 +69,72 @@ class RequestObject(object):
     def profile_file(self):
         return "%s.zip" % self.request_id
 
-class DataMediator():
-
-    def __init__(self, header):
-        self.header = header
-        self.dataList = []
+class DataMediator(object):
+    """
+        Result set of a query, stored by column.
+        Every column is one list and the position of a column is looked up once
+        per call, so no per-row tuple or dict is kept, and a DataFrame is built
+        from the column lists as they are.
+        Attributes:
+            header    : column names
+            positions : column name -> position in header
+            columns   : one list of values per column of header
+    """
+    RESULT_FIELDS  = ("REQUEST_ID", "DOCKER_ID", "GPU_MODEL", "MAIL_ADDRESS", "FRAMEWORK", "TOPOLOGY",
+                      "BATCH_SIZE", "SOURCE", "ITERATION", "SCORE", "IMAGES_PRE_SEC")
+    REQUEST_FIELDS = ("REQUEST_ID", "DOCKER_ID", "GPU_MODEL", "MAIL_ADDRESS", "FRAMEWORK", "TOPOLOGY",
+                      "BATCH_SIZE", "ITERATION", "REQUEST_TIME")
+
+    def __init__(self, header, rows = ()):
+        self.header    = tuple(header)
+        self.positions = dict((name, index) for (index, name) in enumerate(self.header))
+        self.columns   = [[] for name in self.header]
+        self.extend(rows)
 
     def append(self, row):
-        self.dataList.append(row)
+        for (column, value) in zip(self.columns, row):
+            column.append(value)
+
+    def extend(self, rows):
+        """
+            append rows, e.g. the cursor.fetchall() of the header columns
+        """
+        for (column, values) in zip(self.columns, zip(*rows)):
+            column.extend(values)
 
     def __len__(self):
-        return len(self.dataList)
+        return len(self.columns[0]) if self.columns else 0
+
+    def __getitem__(self, index):
+        return tuple(column[index] for column in self.columns)
+
+    def __iter__(self):
+        return izip(*self.columns)
+
+    def pop(self, index = -1):
+        return tuple(column.pop(index) for column in self.columns)
+
+    def column(self, name):
+        return self.columns[self.positions[name]]
 
-    def pop(self):
-        return self.dataList.pop()
+    def select(self, names):
+        """
+            Returns:
+                iterator of the rows of the names columns
+        """
+        return izip(*[self.column(name) for name in names])
 
     def to_data_frame(self):
-        result = {}
-        for index, entry in enumerate(self.header):
-            result[entry] = [] 
-        for item in self.dataList:
-            for index, entry in enumerate(self.header):
-                result[entry].append(item[index]) 
-        return result
+        """
+            Returns:
+                dict of column name -> column list for pandas.DataFrame, the lists are not copied
+        """
+        return dict(zip(self.header, self.columns))
             
     def to_result_objects(self):
-        result = []
-        for item in self.dataList:
-            result.append(ResultObject(item[self.header.index("REQUEST_ID")],    \
-                                       item[self.header.index("DOCKER_ID")],     \
-                                       item[self.header.index("GPU_MODEL")],     \
-                                       item[self.header.index("MAIL_ADDRESS")],  \
-                                       item[self.header.index("FRAMEWORK")],     \
-                                       item[self.header.index("TOPOLOGY")],      \
-                                       item[self.header.index("BATCH_SIZE")],    \
-                                       item[self.header.index("SOURCE")],        \
-                                       item[self.header.index("ITERATION")],     \
-                                       item[self.header.index("SCORE")],         \
-                                       item[self.header.index("IMAGES_PRE_SEC")])) 
-        return result
+        rows = self.select(self.RESULT_FIELDS)
+        cached = self.column("CACHED") if "CACHED" in self.positions else repeat(False)
+        return [ResultObject(*(row + (is_cached,))) for (row, is_cached) in izip(rows, cached)]
 
     def to_request_objects(self):
-        result = []
-        for item in self.dataList:
-            result.append(RequestObject(item[self.header.index("REQUEST_ID")],  \
-                                        item[self.header.index("DOCKER_ID")],   \
-                                        item[self.header.index("GPU_MODEL")],   \
-                                        item[self.header.index("MAIL_ADDRESS")],\
-                                        item[self.header.index("FRAMEWORK")],   \
-                                        item[self.header.index("TOPOLOGY")],    \
-                                        item[self.header.index("BATCH_SIZE")],  \
-                                        item[self.header.index("ITERATION")],   \
-                                        item[self.header.index("REQUEST_TIME")]))
-        
-        return result
+        return [RequestObject(*row) for row in self.select(self.REQUEST_FIELDS)]
@@ -2,7 +2,11 @@
 
 import os
 import re
-from MySql_wrapper import Mysql_wrapper
+import time
+import threading
+from collections import OrderedDict
+import farmer_log
+from cmd_generator import *
 from XMLParser import XMLParser
 
 
@@ -78,7 +82,123 @@ class Docker_Monitor(object):
                     return index
         return result_index
 
+class Container(object):
+    """
+        One container of the pool
+        Attributes:
+            prepared: frameworks whose bench scripts were copied into the container
+    """
+
+    def __init__(self, name, image, gpuid):
+        self.name      = name
+        self.image     = image
+        self.gpuid     = gpuid
+        self.prepared  = set()
+        self.last_used = time.time()
+
+    @property
+    def key(self):
+        return (self.image.repository, self.image.tag, self.gpuid)
+
+
+class Container_Pool(object):
+    """
+        Warm containers kept for every docker image and GPU.
+        A released container is health-checked and reset, so the next request of
+        the same image on the same GPU starts without a docker run nor a docker cp.
+        Attributes:
+            warm_size : idle containers kept for one image and GPU
+            capacity  : idle containers kept on the host, the least recently used are removed first
+            prefix    : name prefix of the containers started by the farm
+    """
+    warm_size = 1
+    capacity  = 8
+    prefix    = 'container_'
+    reset_command = 'rm -rf /tmp/log'
+
+    def __new__(cls):
+        if not hasattr(cls, 'instance'):
+            cls.instance = super(Container_Pool, cls).__new__(cls)
+        return cls.instance
+
+    def __init__(self):
+        self.idle = OrderedDict()
+        self.lock = threading.Lock()
+
+    def remove_stale(self):
+        """
+            remove the containers left by a previous run of the farm
+        """
+        fp = os.popen(list_containers(self.prefix))
+        for container_id in fp.read().split():
+            execute(remove_docker(container_id))
+        fp.close()
+
+    def is_healthy(self, container):
+        fp = os.popen(inspect_docker_running(container.name))
+        running = fp.read().strip()
+        fp.close()
+        return running == 'true'
+
+    def reset(self, container):
+        """
+            clear what the last run left in the container
+            Returns:
+                True on success
+        """
+        return os.system(exec_docker(container.name, self.reset_command)) == 0
+
+    def acquire(self, image, gpuid):
+        """
+            Returns:
+                an idle container of the image for the GPU, a new one when there is none
+        """
+        container = None
+        with self.lock:
+            for name in reversed(self.idle.keys()):
+                if self.idle[name].key == (image.repository, image.tag, gpuid):
+                    container = self.idle.pop(name)
+                    break
+        if container is not None:
+            if self.is_healthy(container):
+                return container
+            farmer_log.warning("container %s is not running, start a new one" % container.name)
+            execute(remove_docker(container.name))
+        container = Container(get_random_container(), image, gpuid)
+        execute(run_docker(container.name, image.repository, image.tag))
+        return container
+
+    def release(self, container, healthy=True):
+        """
+            give a container back to the pool after one run
+            Args:
+                healthy: False to remove the container, e.g. after a failed run
+        """
+        if not healthy or not self.reset(container):
+            execute(remove_docker(container.name))
+            return
+        container.last_used = time.time()
+        evicted = []
+        with self.lock:
+            self.idle[container.name] = container
+            same = [name for name in self.idle if self.idle[name].key == container.key]
+            for name in same[:max(0, len(same) - self.warm_size)]:
+                evicted.append(self.idle.pop(name))
+            while len(self.idle) > self.capacity:
+                evicted.append(self.idle.popitem(last=False)[1])
+        for container in evicted:
+            execute(remove_docker(container.name))
+
+    def clear(self):
+        with self.lock:
+            evicted = list(self.idle.values())
+            self.idle.clear()
+        for container in evicted:
+            execute(remove_docker(container.name))
+
+
 if __name__ == "__main__":
+    from MySql_wrapper import Mysql_wrapper
     dm = Docker_Monitor('localhost', 'root', 'tracing')
     dm.get_local_images(Mysql_wrapper("localhost", "root", "tracing"))
     print(dm.images[0].__dict__)
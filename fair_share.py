@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+"""
+    This file defines the order of the pending requests.
+    Requests are ordered by a score, the lowest runs first:
+        score = class offset + decayed GPU-seconds of the submitter / weight of the submitter
+                + min(sjf weight * expected runtime, sjf limit) - aging rate * seconds waited
+    So heavy users yield to light users, short jobs go before long ones, explicit
+    priority classes are honoured, and every request is eventually run however low
+    its priority is. The runtime term is capped under the gap between two classes,
+    a long job never falls behind a job of a lower class submitted at the same time.
+"""
+import time
+import threading
+
+
+def parse_weights(text):
+    """
+        Args:
+            text: "email:weight,email:weight", e.g. "a@intel.com:2,b@intel.com:0.5"
+        Returns:
+            dict of email -> share weight
+        Raises:
+            ValueError on a malformed entry or a weight which is not positive
+    """
+    weights = {}
+    for entry in text.split(','):
+        if not entry.strip():
+            continue
+        (email, separator, weight) = entry.rpartition(':')
+        email = email.strip()
+        if not separator or not email:
+            raise ValueError('share weight [%s] is not email:weight' % entry)
+        weights[email] = float(weight)
+        if weights[email] <= 0.0:
+            raise ValueError('share weight of %s must be positive' % email)
+    return weights
+
+
+class FairShareQueue(object):
+    """
+        Pending requests ordered by weighted fair share
+        Attributes:
+            class_offsets : priority class -> score offset, in GPU-seconds
+            half_life     : seconds for the consumed GPU-seconds to decay by half
+            aging_rate    : score credit per waited second
+            weights       : email -> share weight, default 1.0
+            sjf_weight    : score per second of expected runtime
+            sjf_limit     : maximum score of the expected runtime
+            runtime       : function(request) -> expected seconds, None to order without runtime
+    """
+    class_offsets = {'high': 0.0, 'normal': 3600.0, 'low': 7200.0}
+    default_class = 'normal'
+    half_life = 24 * 3600.0
+    aging_rate = 1.0
+    sjf_weight = 0.25
+    sjf_limit = 1800.0
+
+    def __init__(self, weights=None, runtime=None):
+        self.weights = weights if weights is not None else {}
+        self.runtime = runtime
+        self.requests = []
+        self.usage = {}
+        self.running = {}
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.requests)
+
+    def __iter__(self):
+        return iter(self.ordered())
+
+    def __contains__(self, request):
+        return request in self.requests
+
+    def append(self, request):
+        if request.get('priority') not in self.class_offsets:
+            request['priority'] = self.default_class
+        with self.lock:
+            self.requests.append(request)
+
+    def remove(self, request):
+        with self.lock:
+            self.requests.remove(request)
+
+    def decayed_usage(self, email, now):
+        (value, last_update) = self.usage.get(email, (0.0, now))
+        return value * 0.5 ** ((now - last_update) / self.half_life)
+
+    def get_usage(self, email, now=None):
+        """
+            Returns:
+                decayed GPU-seconds consumed by email, including the running requests
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            usage = self.decayed_usage(email, now)
+            for (running_email, start_time) in self.running.values():
+                if running_email == email:
+                    usage += now - start_time
+            return usage
+
+    def start(self, request, now=None):
+        """
+            account a request from the moment it starts running
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            self.running[request['request_id']] = (request['email'], now)
+
+    def finish(self, request, now=None):
+        """
+            charge the GPU-seconds of a finished request to its submitter
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            if request['request_id'] not in self.running:
+                return
+            (email, start_time) = self.running.pop(request['request_id'])
+            self.usage[email] = (self.decayed_usage(email, now) + now - start_time, now)
+
+    def score(self, request, now):
+        weight = self.weights.get(request['email'], 1.0)
+        expected_runtime = self.runtime(request) if self.runtime is not None else 0.0
+        return self.class_offsets[request['priority']] + \
+            self.get_usage(request['email'], now) / weight + \
+            min(self.sjf_weight * expected_runtime, self.sjf_limit) - \
+            self.aging_rate * (now - request['submit_time'])
+
+    def ordered(self, now=None):
+        """
+            Returns:
+                pending requests, the next one to run first
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            return sorted(self.requests, key=lambda request: (self.score(request, now), request['submit_time']))
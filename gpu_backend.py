@@ -0,0 +1,328 @@
+#!/usr/bin/env python
+"""
+    This file defines where the GPU telemetry and controls come from.
+        NvmlBackend      : NVML through pynvml, handles are cached per device
+        NvidiaSmiBackend : nvidia-smi command line, used when NVML is not available
+        FakeBackend      : in-process fake devices for hosts without GPU
+"""
+import os
+import re
+import sys
+import time
+from abc import ABCMeta, abstractmethod
+import farmer_log
+from gpu_telemetry import GPUSnapshot, QUERY_FIELDS, parse_query_output
+
+try:
+    import pynvml
+except ImportError:
+    pynvml = None
+
+
+def sudo_wrapper(command):
+    return "sudo " + command
+
+
+class GPUBackend(object):
+    """
+        GPUBackend BaseClass
+        Running processes are returned as (pid, command, sm_utilization, memory_utilization) tuples.
+    """
+    __metaclass__ = ABCMeta
+
+    name = None
+
+    @abstractmethod
+    def get_snapshots(self):
+        """
+            Returns:
+                dict of gpuid -> GPUSnapshot for every GPU
+        """
+        pass
+
+    @abstractmethod
+    def get_autoboost(self, gpuid):
+        pass
+
+    @abstractmethod
+    def set_autoboost(self, gpuid, mode):
+        pass
+
+    @abstractmethod
+    def set_frequency(self, gpuid, core_frequency, memory_frequency):
+        pass
+
+    @abstractmethod
+    def get_running_process(self, gpuid):
+        pass
+
+    @abstractmethod
+    def get_driver_version(self):
+        pass
+
+
+class NvidiaSmiBackend(GPUBackend):
+    name = 'nvidia-smi'
+
+    def query_command(self):
+        return "nvidia-smi --query-gpu=%s --format=csv,noheader,nounits" % (",".join(QUERY_FIELDS), )
+
+    def get_snapshots(self):
+        timestamp = time.time()
+        fp = os.popen(self.query_command())
+        snapshots = parse_query_output(fp.readlines(), timestamp)
+        fp.close()
+        return snapshots
+
+    def get_autoboost(self, gpuid):
+        command = "nvidia-smi -q -i %d | grep -i 'Auto Boost' | head -n 1 | awk '{print $NF}'" % (gpuid, )
+        fp = os.popen(command)
+        results = fp.read()
+        return True if "On" in results else False
+
+    def set_autoboost(self, gpuid, mode):
+        command = "nvidia-smi -i %d --auto-boost-default=%d" % (gpuid, mode)
+        os.system(sudo_wrapper(command))
+
+    def set_frequency(self, gpuid, core_frequency, memory_frequency):
+        command = "nvidia-smi -i %d -ac %d,%d" % (gpuid, memory_frequency, core_frequency)
+        os.system(sudo_wrapper(command))
+
+    def get_running_process(self, gpuid):
+        command = "nvidia-smi pmon -i %d --count 1 | grep -v '^#'" % (gpuid, )
+        fp = os.popen(sudo_wrapper(command))
+        processes = []
+        for line in fp:
+            line = line.strip()
+            info = re.split(' +', line)[0:8]
+            (gpu, pid, proces_type, sm, mem, enc, dec, command) = info
+            if pid == '-':
+                continue
+            processes.append((pid, command, sm, mem))
+        return processes
+
+    def get_driver_version(self):
+        fp = os.popen("nvidia-smi --query-gpu=driver_version --format=csv,noheader | head -n 1")
+        version = fp.read().strip()
+        fp.close()
+        return version
+
+
+class NvmlBackend(GPUBackend):
+    name = 'nvml'
+
+    def __init__(self):
+        if pynvml is None:
+            raise Exception('pynvml is not installed')
+        pynvml.nvmlInit()
+        self.handles = {}
+        for gpuid in range(pynvml.nvmlDeviceGetCount()):
+            self.handles[gpuid] = pynvml.nvmlDeviceGetHandleByIndex(gpuid)
+        self.names = {}
+        self.uuids = {}
+        for gpuid, handle in self.handles.items():
+            self.names[gpuid] = self.to_string(pynvml.nvmlDeviceGetName(handle))
+            self.uuids[gpuid] = self.to_string(pynvml.nvmlDeviceGetUUID(handle))
+
+    def __del__(self):
+        if pynvml is not None:
+            try:
+                pynvml.nvmlShutdown()
+            except Exception:
+                pass
+
+    @staticmethod
+    def to_string(value):
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+
+    @staticmethod
+    def call(function, *args):
+        """
+            Returns:
+                the result of one NVML call, None when the GPU doesn't support it
+        """
+        try:
+            return function(*args)
+        except pynvml.NVMLError:
+            return None
+
+    def get_clocks(self, handle, clock_type):
+        # same order as GPUDevice.graphics_mode
+        return [self.call(pynvml.nvmlDeviceGetClockInfo, handle, clock_type),
+                self.call(pynvml.nvmlDeviceGetApplicationsClock, handle, clock_type),
+                self.call(pynvml.nvmlDeviceGetDefaultApplicationsClock, handle, clock_type),
+                self.call(pynvml.nvmlDeviceGetMaxClockInfo, handle, clock_type)]
+
+    def get_snapshot(self, gpuid, timestamp):
+        handle = self.handles[gpuid]
+        utilization = self.call(pynvml.nvmlDeviceGetUtilizationRates, handle)
+        power = self.call(pynvml.nvmlDeviceGetPowerUsage, handle)
+        return GPUSnapshot(gpuid,
+                           self.uuids[gpuid],
+                           self.names[gpuid],
+                           self.get_clocks(handle, pynvml.NVML_CLOCK_GRAPHICS),
+                           self.get_clocks(handle, pynvml.NVML_CLOCK_MEM),
+                           None if utilization is None else 0.01 * utilization.gpu,
+                           None if utilization is None else 0.01 * utilization.memory,
+                           self.call(pynvml.nvmlDeviceGetTemperature, handle, pynvml.NVML_TEMPERATURE_GPU),
+                           None if power is None else 0.001 * power,
+                           timestamp)
+
+    def get_snapshots(self):
+        timestamp = time.time()
+        snapshots = {}
+        for gpuid in self.handles:
+            snapshots[gpuid] = self.get_snapshot(gpuid, timestamp)
+        return snapshots
+
+    def get_autoboost(self, gpuid):
+        result = self.call(pynvml.nvmlDeviceGetAutoBoostedClocksEnabled, self.handles[gpuid])
+        return False if result is None else bool(result[0])
+
+    def set_autoboost(self, gpuid, mode):
+        try:
+            pynvml.nvmlDeviceSetDefaultAutoBoostedClocksEnabled(self.handles[gpuid], mode, 0)
+        except pynvml.NVMLError as e:
+            farmer_log.error("set_autoboost on GPU %d error [%s]" % (gpuid, e))
+
+    def set_frequency(self, gpuid, core_frequency, memory_frequency):
+        try:
+            pynvml.nvmlDeviceSetApplicationsClocks(self.handles[gpuid], memory_frequency, core_frequency)
+        except pynvml.NVMLError as e:
+            farmer_log.error("set_frequency on GPU %d error [%s]" % (gpuid, e))
+
+    def get_running_process(self, gpuid):
+        handle = self.handles[gpuid]
+        utilization = {}
+        for sample in self.call(pynvml.nvmlDeviceGetProcessUtilization, handle, 0) or []:
+            utilization[sample.pid] = (sample.smUtil, sample.memUtil)
+        processes = []
+        for process in self.call(pynvml.nvmlDeviceGetComputeRunningProcesses, handle) or []:
+            command = self.call(pynvml.nvmlSystemGetProcessName, process.pid)
+            (sm, mem) = utilization.get(process.pid, ('-', '-'))
+            processes.append((str(process.pid), self.to_string(command), str(sm), str(mem)))
+        return processes
+
+    def get_driver_version(self):
+        return self.to_string(pynvml.nvmlSystemGetDriverVersion())
+
+
+class FakeGPU(object):
+    """
+        Scriptable fake GPU
+        Attributes:
+            core_frequency, memory_frequency, sm_utilization, memory_utilization,
+            temperature, power, autoboost and processes can be set directly.
+            script: optional function(fake_gpu, elapsed_seconds) called before every read,
+                    to replay a load pattern.
+    """
+
+    def __init__(self, gpuid, gpu_model='Tesla M40', core_frequency=(324, 948, 948, 1114),
+                 memory_frequency=(405, 3004, 3004, 3004)):
+        self.gpuid              = gpuid
+        self.gpu_uuid           = 'GPU-fake-%04d' % gpuid
+        self.gpu_model          = gpu_model
+        self.core_frequency     = list(core_frequency)
+        self.memory_frequency   = list(memory_frequency)
+        self.sm_utilization     = 0.0
+        self.memory_utilization = 0.0
+        self.temperature        = 30
+        self.power              = 15.0
+        self.autoboost          = True
+        self.processes          = []
+        self.script             = None
+        self.created_time       = time.time()
+
+    def snapshot(self, timestamp):
+        if self.script is not None:
+            self.script(self, timestamp - self.created_time)
+        return GPUSnapshot(self.gpuid, self.gpu_uuid, self.gpu_model,
+                           list(self.core_frequency), list(self.memory_frequency),
+                           self.sm_utilization, self.memory_utilization,
+                           self.temperature, self.power, timestamp)
+
+
+def square_wave_script(period=60.0, busy_ratio=0.5):
+    """
+        Returns:
+            a FakeGPU script switching between busy and idle every period seconds
+    """
+    def script(gpu, elapsed):
+        busy = (elapsed % period) < period * busy_ratio
+        gpu.sm_utilization     = 0.97 if busy else 0.0
+        gpu.memory_utilization = 0.61 if busy else 0.0
+        gpu.core_frequency[0]  = gpu.core_frequency[1] if busy else 324
+        gpu.memory_frequency[0] = gpu.memory_frequency[1] if busy else 405
+        gpu.temperature        = 64 if busy else 32
+        gpu.power              = 187.5 if busy else 16.9
+    return script
+
+
+class FakeBackend(GPUBackend):
+    name = 'fake'
+    driver_version = '0.00-fake'
+
+    def __init__(self, count=2, gpu_model='Tesla M40'):
+        self.gpus = {}
+        for gpuid in range(count):
+            self.add_gpu(FakeGPU(gpuid, gpu_model))
+
+    def add_gpu(self, gpu):
+        self.gpus[gpu.gpuid] = gpu
+        return gpu
+
+    def get_snapshots(self):
+        timestamp = time.time()
+        snapshots = {}
+        for gpuid, gpu in self.gpus.items():
+            snapshots[gpuid] = gpu.snapshot(timestamp)
+        return snapshots
+
+    def get_autoboost(self, gpuid):
+        return self.gpus[gpuid].autoboost
+
+    def set_autoboost(self, gpuid, mode):
+        self.gpus[gpuid].autoboost = bool(mode)
+
+    def set_frequency(self, gpuid, core_frequency, memory_frequency):
+        self.gpus[gpuid].core_frequency[1] = core_frequency
+        self.gpus[gpuid].memory_frequency[1] = memory_frequency
+
+    def get_running_process(self, gpuid):
+        return list(self.gpus[gpuid].processes)
+
+    def get_driver_version(self):
+        return self.driver_version
+
+
+def create_backend(name='auto'):
+    """
+        Args:
+            name: 'nvml', 'nvidia-smi', 'fake' or 'auto'.
+                  'auto' uses NVML when it can be loaded, otherwise nvidia-smi.
+        Returns:
+            GPUBackend
+    """
+    if name == 'nvml':
+        return NvmlBackend()
+    if name == 'nvidia-smi':
+        return NvidiaSmiBackend()
+    if name == 'fake':
+        return FakeBackend()
+    if name != 'auto':
+        raise Exception('Unknown GPU backend [%s]' % name)
+    try:
+        return NvmlBackend()
+    except Exception as e:
+        farmer_log.warning("NVML is not available [%s], use nvidia-smi instead." % e)
+        return NvidiaSmiBackend()
+
+
+if __name__ == "__main__":
+    backend = create_backend(sys.argv[1] if len(sys.argv) > 1 else 'fake')
+    rounds = 100
+    start = time.time()
+    for i in range(rounds):
+        snapshots = backend.get_snapshots()
+    elapsed = time.time() - start
+    print("%s backend: %d GPU(s), %.1f us per telemetry read" % (backend.name, len(snapshots), 1e6 * elapsed / rounds))
@@ -1,8 +1,21 @@
 #!/usr/bin/env python
-import re
-import os
 import json
+import time
+import threading
 from enum import Enum
+import farmer_log
+from gpu_telemetry import GPUTelemetryCollector, TelemetryRingBuffer
+from gpu_backend import create_backend
+
+
+def format_utilization(utilization):
+    """
+        Returns:
+            the utilization with 2 decimals, 'N/A' when the GPU doesn't report it
+    """
+    if utilization is None:
+        return 'N/A'
+    return "%.2f" % utilization
 
 
 class GPUProcess(object):
@@ -34,11 +47,14 @@ class GPUDevice(object):
     graphics_mode = Enum("INSTANT", "APPLICATION", "APPLICATION_DEFAULT", "MAX")
     sm_free_threshold = 0.03
     memory_free_threshold = 0.05
+    idle_window = 10.0
+    history_size = 3600
     
-    def __init__(self, hostname, gpuid):
+    def __init__(self, hostname, gpuid, collector=None):
         """
             Args:
                 GPUID: gpu device N.O. as gpuid
+                collector: GPUTelemetryCollector shared by the GPUs of one host
         """
         self.hostname = hostname 
         self.gpuid = gpuid
@@ -46,7 +62,15 @@ class GPUDevice(object):
         self.gpu_uuid = None
         self.processes = []
         self.blocked = False     
+        self.leased_request = None
+        self.released_time = 0.0
         self.listener = None
+        self.autoboost = None
+        self.collector = collector if collector is not None else GPUTelemetryCollector(create_backend())
+        self.backend = self.collector.backend
+        self.history = TelemetryRingBuffer(self.__class__.history_size)
+        self.series = []
+        self.status_json = None
         self.get_gpu_model()
         self.task_queues = []
         self.email = 'nobody'
@@ -58,26 +82,31 @@ class GPUDevice(object):
         """
         return "sudo " + command
  
+    def get_snapshot(self, refresh=False):
+        """
+            get the latest telemetry of this GPU
+            Args:
+                refresh: True to bypass the collector cache
+            Returns:
+                GPUSnapshot
+        """
+        snapshot = self.collector.get_snapshot(self.gpuid, refresh)
+        if snapshot is None:
+            raise Exception('No telemetry for GPU %d' % self.gpuid)
+        return snapshot
+
     def get_gpu_model(self):
         """
             get gpu model
             Returns:
                 GPU Model Name 
         """ 
-        command = "nvidia-smi -L"
-        comamnd = self.sudo_wrapper(command)
-        fp = os.popen(command)
-        for line in fp:
-            line = line.strip()
-            m = re.match("GPU(.*)\:(.*)\(UUID:(.*)\)", line)
-            gpuid = int(m.group(1))
-            gpu_model = m.group(2)
-            gpu_uuid = m.group(3)
-            if gpuid == self.gpuid:
-                self.gpu_model = gpu_model.strip()
-                self.gpu_uuid = gpu_uuid.strip()
-                return (self.gpu_model, self.gpu_uuid) 
-        return None
+        snapshot = self.collector.get_snapshot(self.gpuid)
+        if snapshot is None:
+            return None
+        self.gpu_model = snapshot.gpu_model
+        self.gpu_uuid = snapshot.gpu_uuid
+        return (self.gpu_model, self.gpu_uuid) 
     
     def get_email(self):
         return self.email
@@ -96,11 +125,7 @@ class GPUDevice(object):
                     e = Enum("INSTANT", "APPLICATION", "APPLICATION_DEFAULT", "MAX")
                     instance.get_memory_frequency(e.INSTANT) 
         """
-        command = "nvidia-smi -q -i %d -d CLOCK | grep -i Graphics | \
-                awk '{print $(NF-1)}'" % (self.gpuid, )
-        fp = os.popen(command)
-        freq = fp.readlines()[mode.index]
-        return int(freq)
+        return self.get_snapshot().core_frequency[mode.index]
 
     def get_memory_frequency(self, mode):
         """
@@ -113,11 +138,7 @@ class GPUDevice(object):
             Returns:
                 return memory frequency 
         """
-        command = "nvidia-smi -q -i %d -d CLOCK | grep -i Memory | \
-                awk '{print $(NF-1)}'" % (self.gpuid, )
-        fp = os.popen(command)
-        freq = fp.readlines()[mode.index]
-        return int(freq)
+        return self.get_snapshot().memory_frequency[mode.index]
 
     def set_persistant_mode(self, mode):
         """
@@ -141,24 +162,26 @@ class GPUDevice(object):
             Returns:
                 True when successfully setting the clocks  
         """
-        command = "nvidia-smi -i %d -ac %d,%d" % (self.gpuid, memory_frequency, core_frequency)
-        command = self.sudo_wrapper(command)
-        os.system(command)
-        application_core_freq = self.get_core_frequency(self.__class__.graphics_mode.APPLICATION)
-        application_memory_freq = self.get_memory_frequency(self.__class__.graphics_mode.APPLICATION)
+        self.backend.set_frequency(self.gpuid, core_frequency, memory_frequency)
+        snapshot = self.get_snapshot(refresh=True)
+        application_core_freq = snapshot.core_frequency[self.__class__.graphics_mode.APPLICATION.index]
+        application_memory_freq = snapshot.memory_frequency[self.__class__.graphics_mode.APPLICATION.index]
         return (application_core_freq == core_frequency) and (memory_frequency == application_memory_freq)
 
 
-    def get_autoboost(self):
+    def get_autoboost(self, refresh=False):
         """
             get autoboost Status
+            Autoboost is not a --query-gpu field, so it is read once and cached.
+            Args:
+                refresh: True to read it from the backend again
             Returns:
                 True if autoboost on else False        
         """
-        command = "nvidia-smi -q -i %d | grep -i 'Auto Boost' | head -n 1 | awk '{print $NF}'" % (self.gpuid, )
-        fp = os.popen(command)
-        results = fp.read()
-        return True if "On" in results else False
+        if self.autoboost is not None and not refresh:
+            return self.autoboost
+        self.autoboost = self.backend.get_autoboost(self.gpuid)
+        return self.autoboost
          
 
     def set_autoboost(self, mode):
@@ -169,10 +192,8 @@ class GPUDevice(object):
             Returns:
                 True when successfully setting the clocks  
         """
-        command = "nvidia-smi -i %d --auto-boost-default=%d" % (self.gpuid, mode)
-        command = self.sudo_wrapper(command)
-        os.system(command)
-        return True if self.get_autoboost() == mode else False
+        self.backend.set_autoboost(self.gpuid, mode)
+        return True if self.get_autoboost(refresh=True) == mode else False
         
 
     def get_utlization(self):
@@ -183,25 +204,14 @@ class GPUDevice(object):
             Returns:
                 True when successfully setting the clocks  
         """
-        core_command = "nvidia-smi -q -d utilization -i %d | grep Gpu | awk '{print $(NF-1)}'" % (self.gpuid, )
-        fp = os.popen(self.sudo_wrapper(core_command))
-        core_utilization = float(0.01 * int(fp.read()))
-        mem_command = "nvidia-smi -q -d utilization -i %d | grep Memory | grep -vi sam | awk '{print $(NF-1)}'" % (self.gpuid, )
-        fp = os.popen(self.sudo_wrapper(mem_command))
-        mem_utilization = float(0.01 * int(fp.read()))
-        return (core_utilization, mem_utilization)
+        snapshot = self.get_snapshot()
+        return (snapshot.sm_utilization, snapshot.memory_utilization)
 
     def get_sm_utilization(self):
-        core_command = "nvidia-smi -q -d utilization -i %d | grep Gpu | awk '{print $(NF-1)}'" % (self.gpuid, )
-        fp = os.popen(self.sudo_wrapper(core_command))
-        core_utilization = float(0.01 * int(fp.read()))
-        return core_utilization
+        return self.get_snapshot().sm_utilization
 
     def get_memory_utilization(self):
-        mem_command = "nvidia-smi -q -d utilization -i %d | grep Memory | grep -vi sam | awk '{print $(NF-1)}'" % (self.gpuid, )
-        fp = os.popen(self.sudo_wrapper(mem_command))
-        mem_utilization = float(0.01 * int(fp.read()))
-        return mem_utilization
+        return self.get_snapshot().memory_utilization
          
     def is_gpu_free(self):
         """
@@ -209,66 +219,137 @@ class GPUDevice(object):
             Returns:
                 True when GPU is free        
         """
-        (core_utilization, mem_utilization) = self.get_utlization()
-        if core_utilization < self.__class__.sm_free_threshold and \
-            mem_utilization < self.__class__.memory_free_threshold:
-            return True
+        return self.is_sample_free(self.get_snapshot())
+
+    def is_sample_free(self, snapshot):
+        return (snapshot.sm_utilization or 0.0) < self.__class__.sm_free_threshold and \
+            (snapshot.memory_utilization or 0.0) < self.__class__.memory_free_threshold
+
+    def is_gpu_idle(self, window=None):
+        """
+            judge whether GPU has been idle for a while
+            The GPU is idle when every sample of the last window seconds is under
+            the free thresholds and no process is running on it.
+            A full history shorter than the window stands for the whole window,
+            so a window longer than the history doesn't block every GPU.
+            When the sampler is not running, fall back to one instant sample.
+            Args:
+                window: seconds, default idle_window
+            Returns:
+                True when GPU is idle
+        """
+        window = self.__class__.idle_window if window is None else window
+        now = time.time()
+        latest = self.history.latest()
+        if latest is None or now - latest.timestamp > window:
+            if not self.is_gpu_free():
+                return False
         else:
-            return False
+            oldest = self.history.oldest()
+            if oldest.timestamp > now - window and len(self.history) < self.history.capacity:
+                return False
+            for snapshot in self.history.slice(now - window):
+                if not self.is_sample_free(snapshot):
+                    return False
+        return len(self.get_running_process()) == 0
 
     def get_running_process(self):
         """
             get information of GPU running process
         """
-        command = "nvidia-smi pmon -i %d --count 1 | grep -v '^#'" % (self.gpuid, )
-        fp = os.popen(self.sudo_wrapper(command))
         self.processes = []
-        for line in fp:
-            line = line.strip()
-            info = re.split(' +', line)[0:8]
-            (gpu, pid, proces_type, sm, mem, enc, dec, command) = info             
+        for (pid, command, sm, mem) in self.backend.get_running_process(self.gpuid):
             gp = GPUProcess()
             gp.set_info(pid, command, sm, mem)
             self.processes.append(gp)
         return self.processes 
   
     def get_gpu_temperature(self):
-        command = "nvidia-smi -i %d -q -d TEMPERATURE | grep 'Current Temp' | awk '{print $(NF-1)}'" % (self.gpuid, )
-        fp = os.popen(self.sudo_wrapper(command))
-        temperature = int(fp.read().strip())
-        return temperature
+        return self.get_snapshot().temperature
 
     def get_gpu_power(self):
-        command = "nvidia-smi -i %d -q -d POWER | grep -i 'draw' | awk '{print $(NF-1)}'" % (self.gpuid, )
-        fp = os.popen(self.sudo_wrapper(command))
-        power = float(fp.read().strip())
-        return power
+        return self.get_snapshot().power
 
 
-    def response_status_as_json(self, request):
+    def make_status(self, snapshot):
+        graphics_mode = self.__class__.graphics_mode
         status = {}
         status['gpu_model'] = self.gpu_model
-        status['instant_core_freq'] = self.get_core_frequency(self.__class__.graphics_mode.INSTANT)
-        status['instant_mem_freq'] = self.get_memory_frequency(self.__class__.graphics_mode.INSTANT)
-        status['application_core_freq'] = self.get_core_frequency(self.__class__.graphics_mode.APPLICATION)
-        status['application_mem_freq'] = self.get_memory_frequency(self.__class__.graphics_mode.APPLICATION)
+        status['instant_core_freq'] = snapshot.core_frequency[graphics_mode.INSTANT.index]
+        status['instant_mem_freq'] = snapshot.memory_frequency[graphics_mode.INSTANT.index]
+        status['application_core_freq'] = snapshot.core_frequency[graphics_mode.APPLICATION.index]
+        status['application_mem_freq'] = snapshot.memory_frequency[graphics_mode.APPLICATION.index]
         status['autoboost'] = 'On' if self.get_autoboost() else 'Off'
-        status['sm_utilization'] = "%.2f" % self.get_sm_utilization()
-        status['mem_utilization'] = "%.2f" % self.get_memory_utilization()
-        status['core_freq_ratio'] = int(100.0 * status['instant_core_freq'] / status['application_core_freq'])
-        status['temperature'] = self.get_gpu_temperature()
-        status['power'] = self.get_gpu_power()
-        if request is not None:
-            request['history_freq'].append(status['instant_core_freq'])
-            request['history_temperature'].append(status['temperature'])
-            request['history_power'].append(status['power'])
-        return json.dumps(status) 
-        
+        status['sm_utilization'] = format_utilization(snapshot.sm_utilization)
+        status['mem_utilization'] = format_utilization(snapshot.memory_utilization)
+        if status['instant_core_freq'] and status['application_core_freq']:
+            status['core_freq_ratio'] = int(100.0 * status['instant_core_freq'] / status['application_core_freq'])
+        else:
+            status['core_freq_ratio'] = 0
+        status['temperature'] = snapshot.temperature
+        status['power'] = snapshot.power
+        return status
+
+    def record(self, snapshot):
+        """
+            keep one sampled snapshot in the history and cache its json status
+        """
+        self.history.append(snapshot)
+        self.status_json = json.dumps(self.make_status(snapshot))
+        if self.series:
+            values = {}
+            values['freq'] = snapshot.core_frequency[self.__class__.graphics_mode.INSTANT.index]
+            values['temperature'] = snapshot.temperature
+            values['power'] = snapshot.power
+            for series in list(self.series):
+                series.append(snapshot.timestamp, values)
+
+    def attach_series(self, series):
+        """
+            record the following samples into a TelemetrySeries too
+        """
+        self.series.append(series)
+
+    def detach_series(self, series):
+        if series in self.series:
+            self.series.remove(series)
+
+    def get_history(self, start_time=None, end_time=None):
+        """
+            get the sampled telemetry in a time window
+            Returns:
+                dict of 'timestamp', 'freq', 'temperature', 'power' lists
+        """
+        snapshots = self.history.slice(start_time, end_time)
+        instant = self.__class__.graphics_mode.INSTANT.index
+        history = {}
+        history['timestamp'] = [snapshot.timestamp for snapshot in snapshots]
+        history['freq'] = [snapshot.core_frequency[instant] for snapshot in snapshots]
+        history['temperature'] = [snapshot.temperature for snapshot in snapshots]
+        history['power'] = [snapshot.power for snapshot in snapshots]
+        return history
+
+    def response_status_as_json(self):
+        """
+            Returns:
+                the status of the latest sample, nvidia-smi is only queried
+                when the sampler of GPUMonitor is not running
+        """
+        if self.status_json is not None:
+            return self.status_json
+        return json.dumps(self.make_status(self.get_snapshot()))
     
 
 class GPUMonitor(object):
+    """
+        Local GPU lists and their leases
+        allocation_policy:
+            'lru'         : lease the free GPU released the longest time ago
+            'temperature' : lease the coolest free GPU
+    """
+    allocation_policy = 'lru'
 
-    def __new__(cls):
+    def __new__(cls, *args, **kwargs):
         if not hasattr(cls, 'instance'):
             cls.instance = super(GPUMonitor, cls).__new__(cls)
         return cls.instance 
@@ -280,10 +361,21 @@ class GPUMonitor(object):
         """
         return "sudo " + command
 
-    def __init__(self):
+    def __init__(self, backend=None):
+        """
+            Args:
+                backend: GPUBackend of gpu_backend.py, default NVML or nvidia-smi
+        """
         self.gpulists = []
         self.gpu_models_set = set()
         self.gpu_uuid_set = set()
+        self.backend = backend if backend is not None else create_backend()
+        self.collector = GPUTelemetryCollector(self.backend)
+        self.sample_interval = 1.0
+        self.sampler = None
+        self.sampler_stopped = threading.Event()
+        self.sample_listeners = []
+        self.lease_lock = threading.Lock()
         
     def has_gpu(self, gpu):
         return gpu.gpu_uuid in self.gpu_uuid_set
@@ -295,21 +387,59 @@ class GPUMonitor(object):
                     return g 
         return None
 
+    def get_gpus_from_model(self, gpu_model):
+        return [g for g in self.gpulists if g.gpu_model == gpu_model]
+
+    def allocation_key(self, gpu):
+        if self.allocation_policy == 'temperature':
+            snapshot = gpu.history.latest()
+            temperature = snapshot.temperature if snapshot is not None else gpu.get_gpu_temperature()
+            return (temperature, gpu.released_time)
+        return (gpu.released_time, gpu.gpuid)
+
+    def lease_gpu(self, gpu_model, request_id, runnable=None):
+        """
+            lease one free GPU of the model
+            Args:
+                gpu_model: GPU model name
+                request_id: the request holding the lease
+                runnable: optional function(gpu) -> bool, e.g. the idle check
+            Returns:
+                the leased GPUDevice, or None when no GPU of the model is free
+        """
+        with self.lease_lock:
+            candidates = sorted([g for g in self.get_gpus_from_model(gpu_model) if not g.blocked],
+                                key=self.allocation_key)
+        # runnable may query the GPU, the releases don't wait for it
+        for g in candidates:
+            if runnable is not None and not runnable(g):
+                continue
+            with self.lease_lock:
+                if g.blocked:
+                    continue
+                g.blocked = True
+                g.leased_request = request_id
+                return g
+        return None
+
+    def release_gpu(self, gpu):
+        with self.lease_lock:
+            gpu.blocked = False
+            gpu.leased_request = None
+            gpu.released_time = time.time()
+
     def register_listener(self, listener):
         for g in self.gpulists:
             g.listener = listener
 
 
     def init_local_gpu_lists(self):
-        command = "nvidia-smi -L | awk -F':' '{print $1}' | awk -F' ' '{print $2}'"
-        command = self.sudo_wrapper(command)
-        fp = os.popen(command)
-        for gpu_id in fp:
-            gpu_id.strip()
-            self.add_gpu('127.0.0.1', int(gpu_id))
+        snapshots = self.collector.get_snapshots(refresh=True)
+        for gpu_id in sorted(snapshots.keys()):
+            self.add_gpu('127.0.0.1', gpu_id)
         
     def add_gpu(self, hostname, gpuid):
-        gpu = GPUDevice(hostname, gpuid)
+        gpu = GPUDevice(hostname, gpuid, self.collector)
         if self.has_gpu(gpu):
             pass
         else:
@@ -320,6 +450,63 @@ class GPUMonitor(object):
     def del_gpu(self, uuid):
         pass 
 
+    def start_sampler(self, interval=None, history_size=None):
+        """
+            start the thread sampling all GPUs every interval seconds
+            Args:
+                interval: seconds between two samples
+                history_size: number of samples kept for every GPU
+        """
+        if self.sampler is not None:
+            return
+        if interval is not None:
+            self.sample_interval = interval
+        if history_size is not None:
+            for g in self.gpulists:
+                g.history = TelemetryRingBuffer(history_size)
+        self.sampler_stopped.clear()
+        self.sampler = threading.Thread(target=self.sample_loop)
+        self.sampler.daemon = True
+        self.sampler.start()
+
+    def stop_sampler(self):
+        if self.sampler is None:
+            return
+        self.sampler_stopped.set()
+        self.sampler.join()
+        self.sampler = None
+
+    def add_sample_listener(self, listener):
+        """
+            Args:
+                listener: function() called from the sampler thread after every sample
+        """
+        self.sample_listeners.append(listener)
+
+    def sample(self):
+        snapshots = self.collector.get_snapshots(refresh=True)
+        for g in self.gpulists:
+            snapshot = snapshots.get(g.gpuid)
+            if snapshot is None:
+                continue
+            # one GPU with a bad sample must not stop the others
+            try:
+                g.record(snapshot)
+            except Exception as e:
+                farmer_log.error("GPU %d telemetry record error [%s]" % (g.gpuid, e))
+        for listener in list(self.sample_listeners):
+            listener()
+
+    def sample_loop(self):
+        deadline = time.time()
+        while not self.sampler_stopped.is_set():
+            try:
+                self.sample()
+            except Exception as e:
+                farmer_log.error("GPU telemetry sampling error [%s]" % e)
+            deadline = max(deadline + self.sample_interval, time.time())
+            self.sampler_stopped.wait(max(0.0, deadline - time.time()))
+
 
 if __name__ == '__main__':
     gpu = GPUDevice("127.0.0.1", 0)
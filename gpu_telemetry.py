@@ -0,0 +1,389 @@
+#!/usr/bin/env python
+"""
+    This file defines how to collect the GPU telemetry.
+    All fields of all GPUs are fetched by one backend query.
+"""
+import time
+import threading
+from array import array
+import farmer_log
+
+
+QUERY_FIELDS = (
+    "index",
+    "uuid",
+    "name",
+    "clocks.gr",
+    "clocks.applications.graphics",
+    "clocks.default_applications.graphics",
+    "clocks.max.graphics",
+    "clocks.mem",
+    "clocks.applications.memory",
+    "clocks.default_applications.memory",
+    "clocks.max.memory",
+    "utilization.gpu",
+    "utilization.memory",
+    "temperature.gpu",
+    "power.draw",
+)
+
+UNAVAILABLE_VALUES = ("", "N/A", "[N/A]", "[Not Supported]", "[Unknown Error]")
+
+
+def to_int(value):
+    if value in UNAVAILABLE_VALUES:
+        return None
+    return int(float(value))
+
+def to_float(value):
+    if value in UNAVAILABLE_VALUES:
+        return None
+    return float(value)
+
+def to_ratio(value):
+    percent = to_float(value)
+    return None if percent is None else 0.01 * percent
+
+
+class GPUSnapshot(object):
+    """
+        Telemetry of one GPU at one moment
+        Attributes:
+            gpuid               : int
+            gpu_uuid            : string
+            gpu_model           : string
+            core_frequency      : list of int MHz, indexed as GPUDevice.graphics_mode
+                                  (INSTANT, APPLICATION, APPLICATION_DEFAULT, MAX)
+            memory_frequency    : list of int MHz, same index as core_frequency
+            sm_utilization      : float in [0, 1]
+            memory_utilization  : float in [0, 1]
+            temperature         : int, degree C
+            power               : float, W
+            timestamp           : float, seconds since epoch
+    """
+
+    def __init__(self, gpuid, gpu_uuid, gpu_model, core_frequency, memory_frequency,
+                 sm_utilization, memory_utilization, temperature, power, timestamp):
+        self.gpuid              = gpuid
+        self.gpu_uuid           = gpu_uuid
+        self.gpu_model          = gpu_model
+        self.core_frequency     = core_frequency
+        self.memory_frequency   = memory_frequency
+        self.sm_utilization     = sm_utilization
+        self.memory_utilization = memory_utilization
+        self.temperature        = temperature
+        self.power              = power
+        self.timestamp          = timestamp
+
+    @classmethod
+    def from_csv_line(cls, line, timestamp):
+        """
+            Args:
+                line: one line of "nvidia-smi --query-gpu=QUERY_FIELDS --format=csv,noheader,nounits"
+                timestamp: the time when the query was run
+            Returns:
+                GPUSnapshot, or None when the line can't be parsed
+        """
+        fields = [field.strip() for field in line.strip().split(',')]
+        if len(fields) != len(QUERY_FIELDS):
+            farmer_log.error("Unexpected nvidia-smi query line [%s]" % line.strip())
+            return None
+        values = dict(zip(QUERY_FIELDS, fields))
+        return cls(int(values["index"]),
+                   values["uuid"],
+                   values["name"],
+                   [to_int(values["clocks.gr"]),
+                    to_int(values["clocks.applications.graphics"]),
+                    to_int(values["clocks.default_applications.graphics"]),
+                    to_int(values["clocks.max.graphics"])],
+                   [to_int(values["clocks.mem"]),
+                    to_int(values["clocks.applications.memory"]),
+                    to_int(values["clocks.default_applications.memory"]),
+                    to_int(values["clocks.max.memory"])],
+                   to_ratio(values["utilization.gpu"]),
+                   to_ratio(values["utilization.memory"]),
+                   to_int(values["temperature.gpu"]),
+                   to_float(values["power.draw"]),
+                   timestamp)
+
+
+def parse_query_output(lines, timestamp=None):
+    """
+        Parse the output of the batched nvidia-smi query
+        Args:
+            lines: iterable of csv lines without header and units
+            timestamp: the time when the query was run, default now
+        Returns:
+            dict of gpuid -> GPUSnapshot
+    """
+    timestamp = time.time() if timestamp is None else timestamp
+    snapshots = {}
+    for line in lines:
+        if not line.strip():
+            continue
+        snapshot = GPUSnapshot.from_csv_line(line, timestamp)
+        if snapshot is not None:
+            snapshots[snapshot.gpuid] = snapshot
+    return snapshots
+
+
+class GPUTelemetryCollector(object):
+    """
+        Run one backend query for all GPUs and share the result.
+        A result younger than max_age seconds is reused, so the get_* methods
+        of every GPUDevice are served by the same query.
+    """
+    max_age = 1.0
+
+    def __init__(self, backend, max_age=None):
+        """
+            Args:
+                backend: GPUBackend of gpu_backend.py
+                max_age: seconds a query result is reused
+        """
+        if max_age is not None:
+            self.max_age = max_age
+        self.backend = backend
+        self.lock = threading.Lock()
+        self.snapshots = {}
+        self.timestamp = 0.0
+
+    def get_snapshots(self, refresh=False):
+        with self.lock:
+            if refresh or time.time() - self.timestamp > self.max_age:
+                self.snapshots = self.backend.get_snapshots()
+                self.timestamp = time.time()
+            return self.snapshots
+
+    def get_snapshot(self, gpuid, refresh=False):
+        return self.get_snapshots(refresh).get(gpuid)
+
+
+class TelemetryRingBuffer(object):
+    """
+        Fixed size history of GPUSnapshot, oldest entries are overwritten.
+        Snapshots are appended in time order, so a time window is found by bisection.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.items = [None] * capacity
+        self.head = 0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.count
+
+    def append(self, snapshot):
+        with self.lock:
+            self.items[self.head] = snapshot
+            self.head = (self.head + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+
+    def latest(self):
+        with self.lock:
+            if self.count == 0:
+                return None
+            return self.items[(self.head - 1) % self.capacity]
+
+    def oldest(self):
+        with self.lock:
+            if self.count == 0:
+                return None
+            return self.items[(self.head - self.count) % self.capacity]
+
+    def _item(self, first, index):
+        return self.items[(first + index) % self.capacity]
+
+    def _bisect(self, first, timestamp, right=False):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            current = self._item(first, middle).timestamp
+            if current < timestamp or (right and current == timestamp):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def slice(self, start_time=None, end_time=None):
+        """
+            Args:
+                start_time: oldest timestamp to return, None for the oldest kept
+                end_time: newest timestamp to return, None for the latest
+            Returns:
+                list of GPUSnapshot in [start_time, end_time], oldest first
+        """
+        with self.lock:
+            first = (self.head - self.count) % self.capacity
+            begin = 0 if start_time is None else self._bisect(first, start_time)
+            end = self.count if end_time is None else self._bisect(first, end_time, right=True)
+            return [self._item(first, index) for index in range(begin, end)]
+
+
+class TelemetrySeries(object):
+    """
+        Telemetry time series of one request with a hard memory cap.
+        Every stored point is a bucket holding the count of the samples it covers
+        and, for every channel, the count, min, max and sum of their valid values. When all points are used, neighbouring buckets
+        are merged in pairs and new buckets cover twice as many samples,
+        so the memory stays the same however long the request runs.
+        When the request finishes, trim releases the buckets it didn't use.
+        Unsupported values (None or NaN) are left out of the channel, a bucket
+        without any valid value reads as None.
+    """
+    channels = ('freq', 'temperature', 'power')
+    capacity = 720
+
+    def __init__(self, capacity=None):
+        if capacity is not None:
+            self.capacity = capacity + capacity % 2
+        self.size = 0
+        self.bucket_samples = 1
+        self.timestamps = array('d', [0.0]) * self.capacity
+        self.counts = array('l', [0]) * self.capacity
+        self.minimums = {}
+        self.maximums = {}
+        self.sums = {}
+        self.valids = {}
+        for channel in self.channels:
+            self.minimums[channel] = array('f', [0.0]) * self.capacity
+            self.maximums[channel] = array('f', [0.0]) * self.capacity
+            self.sums[channel] = array('d', [0.0]) * self.capacity
+            self.valids[channel] = array('l', [0]) * self.capacity
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.size
+
+    def append(self, timestamp, values):
+        """
+            Args:
+                timestamp: seconds since epoch, not older than the last appended one
+                values: dict of channel -> number or None
+        """
+        with self.lock:
+            if self.size == 0 or self.counts[self.size - 1] >= self.bucket_samples:
+                if self.size == self.capacity:
+                    self.compact()
+                index = self.size
+                self.size += 1
+                self.timestamps[index] = timestamp
+                self.counts[index] = 0
+                for channel in self.channels:
+                    self.sums[channel][index] = 0.0
+                    self.valids[channel][index] = 0
+            index = self.size - 1
+            for channel in self.channels:
+                value = values.get(channel)
+                if value is None or value != value:
+                    continue
+                value = float(value)
+                if self.valids[channel][index] == 0:
+                    self.minimums[channel][index] = value
+                    self.maximums[channel][index] = value
+                else:
+                    self.minimums[channel][index] = min(self.minimums[channel][index], value)
+                    self.maximums[channel][index] = max(self.maximums[channel][index], value)
+                self.sums[channel][index] += value
+                self.valids[channel][index] += 1
+            self.counts[index] += 1
+
+    def merge(self, target, source):
+        self.counts[target] += self.counts[source]
+        for channel in self.channels:
+            if self.valids[channel][source] == 0:
+                continue
+            if self.valids[channel][target] == 0:
+                self.minimums[channel][target] = self.minimums[channel][source]
+                self.maximums[channel][target] = self.maximums[channel][source]
+            else:
+                self.minimums[channel][target] = min(self.minimums[channel][target], self.minimums[channel][source])
+                self.maximums[channel][target] = max(self.maximums[channel][target], self.maximums[channel][source])
+            self.sums[channel][target] += self.sums[channel][source]
+            self.valids[channel][target] += self.valids[channel][source]
+
+    def move(self, target, source):
+        self.timestamps[target] = self.timestamps[source]
+        self.counts[target] = self.counts[source]
+        for channel in self.channels:
+            self.minimums[channel][target] = self.minimums[channel][source]
+            self.maximums[channel][target] = self.maximums[channel][source]
+            self.sums[channel][target] = self.sums[channel][source]
+            self.valids[channel][target] = self.valids[channel][source]
+
+    def compact(self):
+        """
+            merge the buckets in pairs, the caller holds the lock
+        """
+        for index in range(0, self.size, 2):
+            self.move(index // 2, index)
+            if index + 1 < self.size:
+                self.merge(index // 2, index + 1)
+        self.size = (self.size + 1) // 2
+        self.bucket_samples *= 2
+
+    def trim(self, max_points):
+        """
+            merge the buckets until at most max_points are left and release the
+            memory of the unused ones, nothing may be appended afterwards
+        """
+        with self.lock:
+            while self.size > max_points:
+                self.compact()
+            self.capacity = self.size
+            self.timestamps = self.timestamps[:self.size]
+            self.counts = self.counts[:self.size]
+            for channel in self.channels:
+                self.minimums[channel] = self.minimums[channel][:self.size]
+                self.maximums[channel] = self.maximums[channel][:self.size]
+                self.sums[channel] = self.sums[channel][:self.size]
+                self.valids[channel] = self.valids[channel][:self.size]
+
+    @classmethod
+    def empty_range(cls):
+        """
+            Returns:
+                the result of get_range on a series without any point
+        """
+        result = {'timestamp': []}
+        for channel in cls.channels:
+            result[channel] = []
+            result[channel + '_min'] = []
+            result[channel + '_max'] = []
+        return result
+
+    def get_range(self, start_time=None, end_time=None, resolution=None):
+        """
+            Args:
+                start_time: oldest bucket timestamp to return, None for the first
+                end_time: newest bucket timestamp to return, None for the last
+                resolution: maximum number of points to return, None for all stored points
+            Returns:
+                dict of 'timestamp' and, for every channel, the average, '<channel>_min'
+                and '<channel>_max' lists
+        """
+        with self.lock:
+            indexes = [index for index in range(self.size)
+                       if (start_time is None or self.timestamps[index] >= start_time) and
+                          (end_time is None or self.timestamps[index] <= end_time)]
+            step = 1
+            if resolution is not None and len(indexes) > resolution:
+                step = (len(indexes) + resolution - 1) // resolution
+            result = self.empty_range()
+            for begin in range(0, len(indexes), step):
+                group = indexes[begin:begin + step]
+                result['timestamp'].append(self.timestamps[group[0]])
+                for channel in self.channels:
+                    valid = [index for index in group if self.valids[channel][index] > 0]
+                    if not valid:
+                        result[channel].append(None)
+                        result[channel + '_min'].append(None)
+                        result[channel + '_max'].append(None)
+                        continue
+                    count = sum(self.valids[channel][index] for index in valid)
+                    result[channel].append(sum(self.sums[channel][index] for index in valid) / count)
+                    result[channel + '_min'].append(min(self.minimums[channel][index] for index in valid))
+                    result[channel + '_max'].append(max(self.maximums[channel][index] for index in valid))
+            return result
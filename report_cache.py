@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+    This file defines the in-process cache of the finished request reports.
+    The result rows of a request are written once, when it finishes, so its
+    results and the report files rendered from them are kept by request id and
+    served without MySQL until new rows are written for that request.
+    The least recently used requests are dropped beyond max_entries.
+"""
+import threading
+from collections import OrderedDict
+
+
+class ReportCache(object):
+    """
+        LRU cache of request id -> results and rendered artifacts
+        Attributes:
+            max_entries: requests kept, 0 to disable the cache
+    """
+    max_entries = 256
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries if max_entries is not None else self.__class__.max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, request_id):
+        return request_id in self.entries
+
+    def get_entry(self, request_id):
+        entry = self.entries.pop(request_id, None)
+        if entry is not None:
+            self.entries[request_id] = entry
+        return entry
+
+    def get(self, request_id):
+        """
+            Returns:
+                the cached results of request_id, None if they are not cached
+                the results are shared, callers must not modify them
+        """
+        with self.lock:
+            entry = self.get_entry(request_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry['results']
+
+    def put(self, request_id, results):
+        with self.lock:
+            if self.max_entries <= 0:
+                return
+            self.entries.pop(request_id, None)
+            self.entries[request_id] = {'results': results, 'artifacts': {}}
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get_artifact(self, request_id, name):
+        """
+            Returns:
+                the artifact rendered from the cached results of request_id, None if there is none
+        """
+        with self.lock:
+            entry = self.get_entry(request_id)
+            if entry is None:
+                return None
+            return entry['artifacts'].get(name)
+
+    def put_artifact(self, request_id, name, artifact, results):
+        """
+            keep an artifact rendered from results, dropped with them
+            Args:
+                results: the results the artifact is rendered from, it is not kept
+                         if they are not the cached ones any more
+        """
+        with self.lock:
+            entry = self.entries.get(request_id)
+            if entry is not None and entry['results'] is results:
+                entry['artifacts'][name] = artifact
+
+    def invalidate(self, request_id):
+        with self.lock:
+            self.entries.pop(request_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def get_metrics(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'max_entries': self.max_entries,
+                    'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+"""
+    This file defines the export of the request results to files.
+    The results of a finished request never change, so each export is rendered
+    once per format into <directory>/<digest>.<format>, where digest hashes the
+    exported rows: the same results are never rendered twice, and the digest is
+    the ETag of the file. Several requests are exported into one file one
+    request at a time, so only the results of one request are in memory.
+"""
+import os
+import csv
+import hashlib
+import tempfile
+import pandas
+import farmer_log
+
+
+class ReportExporter(object):
+    """
+        Content-addressed cache of the exported reports
+        Attributes:
+            FORMATS   : format -> file extension
+            directory : where the exported files are written
+    """
+    FORMATS = {'csv': 'csv', 'xlsx': 'xlsx', 'parquet': 'parquet'}
+    directory = 'reports'
+
+    def __init__(self, sql_wrapper, directory=None):
+        self.sql_wrapper = sql_wrapper
+        self.directory = directory if directory is not None else self.__class__.directory
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+    def get_results(self, request_id):
+        results = self.sql_wrapper.get_result_by_request_id(request_id)
+        if len(results) == 0:
+            raise LookupError("request %s has no results" % request_id)
+        return results
+
+    def get_digest(self, request_id, results):
+        """
+            Returns:
+                hash of the results of request_id, kept with them in the report cache
+        """
+        report_cache = self.sql_wrapper.report_cache
+        digest = report_cache.get_artifact(request_id, 'digest')
+        if digest is None:
+            digest = hashlib.sha1(repr((results.header, results.columns))).hexdigest()
+            report_cache.put_artifact(request_id, 'digest', digest, results)
+        return digest
+
+    def export(self, request_ids, export_format):
+        """
+            Args:
+                request_ids: finished requests, exported in this order into one file
+                export_format: one of FORMATS
+            Returns:
+                path of the exported file, its name is <digest>.<extension>
+        """
+        if export_format not in self.FORMATS:
+            raise ValueError("unknown export format [%s]" % export_format)
+        if not request_ids:
+            raise LookupError("no request to export")
+        digests = [self.get_digest(request_id, self.get_results(request_id)) for request_id in request_ids]
+        digest = digests[0] if len(digests) == 1 else hashlib.sha1(' '.join(digests)).hexdigest()
+        path = os.path.join(self.directory, "%s.%s" % (digest, self.FORMATS[export_format]))
+        if os.path.exists(path):
+            return path
+        (fd, tmp_path) = tempfile.mkstemp(suffix='.' + self.FORMATS[export_format], dir=self.directory)
+        os.close(fd)
+        try:
+            getattr(self, 'write_' + export_format)(tmp_path, request_ids)
+            os.rename(tmp_path, path)
+        except:
+            os.remove(tmp_path)
+            raise
+        farmer_log.info("exported %s to %s" % (", ".join(request_ids), path))
+        return path
+
+    def write_csv(self, path, request_ids):
+        with open(path, 'wb') as fp:
+            writer = csv.writer(fp)
+            for (index, request_id) in enumerate(request_ids):
+                results = self.get_results(request_id)
+                if index == 0:
+                    writer.writerow(results.header)
+                for row in results:
+                    writer.writerow([value.encode('utf-8') if isinstance(value, unicode) else value for value in row])
+
+    def get_data_frame(self, results):
+        return pandas.DataFrame(results.to_data_frame(), columns=results.header)
+
+    def write_xlsx(self, path, request_ids):
+        writer = pandas.ExcelWriter(path)
+        try:
+            start_row = 0
+            for request_id in request_ids:
+                results = self.get_results(request_id)
+                self.get_data_frame(results).to_excel(writer, index=False, header=(start_row == 0),
+                                                      startrow=start_row)
+                start_row += len(results) + (1 if start_row == 0 else 0)
+        finally:
+            writer.close()
+
+    def write_parquet(self, path, request_ids):
+        # optional, only the parquet export needs pyarrow
+        import pyarrow
+        import pyarrow.parquet
+        writer = None
+        try:
+            for request_id in request_ids:
+                table = pyarrow.Table.from_pandas(self.get_data_frame(self.get_results(request_id)),
+                                                  preserve_index=False)
+                if writer is None:
+                    writer = pyarrow.parquet.ParquetWriter(path, table.schema)
+                # one row group per request
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""
+    This file defines the durable journal of the requests.
+    Every state change of a request is appended as one JSON line and fsync'd,
+    so the scheduler can rebuild its requests after the server restarts.
+"""
+import os
+import json
+import threading
+from collections import OrderedDict
+import farmer_log
+
+
+class RequestJournal(object):
+    """
+        Append-only request journal
+        Attributes:
+            FIELDS: request keys saved in every record
+    """
+    FIELDS = ('request_id', 'xml_path', 'submit_time', 'start_time', 'finish_time', 'gpu_id')
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.fp   = None
+        # records appended since the last compaction
+        self.appended = 0
+
+    def make_record(self, request):
+        record = {}
+        for key in self.__class__.FIELDS:
+            record[key] = request.get(key)
+        record['state'] = str(request['state'])
+        return record
+
+    def sync(self, fp):
+        fp.flush()
+        os.fsync(fp.fileno())
+
+    def record(self, request):
+        """
+            append the current state of a request, it is on disk when this returns
+        """
+        with self.lock:
+            if self.fp is None:
+                self.fp = open(self.path, 'a')
+            self.fp.write(json.dumps(self.make_record(request)) + '\n')
+            self.sync(self.fp)
+            self.appended += 1
+
+    def replay(self):
+        """
+            Returns:
+                OrderedDict of request_id -> last record, in submit order
+        """
+        records = OrderedDict()
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path) as fp:
+            for (number, line) in enumerate(fp):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # the server stopped in the middle of a write
+                    farmer_log.warning("skip broken journal line %d of %s" % (number + 1, self.path))
+                    continue
+                records[record['request_id']] = record
+        return records
+
+    def compact(self, requests):
+        """
+            rewrite the journal with one record per request
+            A request journaled while this runs is lost unless it is in requests,
+            the caller keeps new requests out until it returns.
+        """
+        with self.lock:
+            if self.fp is not None:
+                self.fp.close()
+                self.fp = None
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as fp:
+                for request in requests:
+                    fp.write(json.dumps(self.make_record(request)) + '\n')
+                self.sync(fp)
+            os.rename(tmp_path, self.path)
+            self.appended = 0
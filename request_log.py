@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""
+    This file defines where the raw output of a request goes.
+    The output is written to log/<request_id>.log as it comes. Only a bounded tail
+    is kept in memory for the live view while the request runs, older output and
+    the output of finished requests is read back from the file with mmap.
+"""
+import os
+import mmap
+import threading
+
+
+class RequestLog(object):
+    """
+        Raw output of one request
+        Attributes:
+            tail_size : bytes of the latest output kept in memory while the request runs
+            directory : where the log files are written
+    """
+    tail_size = 64 * 1024
+    directory = 'log'
+
+    def __init__(self, request_id, directory=None):
+        directory = directory if directory is not None else self.__class__.directory
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.path = os.path.join(directory, "%s.log" % request_id)
+        self.size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        self.tail = bytearray()
+        self.fp   = None
+        self.lock = threading.Lock()
+        self.closed    = False
+        self.listeners = []
+
+    def __len__(self):
+        return self.size
+
+    def add_listener(self, listener):
+        """
+            Args:
+                listener: function() called from the writing thread when output is
+                          appended and when the log is closed
+        """
+        self.listeners.append(listener)
+
+    def notify(self):
+        for listener in list(self.listeners):
+            listener()
+
+    def extend(self, data):
+        """
+            append output, same as bytearray.extend for the workloads
+        """
+        if not data:
+            return
+        with self.lock:
+            if self.fp is None:
+                self.fp = open(self.path, 'ab')
+            self.fp.write(data)
+            self.fp.flush()
+            self.size += len(data)
+            if self.tail is not None:
+                self.tail.extend(data)
+                # trim by chunks, not on every line
+                if len(self.tail) > 2 * self.tail_size:
+                    del self.tail[:len(self.tail) - self.tail_size]
+        self.notify()
+
+    def close(self):
+        """
+            the request is finished, keep nothing of it in memory
+        """
+        with self.lock:
+            if self.fp is not None:
+                self.fp.close()
+                self.fp = None
+            self.tail = None
+            self.closed = True
+        self.notify()
+        del self.listeners[:]
+
+    def read(self, offset=0, length=None):
+        """
+            Args:
+                offset: first byte to read
+                length: bytes to read, None to read to the end
+            Returns:
+                bytes of the output
+        """
+        with self.lock:
+            end = self.size if length is None else min(self.size, offset + length)
+            if offset >= end:
+                return b''
+            if self.tail is not None and offset >= self.size - len(self.tail):
+                start = offset - (self.size - len(self.tail))
+                return bytes(self.tail[start:start + end - offset])
+        with open(self.path, 'rb') as fp:
+            mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                return mapped[offset:end]
+            finally:
+                mapped.close()
+
+    def get_tail(self, length=None):
+        """
+            Returns:
+                the latest length bytes of the output, default tail_size
+        """
+        length = self.tail_size if length is None else length
+        return self.read(max(0, self.size - length))
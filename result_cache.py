@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""
+    This file defines the memoization of benchmark results.
+    One benchmark configuration is keyed by a hash of everything deciding its result:
+    GPU model, docker image id, driver version, framework, source, topology,
+    batch size, iterations and profiling. A request reuses the result_reports rows
+    of the configurations measured within max_age and only runs the others.
+    Profiling requests always run: their profile, log/<request id>.zip, is not cached.
+"""
+import json
+import hashlib
+from workload import Workload
+
+
+def config_hash(gpu_model, image_id, driver_version, framework, source, topology, batch_size, iterations, profiling):
+    config = [gpu_model, image_id, driver_version, framework.lower(), source,
+              topology, int(batch_size), int(iterations), bool(profiling)]
+    return hashlib.sha1(json.dumps(config).encode('utf-8')).hexdigest()
+
+
+class ResultCache(object):
+    """
+        Benchmark result cache on top of result_reports
+        Attributes:
+            max_age: seconds a measured result is reused, 0 to always rerun
+    """
+    max_age = 7 * 24 * 3600.0
+
+    RESULT_KEYS = ('framework', 'topology', 'batch_size', 'source', 'iterations',
+                   'score', 'training_images_per_second', 'duration')
+
+    def __init__(self, sql_wrapper):
+        self.sql_wrapper = sql_wrapper
+
+    def get_configs(self, request, image_id, driver_version):
+        """
+            Returns:
+                list of (topology, batch_size, config hash) the request measures
+        """
+        configs = []
+        for topology in request['topology']:
+            for batch_size in Workload.get_batch_sizes(topology, request['batch_size']):
+                key = config_hash(request['gpu_model'], image_id, driver_version, request['framework'],
+                                  request['source'], topology, batch_size, request['iterations'],
+                                  request['profiling'])
+                configs.append((topology, batch_size, key))
+        return configs
+
+    def lookup(self, request, configs):
+        """
+            Returns:
+                dict of (topology, batch_size) -> stored result of the configurations
+                measured within max_age, empty when the request forces a rerun
+                or profiles its run
+        """
+        cached = {}
+        if self.max_age <= 0 or request.get('force_rerun') or request.get('profiling'):
+            return cached
+        for (topology, batch_size, key) in configs:
+            rows = self.sql_wrapper.get_cached_result(key, self.max_age)
+            if len(rows) == 0:
+                continue
+            cached[(topology, batch_size)] = dict(zip(self.RESULT_KEYS, rows[0]))
+        return cached
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""
+    This file defines how long a request is expected to run.
+    Every benchmark configuration (GPU model, framework, topology, batch size,
+    iterations) of a request is predicted from its nearest matches in result_reports,
+    scaled by the iteration and batch size ratios.
+"""
+import math
+import threading
+from workload import Workload
+
+
+class RuntimeEstimator(object):
+    """
+        Nearest match runtime estimator
+        Attributes:
+            neighbours      : number of historical runs averaged for one configuration
+            setup_overhead  : seconds added to every request for the container start
+            max_samples     : history kept in memory
+    """
+    neighbours = 3
+    setup_overhead = 30.0
+    max_samples = 5000
+
+    def __init__(self):
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def load(self, sql_wrapper):
+        """
+            load the runs recorded in result_reports
+        """
+        history = sql_wrapper.get_runtime_history(self.max_samples)
+        for row in history:
+            (gpu_model, framework, topology, batch_size, iteration, duration) = row
+            self.add_sample(gpu_model, framework, topology, batch_size, iteration, duration)
+
+    def add_sample(self, gpu_model, framework, topology, batch_size, iteration, duration):
+        if duration <= 0 or batch_size <= 0 or iteration <= 0:
+            return
+        key = (gpu_model, framework.lower(), topology)
+        with self.lock:
+            samples = self.samples.setdefault(key, [])
+            samples.append((int(batch_size), int(iteration), float(duration)))
+            if len(samples) > self.max_samples:
+                del samples[0]
+
+    def add_results(self, gpu_model, results):
+        """
+            learn from the results of a finished request
+        """
+        for result in results:
+            self.add_sample(gpu_model, result['framework'], result['topology'],
+                            result['batch_size'], result['iterations'], result.get('duration', 0))
+
+    def predict_config(self, gpu_model, framework, topology, batch_size, iteration):
+        """
+            Returns:
+                expected seconds of one configuration, None without history
+        """
+        with self.lock:
+            samples = self.samples.get((gpu_model, framework.lower(), topology))
+            if not samples:
+                return None
+            distance = lambda sample: abs(math.log(float(sample[0]) / batch_size)) + \
+                                      abs(math.log(float(sample[1]) / iteration))
+            nearest = sorted(samples, key=distance)[:self.neighbours]
+        scaled = [duration * float(iteration) / sample_iteration * float(batch_size) / sample_batch_size
+                  for (sample_batch_size, sample_iteration, duration) in nearest]
+        return sum(scaled) / len(scaled)
+
+    def predict(self, request):
+        """
+            Returns:
+                expected seconds of a parsed request, None when one of its
+                configurations has no history
+        """
+        total = self.setup_overhead
+        for topology in request['topology']:
+            for batch_size in Workload.get_batch_sizes(topology, request['batch_size']):
+                expected = self.predict_config(request['gpu_model'], request['framework'],
+                                               topology, batch_size, request['iterations'])
+                if expected is None:
+                    return None
+                total += expected
+        return total
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""
+    This file defines the versioned upgrades of the database schema.
+    SQL_wrapper.init_database creates the tables of the version its backend starts
+    from (0 for MySQL), then every migration newer than the version recorded in
+    schema_version is applied in order.
+    A step is a SQL statement or a function(sql_wrapper, cursor), and must be safe
+    to run again: MySQL commits every DDL statement, so a migration interrupted
+    half way is applied again from its first step.
+"""
+import farmer_log
+
+
+def add_column(table, column, definition):
+    def step(sql_wrapper, cursor):
+        sql_wrapper.add_column_if_missing(table, column, definition, cursor)
+    return step
+
+
+def add_index(table, index, columns):
+    def step(sql_wrapper, cursor):
+        sql_wrapper.add_index_if_missing(table, index, columns, cursor)
+    return step
+
+
+MIGRATIONS = [
+    (1, "result_reports runtime and result cache columns", [
+        add_column("result_reports", "DURATION", "DOUBLE NOT NULL DEFAULT 0"),
+        add_column("result_reports", "CONFIG_HASH", "VARCHAR(40) NOT NULL DEFAULT ''"),
+        add_column("result_reports", "CACHED", "BOOL NOT NULL DEFAULT 0"),
+        add_column("result_reports", "REPORT_TIME", "DATETIME NOT NULL DEFAULT NOW()"),
+    ]),
+    # VARCHAR(500) keys are too long to be indexed
+    (2, "size the key columns, numeric request batch size and iteration", [
+        """ALTER TABLE accounts
+        MODIFY USER                 VARCHAR(255) NOT NULL,
+        MODIFY PASSWORD             VARCHAR(64)  NOT NULL,
+        MODIFY MAIL                 VARCHAR(255) NOT NULL;""",
+        """ALTER TABLE docker_images
+        MODIFY REPOSITORY           VARCHAR(255) NOT NULL,
+        MODIFY TAG                  VARCHAR(128) NOT NULL,
+        MODIFY CUDA_VERSION_STRING  VARCHAR(64)  NOT NULL,
+        MODIFY CUDNN_VERSION_STRING VARCHAR(64)  NOT NULL;""",
+        """ALTER TABLE request_reports
+        MODIFY REQUEST_ID           VARCHAR(64)  NOT NULL,
+        MODIFY DOCKER_ID            VARCHAR(64)  NOT NULL,
+        MODIFY GPU_MODEL            VARCHAR(64)  NOT NULL,
+        MODIFY MAIL_ADDRESS         VARCHAR(255) NOT NULL,
+        MODIFY FRAMEWORK            VARCHAR(32)  NOT NULL,
+        MODIFY BATCH_SIZE           INT          NOT NULL,
+        MODIFY ITERATION            INT          NOT NULL;""",
+        """ALTER TABLE result_reports
+        MODIFY REQUEST_ID           VARCHAR(64)  NOT NULL,
+        MODIFY DOCKER_ID            VARCHAR(64)  NOT NULL,
+        MODIFY GPU_MODEL            VARCHAR(64)  NOT NULL,
+        MODIFY FRAMEWORK            VARCHAR(32)  NOT NULL,
+        MODIFY TOPOLOGY             VARCHAR(64)  NOT NULL,
+        MODIFY SOURCE               VARCHAR(64)  NOT NULL;""",
+    ]),
+    (3, "index the lookup columns", [
+        add_index("accounts", "idx_accounts_mail", "MAIL"),
+        add_index("docker_images", "idx_docker_images_repository_tag", "REPOSITORY, TAG"),
+        add_index("docker_images", "idx_docker_images_cuda_cudnn", "CUDA_VERSION_STRING, CUDNN_VERSION_STRING"),
+        add_index("request_reports", "idx_request_reports_request_id", "REQUEST_ID"),
+        add_index("request_reports", "idx_request_reports_request_time", "REQUEST_TIME"),
+        add_index("result_reports", "idx_result_reports_request_id", "REQUEST_ID"),
+        add_index("result_reports", "idx_result_reports_config_hash", "CONFIG_HASH, CACHED"),
+    ]),
+    # InnoDB appends the primary key to every index, so each of them is
+    # ordered by (..., REQUEST_TIME, id) for the keyset pages of the history
+    (4, "index the filters of the request history", [
+        add_index("request_reports", "idx_request_reports_gpu_model_time", "GPU_MODEL, REQUEST_TIME"),
+        add_index("request_reports", "idx_request_reports_framework_time", "FRAMEWORK, REQUEST_TIME"),
+        add_index("request_reports", "idx_request_reports_mail_time", "MAIL_ADDRESS, REQUEST_TIME"),
+        add_index("result_reports", "idx_result_reports_request_id_topology", "REQUEST_ID, TOPOLOGY"),
+    ]),
+]
+
+
+def migrate(sql_wrapper, cursor, created_version = 0):
+    """
+        apply the migrations newer than the schema version of the database
+        Args:
+            created_version: schema version of the tables the backend creates
+        Returns:
+            the schema version after the upgrade
+    """
+    cursor.execute("""CREATE TABLE IF NOT EXISTS schema_version
+    (VERSION      INT          NOT NULL,
+     DESCRIPTION  VARCHAR(255) NOT NULL,
+     APPLIED_TIME DATETIME     NOT NULL DEFAULT CURRENT_TIMESTAMP,
+     PRIMARY KEY (VERSION));""")
+    cursor.execute("SELECT MAX(VERSION) FROM schema_version;")
+    row = cursor.fetchone()
+    version = row[0] if row is not None and row[0] is not None else 0
+    if version == 0 and created_version > 0:
+        # new tables, created at created_version already
+        cursor.execute("INSERT INTO schema_version (VERSION, DESCRIPTION) VALUES (%s, %s);",
+                       (created_version, "tables created at version %d" % created_version))
+        version = created_version
+    for (target, description, steps) in MIGRATIONS:
+        if target <= version:
+            continue
+        farmer_log.info("upgrade database schema to version %d : %s" % (target, description))
+        for step in steps:
+            if callable(step):
+                step(sql_wrapper, cursor)
+            else:
+                farmer_log.info("upgrade table : [%s]" % step)
+                cursor.execute(step)
+        cursor.execute("INSERT INTO schema_version (VERSION, DESCRIPTION) VALUES (%s, %s);", (target, description))
+        version = target
+    return version
@@ -4,10 +4,16 @@ import tornado.httpserver
 import tornado.ioloop
 import tornado.options
 import tornado.web
+import tornado.gen
+import tornado.locks
+import tornado.iostream
+import tornado.websocket
 import dicttoxml
+import datetime
 import threading
 import os
 import json
+import urllib
 from xml.dom.minidom import parseString
 from gpu_control import *
 from task_scheduler import *
@@ -17,6 +23,9 @@ import base64, uuid
 from resource_manager import Resource_Manager
 from task_manager import Task_Manager
 from mail_wrapper import *
+from async_database import AsyncDatabase
+from sql_wrapper import create_storage
+from fair_share import parse_weights
 import string
 import threading
 
@@ -39,8 +48,29 @@ def generate_security_code(size=8, chars=string.ascii_uppercase + string.digits)
 
 from tornado.options import define, options
 define('port', default=8888, help='run on the given port', type=int)
-
-scheduler = Task_Scheduler()
+define('gpu_backend', default='auto', help='GPU backend: nvml, nvidia-smi, fake or auto', type=str)
+define('gpu_idle_window', default=10.0, help='seconds a GPU must be idle before a request runs on it', type=float)
+define('gpu_allocation', default='lru', help='how to choose among free GPUs of one model: lru or temperature', type=str)
+define('gpu_sample_interval', default=1.0, help='seconds between two GPU telemetry samples', type=float)
+define('gpu_history_size', default=3600, help='GPU telemetry samples kept for every GPU', type=int)
+define('request_journal', default='requests.journal', help='file journaling the requests, they are recovered on restart', type=str)
+define('storage', default='mysql', help='where the reports are stored: mysql or sqlite', type=str)
+define('mysql_host', default='DPMSystem.sh.intel.com', help='MySQL server of the mysql storage', type=str)
+define('mysql_user', default='root', help='MySQL user of the mysql storage', type=str)
+define('mysql_password', default='tracing', help='MySQL password of the mysql storage', type=str)
+define('mysql_database', default='automations_test', help='MySQL database of the mysql storage', type=str)
+define('sqlite_path', default='automations_test.db', help='database file of the sqlite storage', type=str)
+define('db_pool_min', default=1, help='database connections kept open', type=int)
+define('db_pool_max', default=8, help='database connections open at most', type=int)
+define('container_warm_size', default=1, help='idle containers kept for every docker image and GPU', type=int)
+define('container_pool_capacity', default=8, help='idle containers kept on the host', type=int)
+define('report_cache_size', default=256, help='finished requests whose results and reports are kept in memory', type=int)
+define('share_weights', default='', help='fair share weights of the submitters, as email:weight,email:weight', type=str)
+define('finished_requests', default=256, help='finished requests the scheduler keeps for the result pages', type=int)
+define('result_cache_max_age', default=7 * 24 * 3600.0, help='seconds a measured benchmark result is reused, 0 to always rerun', type=float)
+
+scheduler = None
+database  = None
 resMgr    = Resource_Manager()
 taskMgr   = Task_Manager()
 taskMgr.start()
@@ -49,6 +79,18 @@ class BaseHandler(tornado.web.RequestHandler):
     def get_current_user(self):
         return self.get_secure_cookie("mail")
 
+    def get_request(self, request_id):
+        """
+            Returns:
+                the request of the scheduler, a finished one is rebuilt from its stub
+            Raises:
+                HTTPError 404 if the scheduler doesn't know the request
+        """
+        try:
+            return scheduler.get_request(request_id)
+        except KeyError:
+            raise tornado.web.HTTPError(404)
+
 class TestDashboard(BaseHandler):
     index_html = 'template/dashboard.html'
 
@@ -72,7 +114,7 @@ class TestRequest(BaseHandler):
 
     @tornado.web.authenticated
     def get(self):
-        self.render(self.__class__.test_request_html, gpus = scheduler.gpu_monitor.gpulists)
+        self.render(self.__class__.test_request_html, gpu_models = sorted(scheduler.gpu_monitor.gpu_models_set))
 
     def post(self):
         self.__class__.lock.acquire()
@@ -90,6 +132,8 @@ class TestRequest(BaseHandler):
         options['cudnn']      = self.get_argument('CUDNN')
         options['framework']  = self.get_argument('framework')
         options['profiling']  = self.get_argument('profiling')
+        options['priority']   = self.get_argument('priority', 'normal')
+        options['force_rerun'] = self.get_argument('force_rerun', 'false')
 
         timestamp      = datetime.datetime.now().strftime("%s")
         request_string = 'request_%s_%d' % (timestamp, self.__class__.request_id)
@@ -114,49 +158,98 @@ class TestStatus(BaseHandler):
 
 class TestHistory(BaseHandler):
     PAGE_SIZE = 20 
+    FILTERS = ('gpu_model', 'framework', 'topology', 'email', 'date_from', 'date_to')
+    TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
     test_history_html = 'template/test_history.html'
 
+    def get_cursor(self, name):
+        """
+            Returns:
+                (REQUEST_TIME, id) of the "time,id" cursor argument, None if it is not given
+        """
+        value = self.get_argument(name, None)
+        if not value:
+            return None
+        try:
+            (request_time, row_id) = value.rsplit(',', 1)
+            return (datetime.datetime.strptime(request_time, self.TIME_FORMAT), int(row_id))
+        except ValueError:
+            raise tornado.web.HTTPError(400, "invalid cursor %s" % value)
+
+    def make_cursor(self, rows, index):
+        return "%s,%d" % (rows.column("REQUEST_TIME")[index].strftime(self.TIME_FORMAT), rows.column("id")[index])
+
     @tornado.web.authenticated
+    @tornado.gen.coroutine
     def get(self):
-        page_num = int(self.get_argument("page"))
-        start_index = self.PAGE_SIZE * (page_num - 1)
+        filters = {}
+        for name in self.FILTERS:
+            value = self.get_argument(name, "").strip()
+            if value:
+                filters[name] = value
+        for name in ('date_from', 'date_to'):
+            if name in filters:
+                try:
+                    datetime.datetime.strptime(filters[name], '%Y-%m-%d')
+                except ValueError:
+                    raise tornado.web.HTTPError(400, "invalid date %s" % filters[name])
+        older = self.get_cursor("older")
+        newer = self.get_cursor("newer") if older is None else None
         count = self.PAGE_SIZE + 1
-        request_reports_mediator = scheduler.sql_wrapper.get_request_reports(start_index, count)
-        is_last_page = False
-        if len(request_reports_mediator) < count:
-            is_last_page = True
-        else:
-            is_last_page = False
-            request_reports_mediator.pop()
+        rows = yield database.get_request_reports(count, older = older, newer = newer, filters = filters)
+        has_more = len(rows) == count
+        if has_more:
+            # the extra row is the one farthest from the cursor
+            if newer is not None:
+                rows.pop(0)
+            else:
+                rows.pop()
+        has_newer = newer is not None and has_more or older is not None
+        has_older = newer is not None or has_more
         self.render(self.test_history_html,\
-                    request_reports = request_reports_mediator.to_request_objects(),\
-                    page            = page_num,\
-                    is_last_page    = is_last_page)
+                    request_reports = rows.to_request_objects(),\
+                    filters         = filters,\
+                    filter_query    = urllib.urlencode(sorted((name, value.encode('utf-8')) for (name, value) in filters.items())),\
+                    gpu_models      = sorted(scheduler.gpu_monitor.gpu_models_set),\
+                    newer_cursor    = self.make_cursor(rows, 0) if len(rows) else None,\
+                    older_cursor    = self.make_cursor(rows, -1) if len(rows) else None,\
+                    has_newer       = has_newer and len(rows) > 0,\
+                    has_older       = has_older and len(rows) > 0)
 
 class TestResult(BaseHandler):
+    CHART_POINTS = 300
     test_result_html = 'template/test_result.html'
 
     @tornado.web.authenticated
+    @tornado.gen.coroutine
     def get(self):
         request_id = self.get_argument("request")
-        results = scheduler.sql_wrapper.get_result_by_request_id(request_id).to_result_objects()
+        results = (yield database.get_result_by_request_id(request_id)).to_result_objects()
+        request = self.get_request(request_id)
+        raw_log = request['raw_log']
+        tail_offset = max(0, len(raw_log) - raw_log.tail_size)
+        buffer_log = raw_log.read(tail_offset)
         self.render(self.__class__.test_result_html, \
             results     = results, \
-            buffer_log  = scheduler.requests[request_id]['raw_buffer'],\
+            buffer_log  = buffer_log,\
+            log_offset  = tail_offset + len(buffer_log),\
             request_id  = request_id,\
-            state       = str(scheduler.requests[request_id]['state']),\
-            gpu         = scheduler.requests[request_id]['gpu_device'], \
-            request     = scheduler.requests[request_id])
+            state       = str(request['state']),\
+            gpu         = request['gpu_device'], \
+            request     = request,\
+            expected_runtime = scheduler.expected_runtime(request),\
+            history     = scheduler.get_request_history(request_id, resolution = self.CHART_POINTS))
 
 
 class TestDetail(BaseHandler):
     test_detail_html = 'template/test_detail.html'
     
     @tornado.web.authenticated
+    @tornado.gen.coroutine
     def get(self):
         # fake to get the request id
         request_id = self.get_argument("request")
-        results    = scheduler.sql_wrapper.get_result_by_request_id(request_id).to_result_objects()
+        results    = (yield database.get_result_by_request_id(request_id)).to_result_objects()
         self.render(self.__class__.test_detail_html, results = results)
 
 class TestHPCBinaries(BaseHandler):
@@ -177,11 +270,12 @@ class TestSignIn(BaseHandler):
         else:
             self.render(self.sign_in_html)
 
+    @tornado.gen.coroutine
     def post(self):
         mail     = self.get_argument('mail')
         password = self.get_argument('password')
         farmer_log.info("Sign up info: mail[%s] password[%s]" % (mail, password))
-        user_id, mail_addr  = scheduler.exists_account(mail, password)
+        user_id, mail_addr  = yield database.account_login(mail, password)
         farmer_log.info("user_id[%d] mail[%s]" % (user_id, mail_addr))
         if user_id != -1:
             self.set_secure_cookie("mail", mail_addr)
@@ -203,12 +297,30 @@ class TasksService(BaseHandler):
     @tornado.web.authenticated
     @tornado.web.asynchronous 
     def get(self):
-        tasklist = taskMgr.getTasksInfo()
-        html_table_content = "".join(["<tr><td>%s</td><td>%s</td></tr>" % (task.task, task.state) for task in tasklist])
-        html_table = "<table>" + "<tr><td><h4>task</h4></td><td><h4>state</h4></td></tr>" + html_table_content + "</table>"
-        self.write(html_table)
+        self.write(make_tasks_table())
         self.finish()
 
+def make_tasks_table():
+    tasklist = taskMgr.getTasksInfo()
+    html_table_content = "".join(["<tr><td>%s</td><td>%s</td></tr>" % (task.task, task.state) for task in tasklist])
+    return "<table>" + "<tr><td><h4>task</h4></td><td><h4>state</h4></td></tr>" + html_table_content + "</table>"
+
+class QueueService(BaseHandler):
+
+    @tornado.web.authenticated
+    def get(self):
+        self.set_header("Content-Type", "application/json")
+        self.write(json.dumps(scheduler.get_queue_info()))
+
+class DBPoolService(BaseHandler):
+
+    @tornado.web.authenticated
+    def get(self):
+        self.set_header("Content-Type", "application/json")
+        metrics = scheduler.sql_wrapper.pool.get_metrics()
+        metrics['report_cache'] = scheduler.sql_wrapper.report_cache.get_metrics()
+        self.write(json.dumps(metrics))
+
 class TestSignUp(BaseHandler):
     sign_up_html = 'template/sign_up.html'
     def get(self):
@@ -217,12 +329,13 @@ class TestSignUp(BaseHandler):
         else:
             self.render(self.sign_up_html)
     
+    @tornado.gen.coroutine
     def post(self):
         user     = self.get_argument('user')
         email    = user + "@intel.com"
         password = self.get_argument('password')
         farmer_log.info("Sign up info: email[%s] user[%s] password[%s]" % (email, user, password))
-        have_created = scheduler.create_account(user, password, email)
+        have_created = yield database.run(scheduler.create_account, user, password, email)
         if have_created:
             self.redirect('/sign_in')
         else:
@@ -260,75 +373,335 @@ class MailValidated(BaseHandler):
         self.write(str(result))
         self.finish()
 
-class ResultReportDownloader(BaseHandler):
-    @tornado.web.authenticated
-    @tornado.web.asynchronous
-    def get(self):
-        request_id = self.get_argument("request")
-        download_file = scheduler.make_download_file(request_id)
-        self.set_header("Content-Type", "application/octet-stream")
-        self.set_header("Content-Disposition", "attachment; filename=" + download_file)
-        with open("./xlsx/" + download_file, 'rb') as fileObj:
-            farmer_log.info("open the request(%s) xlsx." % request_id)
-            while True:
-                data = fileObj.read(4096)
-                if not data:
-                    break
-                self.write(data)
-        self.finish()
+class ArtifactDownloader(BaseHandler, tornado.web.StaticFileHandler):
+    """
+        Download of one file of the directory given as the path of the route.
+        StaticFileHandler streams it in chunks and waits for every chunk to be
+        flushed, so a download holds one chunk in memory whatever the file size,
+        and answers Range requests and If-None-Match / If-Modified-Since.
+        Subclasses choose the file from the query arguments in get_artifact.
+    """
+
+    @tornado.gen.coroutine
+    def get_artifact(self):
+        """
+            Returns:
+                (file name in the directory, file name of the attachment)
+        """
+        raise NotImplementedError
 
-class ProfileDownloader(BaseHandler):
     @tornado.web.authenticated
-    @tornado.web.asynchronous
-    def get(self):
-        request_id = self.get_argument("request")
-        download_file = "%s.zip" % request_id
-        self.set_header("Content-Type", "application/octet-stream")
+    @tornado.gen.coroutine
+    def get(self, include_body = True):
+        (name, download_file) = yield self.get_artifact()
+        # one file of the directory, StaticFileHandler also refuses any path out of it
+        if not name or name.startswith('.') or '/' in name or '\\' in name:
+            raise tornado.web.HTTPError(404, "invalid file name %s" % name)
         self.set_header("Content-Disposition", "attachment; filename=" + download_file)
-        with open("./log/" + download_file, 'rb') as fileObj:
-            farmer_log.info("open profile request(%s) file." % request_id)
-            while True:
-                data = fileObj.read(4096)
-                if not data:
-                    break
-                self.write(data)
-        self.finish()
+        yield tornado.web.StaticFileHandler.get(self, name, include_body)
+
+    def head(self):
+        return self.get(include_body = False)
+
+    def compute_etag(self):
+        # hashing the content of a multi-GB file is too slow, its size and time will do
+        stat_result = os.stat(self.absolute_path)
+        return '"%x-%x"' % (int(stat_result.st_mtime), stat_result.st_size)
+
+    def get_content_type(self):
+        return "application/octet-stream"
+
+class ResultReportDownloader(ArtifactDownloader):
+    """
+        Results of finished requests as a csv, xlsx or parquet file,
+        /download?request=<id>[&request=<id>...][&format=xlsx]
+        The files are rendered once by scheduler.report_exporter.
+    """
+
+    @tornado.gen.coroutine
+    def get_artifact(self):
+        request_ids   = self.get_arguments("request")
+        export_format = self.get_argument("format", "xlsx")
+        if export_format not in scheduler.report_exporter.FORMATS:
+            raise tornado.web.HTTPError(400, "unknown export format %s" % export_format)
+        try:
+            path = yield database.run(scheduler.report_exporter.export, request_ids, export_format)
+        except LookupError as e:
+            raise tornado.web.HTTPError(404, str(e))
+        except ImportError as e:
+            raise tornado.web.HTTPError(501, "%s export is not available [%s]" % (export_format, e))
+        if len(request_ids) == 1:
+            download_file = "%s.%s" % (request_ids[0], export_format)
+        else:
+            download_file = "requests_%d.%s" % (len(request_ids), export_format)
+        raise tornado.gen.Return((os.path.basename(path), download_file))
 
+    def compute_etag(self):
+        # the exported files are named by the digest of their rows
+        return '"%s"' % os.path.splitext(os.path.basename(self.absolute_path))[0]
 
-class HPCBinariesDownloader(BaseHandler):
-    @tornado.web.authenticated
-    @tornado.web.asynchronous
-    def get(self):
+class ProfileDownloader(ArtifactDownloader):
+
+    @tornado.gen.coroutine
+    def get_artifact(self):
+        download_file = "%s.zip" % self.get_argument("request")
+        farmer_log.info("download profile file %s." % download_file)
+        raise tornado.gen.Return((download_file, download_file))
+
+class HPCBinariesDownloader(ArtifactDownloader):
+
+    @tornado.gen.coroutine
+    def get_artifact(self):
         binary_name = self.get_argument("binary")
-        self.set_header("Content-Type", "application/octet-stream")
-        self.set_header("Content-Disposition", "attachment; filename=" + binary_name)
-        with open("./HPC_binaries/" + binary_name, 'rb') as fileObj:
-            while True:
-                data = fileObj.read(4096)
-                if not data:
-                    break
-                self.write(data)
-        self.finish()
+        raise tornado.gen.Return((binary_name, binary_name))
 
 class TestRawLogResponse(BaseHandler):
     @tornado.web.asynchronous
     def get(self):
         request_id = self.get_argument("request")
-        self.write(str(scheduler.requests[request_id]['raw_buffer']))
+        offset     = self.get_argument("offset", None)
+        raw_log    = self.get_request(request_id)['raw_log']
+        if offset is None:
+            self.write(raw_log.get_tail())
+        else:
+            self.write(raw_log.read(parse_offset(offset)))
         self.finish()
 
+def parse_offset(value):
+    """
+        Returns:
+            the log offset sent by a client, negative offsets read from the start
+        Raises:
+            HTTPError 400 if it is not a number
+    """
+    try:
+        return max(0, int(value))
+    except ValueError:
+        raise tornado.web.HTTPError(400, "bad log offset [%s]" % value)
+
+def utf8_prefix(data):
+    """
+        Returns:
+            data without the UTF-8 character cut at its end, if any
+    """
+    tail = bytearray(data[-4:])
+    for index in range(len(tail) - 1, -1, -1):
+        byte = tail[index]
+        if byte & 0xC0 == 0x80:
+            # continuation byte, look for the first byte of the character
+            continue
+        if byte >= 0xF0:
+            length = 4
+        elif byte >= 0xE0:
+            length = 3
+        elif byte >= 0xC0:
+            length = 2
+        else:
+            length = 1
+        if index + length > len(tail):
+            return data[:len(data) - len(tail) + index]
+        break
+    return data
+
+class LogFanout(object):
+    """
+        One condition per request log, shared by all of its streams.
+        The worker thread writing the log only schedules one notify on the IOLoop,
+        however many viewers are waiting.
+    """
+
+    def __init__(self):
+        self.conditions = {}
+
+    def get_condition(self, raw_log):
+        condition = self.conditions.get(raw_log.path)
+        if condition is None:
+            io_loop = tornado.ioloop.IOLoop.current()
+            condition = self.conditions[raw_log.path] = tornado.locks.Condition()
+            def notify():
+                if raw_log.closed:
+                    self.conditions.pop(raw_log.path, None)
+                condition.notify_all()
+            raw_log.add_listener(lambda: io_loop.add_callback(notify))
+        return condition
+
+    def wait(self, raw_log, timeout):
+        return self.get_condition(raw_log).wait(timeout=datetime.timedelta(seconds=timeout))
+
+log_fanout = LogFanout()
+
+class TestRawLogStream(BaseHandler):
+    """
+        Server-Sent Events of the raw log of one request.
+        Every message carries the output written since the last one, and its id
+        is the offset reached, so a reconnecting EventSource resumes from Last-Event-ID.
+        An "end" event is sent when the request finished.
+    """
+    CHUNK_SIZE = 64 * 1024
+    KEEPALIVE  = 15.0
+
+    @tornado.gen.coroutine
+    def get(self):
+        request_id = self.get_argument("request")
+        offset     = parse_offset(self.request.headers.get("Last-Event-ID", self.get_argument("offset", 0)))
+        raw_log    = self.get_request(request_id)['raw_log']
+        self.set_header("Content-Type", "text/event-stream")
+        self.set_header("Cache-Control", "no-cache")
+        while True:
+            closed = raw_log.closed
+            data = raw_log.read(offset, self.CHUNK_SIZE)
+            if len(data) == self.CHUNK_SIZE:
+                # end the message on a line, or at least on a character
+                if b'\n' in data:
+                    data = data[:data.rindex(b'\n') + 1]
+                else:
+                    data = utf8_prefix(data)
+            if data:
+                offset += len(data)
+                self.write("id: %d\ndata: %s\n\n" % (offset, json.dumps(data.decode('utf-8', 'replace'))))
+            elif closed:
+                self.write("event: end\ndata: \n\n")
+                break
+            else:
+                self.write(": keepalive\n\n")
+            try:
+                yield self.flush()
+            except tornado.iostream.StreamClosedError:
+                return
+            if not data:
+                yield log_fanout.wait(raw_log, self.KEEPALIVE)
+        self.finish()
+
+class PushHub(object):
+    """
+        Subscriptions of the push channel, by topic:
+            request:<request_id> : state of one request, pushed when it changes
+            gpu:<gpuid>          : status fields of one GPU which changed in the last sample
+            tasks                : the queue, pushed when any request changes state
+        The Task_Manager table has no change events, the tasks page polls /tasksInfo for it.
+        The scheduler and sampler threads only schedule the fan-out on the IOLoop,
+        and every message is built once for all of its subscribers.
+    """
+
+    def __init__(self):
+        self.subscribers = {}
+        self.gpu_status = {}
+        self.io_loop = None
+
+    def start(self, scheduler):
+        self.io_loop = tornado.ioloop.IOLoop.current()
+        scheduler.add_state_listener(lambda request: self.io_loop.add_callback(self.on_state, request['request_id']))
+        scheduler.gpu_monitor.add_sample_listener(lambda: self.io_loop.add_callback(self.on_sample))
+
+    def subscribe(self, socket, topic):
+        self.subscribers.setdefault(topic, set()).add(socket)
+        message = self.make_message(topic)
+        if message is None:
+            return
+        socket.send(message)
+        (kind, _, key) = topic.partition(':')
+        if kind == 'gpu':
+            # the next sample only sends the fields changed since this full status
+            self.gpu_status.setdefault(int(key), json.loads(message)['status'])
+
+    def unsubscribe(self, socket, topic=None):
+        topics = [topic] if topic is not None else list(self.subscribers.keys())
+        for topic in topics:
+            sockets = self.subscribers.get(topic, set())
+            sockets.discard(socket)
+            if not sockets:
+                self.subscribers.pop(topic, None)
+
+    def publish(self, topic, message):
+        for socket in list(self.subscribers.get(topic, ())):
+            socket.send(message)
+
+    def make_message(self, topic):
+        """
+            Returns:
+                the full current value of a topic, None for an unknown topic
+        """
+        (kind, _, key) = topic.partition(':')
+        request = scheduler.find_request(key) if kind == 'request' else None
+        if request is not None:
+            return json.dumps({'topic': topic, 'state': str(request['state']), 'gpu_id': request['gpu_id']})
+        if kind == 'gpu':
+            for gpu in scheduler.gpu_monitor.gpulists:
+                if str(gpu.gpuid) == key:
+                    return json.dumps({'topic': topic, 'status': json.loads(gpu.response_status_as_json())})
+        if kind == 'tasks':
+            return json.dumps({'topic': topic, 'queue': scheduler.get_queue_info()})
+        return None
+
+    def on_state(self, request_id):
+        for topic in ('request:%s' % request_id, 'tasks'):
+            if topic in self.subscribers:
+                self.publish(topic, self.make_message(topic))
+
+    def on_sample(self):
+        for gpu in scheduler.gpu_monitor.gpulists:
+            topic = 'gpu:%d' % gpu.gpuid
+            if topic not in self.subscribers or gpu.status_json is None:
+                self.gpu_status.pop(gpu.gpuid, None)
+                continue
+            status = json.loads(gpu.status_json)
+            last = self.gpu_status.get(gpu.gpuid, {})
+            delta = dict((key, value) for (key, value) in status.items() if last.get(key) != value)
+            self.gpu_status[gpu.gpuid] = status
+            if delta:
+                self.publish(topic, json.dumps({'topic': topic, 'status': delta}))
+
+push_hub = PushHub()
+
+class PushChannel(BaseHandler, tornado.websocket.WebSocketHandler):
+    """
+        WebSocket of the push channel, only for signed in users. The client sends
+            {"subscribe": topic} or {"unsubscribe": topic}
+        and receives the full value of a topic once, then its changes, see PushHub.
+    """
+
+    def open(self):
+        if not self.current_user:
+            farmer_log.warning("push channel refused, not signed in")
+            self.close()
+
+    def on_message(self, message):
+        if not self.current_user:
+            return
+        try:
+            command = json.loads(message)
+        except ValueError:
+            farmer_log.warning("bad push channel message [%s]" % message)
+            return
+        if 'subscribe' in command:
+            push_hub.subscribe(self, command['subscribe'])
+        if 'unsubscribe' in command:
+            push_hub.unsubscribe(self, command['unsubscribe'])
+
+    def on_close(self):
+        push_hub.unsubscribe(self)
+
+    def send(self, message):
+        try:
+            self.write_message(message)
+        except tornado.websocket.WebSocketClosedError:
+            push_hub.unsubscribe(self)
+
 class RequestState(BaseHandler):
     @tornado.web.asynchronous
     def get(self):
         request_id = self.get_argument("request")
-        self.write(str(scheduler.requests[request_id]["state"]))
+        request = scheduler.find_request(request_id)
+        if request is None:
+            raise tornado.web.HTTPError(404)
+        self.write(str(request["state"]))
         self.finish()
 
 class AccountResponse(BaseHandler):
-    @tornado.web.asynchronous
+    @tornado.gen.coroutine
     def get(self):
         mail = self.get_argument("mail")
-        isExist = scheduler.sql_wrapper.exists_mail(mail)
+        isExist = yield database.exists_mail(mail)
         farmer_log.info("The mail[%s] is exist[%r]" % (mail, isExist))
         self.write(str(isExist)) 
         self.finish()
@@ -337,7 +710,10 @@ class GPUState(BaseHandler):
     @tornado.web.asynchronous
     def get(self):
         request_id = self.get_argument("request")
-        self.write(str(scheduler.response_gpu_state_request(request_id)))
+        try:
+            self.write(str(scheduler.response_gpu_state_request(request_id)))
+        except KeyError:
+            raise tornado.web.HTTPError(404)
         self.finish()
 
 counter = 0
@@ -357,6 +733,20 @@ class Test(BaseHandler):
 
 if __name__ == '__main__':
     tornado.options.parse_command_line()
+    sql_wrapper = create_storage(options.storage, options.mysql_host, options.mysql_user, options.mysql_password,
+                                 options.mysql_database, options.sqlite_path)
+    scheduler = Task_Scheduler(options.gpu_backend, options.gpu_idle_window, options.request_journal, sql_wrapper)
+    scheduler.gpu_monitor.allocation_policy = options.gpu_allocation
+    scheduler.sql_wrapper.pool.configure(options.db_pool_min, options.db_pool_max)
+    database = AsyncDatabase(scheduler.sql_wrapper, options.db_pool_max)
+    scheduler.result_cache.max_age = options.result_cache_max_age
+    scheduler.sql_wrapper.report_cache.max_entries = options.report_cache_size
+    scheduler.finished_requests = options.finished_requests
+    scheduler.pending_requests.weights = parse_weights(options.share_weights)
+    scheduler.container_pool.warm_size = options.container_warm_size
+    scheduler.container_pool.capacity = options.container_pool_capacity
+    scheduler.gpu_monitor.start_sampler(options.gpu_sample_interval, options.gpu_history_size)
+    push_hub.start(scheduler)
     
     settings = {
         "cookie_secret" : get_cookie_secret(),
@@ -369,6 +759,8 @@ if __name__ == '__main__':
         (r'/sign_up',         TestSignUp),              \
         (r'/test',            Test),                    \
         (r'/tasksInfo',       TasksService),            \
+        (r'/queueInfo',       QueueService),            \
+        (r'/dbPoolInfo',      DBPoolService),           \
         (r'/tasks',           TestTasks),               \
         (r'/dashboard',       TestDashboard),           \
         (r'/request',         TestRequest),             \
@@ -376,16 +768,18 @@ if __name__ == '__main__':
         (r"/result",          TestResult),              \
         (r"/rawlog",          TestRawLogResponse),      \
         (r"/rawlogbuffer",    TestRawLogResponse),      \
+        (r"/rawlogstream",    TestRawLogStream),        \
         (r"/accountRes",      AccountResponse),         \
         (r"/signout",         TestSignOut),             \
         (r"/requeststate",    RequestState),            \
+        (r"/push",            PushChannel),             \
         (r"/gpustate",        GPUState),                \
         (r"/history",         TestHistory),             \
         (r"/detail",          TestDetail),              \
         (r"/binaries",        TestHPCBinaries),         \
-        (r"/hpc_download",    HPCBinariesDownloader),   \
-        (r"/profile_download", ProfileDownloader),      \
-        (r'/download',        ResultReportDownloader),  \
+        (r"/hpc_download",    HPCBinariesDownloader, {'path': resMgr.binaries_direct_path}), \
+        (r"/profile_download", ProfileDownloader, {'path': 'log'}), \
+        (r'/download',        ResultReportDownloader, {'path': scheduler.report_exporter.directory}), \
         (r'/mail_validated',  MailValidated),           \
         (r'/sec_code_sender', MailSecurityCodeSender),  \
         (r'/css/(.*)',        tornado.web.StaticFileHandler, {'path': 'template/css'}), \
@@ -0,0 +1,666 @@
+#!/usr/bin/env python
+"""
+    This file defines the storage of the farm behind one interface.
+    SQL_wrapper holds the queries, Mysql_wrapper (MySql_wrapper.py) stores them
+    on the MySQL server and Sqlite_wrapper (sqlite_wrapper.py) in a local SQLite
+    file, see create_storage.
+"""
+import time
+import threading
+import farmer_log
+from common import *
+from schema_migrations import migrate
+from report_cache import ReportCache
+
+class ConnectionPool(object):
+    """
+        Bounded pool of database connections.
+        A thread checks one connection out with its first cursor and gives it back
+        when its last cursor is closed, so no two threads share a connection.
+        Attributes:
+            min_size       : connections kept open
+            max_size       : connections open at most, more threads wait for a free one
+            check_interval : seconds a connection may stay idle before it is pinged on checkout
+    """
+    min_size       = 1
+    max_size       = 8
+    check_interval = 60.0
+
+    def __init__(self, connect):
+        """
+            Args:
+                connect: function() returning a new DB-API connection
+        """
+        self.connect   = connect
+        self.idle      = []
+        self.size      = 0
+        self.condition = threading.Condition()
+        self.local     = threading.local()
+        self.checkouts     = 0
+        self.wait_time     = 0.0
+        self.max_wait_time = 0.0
+        self.fill()
+
+    def configure(self, min_size = None, max_size = None):
+        with self.condition:
+            if min_size is not None:
+                self.min_size = min_size
+            if max_size is not None:
+                self.max_size = max(max_size, self.min_size)
+            self.condition.notify_all()
+        self.fill()
+
+    def fill(self):
+        while True:
+            with self.condition:
+                if self.size >= self.min_size:
+                    return
+                self.size += 1
+            connection = self.connect()
+            with self.condition:
+                self.idle.append((connection, time.time()))
+                self.condition.notify()
+
+    @property
+    def connection(self):
+        """
+            the connection checked out by the calling thread, None if it has none
+        """
+        return getattr(self.local, 'connection', None)
+
+    def acquire(self):
+        if getattr(self.local, 'depth', 0) > 0:
+            self.local.depth += 1
+            return self.local.connection
+        start = time.time()
+        with self.condition:
+            while not self.idle and self.size >= self.max_size:
+                self.condition.wait()
+            if self.idle:
+                (connection, last_used) = self.idle.pop()
+            else:
+                (connection, last_used) = (None, None)
+                self.size += 1
+            waited = time.time() - start
+            self.checkouts += 1
+            self.wait_time += waited
+            self.max_wait_time = max(self.max_wait_time, waited)
+        try:
+            if connection is None:
+                connection = self.connect()
+            elif time.time() - last_used > self.check_interval:
+                connection = self.check(connection)
+        except Exception:
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+            raise
+        self.local.connection = connection
+        self.local.depth = 1
+        return connection
+
+    def check(self, connection):
+        try:
+            connection.ping()
+            return connection
+        except Exception:
+            farmer_log.info("The connection is too long, reconnect.")
+            try:
+                connection.close()
+            except Exception:
+                pass
+            return self.connect()
+
+    def release(self):
+        self.local.depth -= 1
+        if self.local.depth > 0:
+            return
+        connection = self.local.connection
+        self.local.connection = None
+        with self.condition:
+            self.idle.append((connection, time.time()))
+            self.condition.notify()
+
+    def close(self):
+        with self.condition:
+            for (connection, last_used) in self.idle:
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+            self.size -= len(self.idle)
+            del self.idle[:]
+
+    def get_metrics(self):
+        with self.condition:
+            metrics = {}
+            metrics['size']          = self.size
+            metrics['active']        = self.size - len(self.idle)
+            metrics['idle']          = len(self.idle)
+            metrics['max_size']      = self.max_size
+            metrics['checkouts']     = self.checkouts
+            metrics['average_wait']  = self.wait_time / self.checkouts if self.checkouts else 0.0
+            metrics['max_wait']      = self.max_wait_time
+            return metrics
+
+class PooledCursor(object):
+    """
+        DB-API cursor on the connection of the calling thread,
+        closing it gives the connection back to the pool
+    """
+
+    def __init__(self, pool):
+        self.pool   = pool
+        self.cursor = pool.acquire().cursor()
+        self.closed = False
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.cursor.close()
+        finally:
+            self.pool.release()
+
+class SQL_wrapper(object):
+    """
+        Storage of the accounts, docker images, request and result reports.
+        The queries are shared by the backends and written with %s parameters,
+        a backend provides the connections, the tables and the few dialect
+        specific SQL fragments below.
+        Attributes:
+            BEGIN_SQL      : statement starting a transaction
+            REPORT_AGE_SQL : condition on REPORT_TIME being at most %s seconds old
+            NEXT_DAY_SQL   : expression of the day after the date %s
+    """
+    BEGIN_SQL      = None
+    REPORT_AGE_SQL = None
+    NEXT_DAY_SQL   = None
+
+    def __init__(self):
+        self.pool         = ConnectionPool(self.connect)
+        self.report_cache = ReportCache()
+
+    def connect(self):
+        """
+            Returns:
+                a new DB-API connection in autocommit mode
+        """
+        raise NotImplementedError
+
+    @property
+    def connection(self):
+        return self.pool.connection
+
+    def cursor(self):
+        return PooledCursor(self.pool)
+
+    def __del__(self):
+        self.pool.close()
+
+    def create_tables(self, cursor):
+        """
+            create the tables which don't exist
+            Returns:
+                the schema version of the created tables, see schema_migrations.py
+        """
+        raise NotImplementedError
+
+    def add_column_if_missing(self, table, column, definition, cursor):
+        raise NotImplementedError
+
+    def add_index_if_missing(self, table, index, columns, cursor):
+        raise NotImplementedError
+
+    def init_database(self):
+        """
+        Perpare for database and table
+        Args:
+            NULL
+
+        Returns:
+        """
+        cursor = self.cursor()
+        try:
+            created_version = self.create_tables(cursor)
+            # upgrade the tables to the latest schema version, see schema_migrations.py
+            version = migrate(self, cursor, created_version)
+            farmer_log.info("database schema version %d" % version)
+        finally:
+            cursor.close()
+
+    def create_table(self, sql_command, cursor):
+        farmer_log.info("init table : [%s]" % sql_command)
+        cursor.execute(sql_command)
+        farmer_log.info(cursor.fetchall())
+        self.connection.commit()
+
+    def create_account(self, user, password, mail):
+        cursor = self.cursor()
+        try:
+            inserted_sql = '''INSERT INTO accounts
+                  (USER,   PASSWORD,       MAIL, HAVE_LOGINED)
+            VALUES(%s,     %s,             %s,   0);'''
+            farmer_log.debug(inserted_sql)
+            cursor.execute(inserted_sql, (user, password, mail))
+            self.connection.commit()
+            output = cursor.fetchall()
+            farmer_log.info(output)
+        except Exception as e:
+            self.connection.rollback()
+            farmer_log.error("inert_account_info:" + e.message)
+        finally:
+            cursor.close()
+
+    def exists_mail(self, mail):
+        result = False
+        cursor = self.cursor()
+        try:
+            select_sql = """select id from accounts where
+            MAIL = %s;"""
+            farmer_log.info(select_sql)
+            cursor.execute(select_sql, (mail,))
+            self.connection.commit()
+            if 1 == cursor.rowcount:
+                result = True
+            elif 0 == cursor.rowcount:
+                result = False
+            else:
+                farmer_log.error("The account have exists more than one.mail[%s]" % mail)
+        except Exception as e:
+            self.connection.rollback()
+            farmer_log.error("exists_account error [%s]" % e.message)
+        finally:
+            cursor.close()
+        return result
+
+    def exists_user(self, user):
+        result = False
+        cursor = self.cursor()
+        try:
+            select_sql = """select id from accounts where
+            USER = %s;"""
+            farmer_log.info(select_sql)
+            cursor.execute(select_sql, (user,))
+            self.connection.commit()
+            if 1 == cursor.rowcount:
+                result = True
+            elif 0 == cursor.rowcount:
+                result = False
+            else:
+                farmer_log.error("The account have exists more than one.user[%s]" % user)
+        except Exception as e:
+            self.connection.rollback()
+            farmer_log.error("exists_account error [%s]" % e.message)
+        finally:
+            cursor.close()
+        return result
+
+    def account_login(self, mail, password):
+        result = (-1, "")
+        cursor = self.cursor()
+        try:
+            login_sql = """select id, MAIL from accounts
+            where MAIL = %s AND PASSWORD = %s;"""
+            farmer_log.info(login_sql)
+            rowcount = cursor.execute(login_sql, (mail, password))
+            self.connection.commit()
+            if rowcount == 1:
+                output = cursor.fetchone()
+                result = (int(output[0]), str(output[1]))
+        except Exception as e:
+            self.connection.rollback()
+            farmer_log.error("account_login error [%s]" % e.message)
+        finally:
+            cursor.close()
+        return result
+        
+    def account_logout(self, mail, password):
+        cursor = self.cursor()
+        try:
+            login_sql = """UPDATE accounts
+            SET HAVE_LOGINED = 0
+            where MAIL = %s AND PASSWORD = %s;"""
+            farmer_log.info(login_sql)
+            cursor.execute(login_sql, (mail, password))
+            self.connection.commit()
+        except Exception as e:
+            self.connection.rollback()
+            farmer_log.error("account_logout error [%s]" % e.message)
+        finally:
+            cursor.close()
+
+    def has_image_in_db_by_rep_tag(self, repository, tag):
+        result = False
+        cursor = self.cursor()
+        try:
+            seach_image = "SELECT repository, tag FROM docker_images WHERE REPOSITORY = %s AND TAG = %s;"
+            farmer_log.debug(seach_image)
+            cursor.execute(seach_image, (repository, tag))
+            farmer_log.debug(cursor.rowcount)
+            if (-1 != cursor.rowcount) and (0 != cursor.rowcount):
+                result = True
+            output = cursor.fetchall()
+            farmer_log.info(output)
+        except Exception as e:
+            farmer_log.error("has_image_in_db_by_rep_tag:" + e.message)
+            self.connection.rollback()
+        finally:
+            cursor.close()
+        return result
+
+    def inert_item_in_docker_images_table(self, repository, tag, cuda_version, cuda_version_str, cudnn_version, cudnn_version_str, have_tensorflow, have_caffe):
+        cursor = self.cursor()
+        try:
+            inserted_sql = 'INSERT INTO docker_images (REPOSITORY, TAG,\
+             CUDA_VERSION, CUDA_VERSION_STRING, CUDNN_VERSION,\
+             CUDNN_VERSION_STRING, TENSORFLOW, CAFFE) \
+             VALUES(%s, %s, %s, %s, %s, %s, %s, %s);'
+            farmer_log.debug(inserted_sql)
+            cursor.execute(inserted_sql, \
+              (repository, tag, float(cuda_version), cuda_version_str, float(cudnn_version),\
+               cudnn_version_str, int(have_tensorflow), int(have_caffe)))
+            self.connection.commit()
+            output = cursor.fetchall()
+            farmer_log.info(output)
+        except Exception as e:
+            self.connection.rollback()
+            farmer_log.error("inert_item_in_docker_images_table:" + e.message)
+        finally:
+            cursor.close()
+
+    INSERT_REQUEST_REPORT_SQL = """INSERT INTO request_reports
+    (REQUEST_ID, DOCKER_ID, GPU_MODEL, MAIL_ADDRESS, FRAMEWORK, TOPOLOGY, BATCH_SIZE, ITERATION)
+    VALUES (%s,  %s,        %s,        %s,           %s,        %s,       %s,         %s);"""
+
+    INSERT_RESULT_REPORT_SQL = """INSERT INTO result_reports
+    (REQUEST_ID, DOCKER_ID, GPU_MODEL, FRAMEWORK, TOPOLOGY, BATCH_SIZE, SOURCE, ITERATION, SCORE, IMAGES_PRE_SEC, DURATION, CONFIG_HASH, CACHED)
+    VALUES (%s,  %s,        %s,        %s,        %s,       %s,         %s,     %s,        %s,    %s,             %s,       %s,          %s);"""
+
+    def inert_item_in_request_reports(self, resquest_id, docker_id, gpu_model, \
+                                      mail_addr, framework, topology, \
+                                      batch_size, iteration):
+        self.inert_request_with_results(resquest_id, docker_id, gpu_model, mail_addr, \
+                                        framework, topology, batch_size, iteration, [])
+
+    def inert_item_in_result_reports(self, resquest_id, docker_id, gpu_model, \
+                                     framework, topology, batch_size, source, \
+                                     iteration, score, images_pre_sec, duration = 0.0, \
+                                     config_hash = '', cached = False):
+        cursor = self.cursor()
+        try:
+            cursor.execute(self.__class__.INSERT_RESULT_REPORT_SQL, \
+            (resquest_id,  docker_id,  gpu_model,  framework,  topology,  batch_size,  source,   iteration,  score,    images_pre_sec, duration, config_hash, cached))
+        except Exception as e:
+            farmer_log.error("inert_item_in_result_report:" + e.message)
+        finally:
+            cursor.close()
+            self.report_cache.invalidate(resquest_id)
+
+    def inert_request_with_results(self, resquest_id, docker_id, gpu_model, \
+                                   mail_addr, framework, topology, \
+                                   batch_size, iteration, results):
+        """
+        Insert the request report and all of its result rows in one transaction
+        Args:
+            results: list of (FRAMEWORK, TOPOLOGY, BATCH_SIZE, SOURCE, ITERATION, SCORE,
+                     IMAGES_PRE_SEC, DURATION, CONFIG_HASH, CACHED) tuples
+
+        Returns:
+            True if the rows are written
+        """
+        cursor = self.cursor()
+        try:
+            cursor.execute(self.BEGIN_SQL)
+            cursor.execute(self.__class__.INSERT_REQUEST_REPORT_SQL, \
+            (resquest_id,  docker_id,  gpu_model,  mail_addr,     framework,  str(topology),  int(batch_size),   int(iteration)))
+            if results:
+                cursor.executemany(self.__class__.INSERT_RESULT_REPORT_SQL, \
+                    [(resquest_id, docker_id, gpu_model) + tuple(result) for result in results])
+            self.connection.commit()
+            farmer_log.debug("request %s: %d result rows written" % (resquest_id, len(results)))
+            return True
+        except Exception as e:
+            self.connection.rollback()
+            farmer_log.error("inert_request_with_results:" + e.message)
+            return False
+        finally:
+            cursor.close()
+            self.report_cache.invalidate(resquest_id)
+
+    # filter name -> column of request_reports compared for equality
+    REQUEST_FILTER_COLUMNS = (('gpu_model', 'GPU_MODEL'), ('framework', 'FRAMEWORK'), ('email', 'MAIL_ADDRESS'))
+
+    def get_request_reports(self, count, older = None, newer = None, filters = None):
+        """
+        Get one page of request reports, the newest first.
+        Pages are found by keyset on (REQUEST_TIME, id), so a deep page costs as much as the first one.
+        Args:
+            count: rows of the page
+            older: (REQUEST_TIME, id) of a row, get the rows just older than it
+            newer: (REQUEST_TIME, id) of a row, get the rows just newer than it
+            filters: dict of gpu_model, framework, topology, email, date_from, date_to ('YYYY-MM-DD')
+
+        Returns:
+            DataMediator, the id of each row is the last column
+        """
+        header = ["REQUEST_ID", "DOCKER_ID", "GPU_MODEL", "MAIL_ADDRESS", "FRAMEWORK", "TOPOLOGY", "BATCH_SIZE", "ITERATION", "REQUEST_TIME", "id"]
+        result = DataMediator(header)
+        filters = filters if filters is not None else {}
+        conditions = []
+        args = []
+        for (key, column) in self.__class__.REQUEST_FILTER_COLUMNS:
+            if filters.get(key):
+                conditions.append("%s = %%s" % column)
+                args.append(filters[key])
+        if filters.get('topology'):
+            # TOPOLOGY of request_reports is a list, the result rows have one topology each
+            conditions.append("EXISTS (SELECT 1 FROM result_reports WHERE result_reports.REQUEST_ID = request_reports.REQUEST_ID AND result_reports.TOPOLOGY = %s)")
+            args.append(filters['topology'])
+        if filters.get('date_from'):
+            conditions.append("REQUEST_TIME >= %s")
+            args.append(filters['date_from'])
+        if filters.get('date_to'):
+            conditions.append("REQUEST_TIME < " + self.NEXT_DAY_SQL)
+            args.append(filters['date_to'])
+        order = "DESC"
+        if older is not None:
+            conditions.append("(REQUEST_TIME < %s OR (REQUEST_TIME = %s AND id < %s))")
+            args.extend([older[0], older[0], older[1]])
+        elif newer is not None:
+            conditions.append("(REQUEST_TIME > %s OR (REQUEST_TIME = %s AND id > %s))")
+            args.extend([newer[0], newer[0], newer[1]])
+            order = "ASC"
+        args.append(count)
+        where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+        cursor = self.cursor()
+        try:
+            search_request = "SELECT %s FROM request_reports %s order by REQUEST_TIME %s, id %s limit %%s;" % (", ".join(header), where, order, order)
+            farmer_log.debug(search_request)
+            cursor.execute(search_request, args)
+            rows = list(cursor.fetchall())
+            if order == "ASC":
+                rows.reverse()
+            result.extend(rows)
+            farmer_log.debug("The result row count is %d" % len(result))
+        except Exception as e:
+            farmer_log.error("get_request_reports:" + e.message)
+        finally:
+            cursor.close()
+        return result
+
+    def get_runtime_history(self, count):
+        """
+            Returns:
+                the latest measured runs, the rows copied from the result cache are left out
+        """
+        header = ["GPU_MODEL", "FRAMEWORK", "TOPOLOGY", "BATCH_SIZE", "ITERATION", "DURATION"]
+        result = DataMediator(header)
+        cursor = self.cursor()
+        try:
+            search_runtime = "SELECT %s FROM result_reports WHERE DURATION > 0 AND CACHED = 0 order by id desc limit %%s;" % ", ".join(header)
+            farmer_log.debug(search_runtime)
+            cursor.execute(search_runtime, (count,))
+            self.connection.commit()
+            result.extend(cursor.fetchall())
+            farmer_log.debug("The runtime history row count is %d" % len(result))
+        except Exception as e:
+            farmer_log.error("get_runtime_history:" + e.message)
+            self.connection.rollback()
+        finally:
+            cursor.close()
+        return result
+
+    def get_cached_result(self, config_hash, max_age):
+        """
+            Returns:
+                the latest measured (not cached) result of one configuration, younger than max_age seconds
+        """
+        header = ["FRAMEWORK", "TOPOLOGY", "BATCH_SIZE", "SOURCE", "ITERATION", "SCORE", "IMAGES_PRE_SEC", "DURATION"]
+        result = DataMediator(header)
+        cursor = self.cursor()
+        try:
+            search_result = "SELECT %s FROM result_reports WHERE CONFIG_HASH = %%s AND CACHED = 0 \
+            AND %s order by id desc limit 1;" % (", ".join(header), self.REPORT_AGE_SQL)
+            farmer_log.debug(search_result)
+            cursor.execute(search_result, (config_hash, int(max_age)))
+            self.connection.commit()
+            result.extend(cursor.fetchall())
+        except Exception as e:
+            farmer_log.error("get_cached_result:" + e.message)
+            self.connection.rollback()
+        finally:
+            cursor.close()
+        return result
+
+    def get_result_by_request_id(self, request_id):
+        """
+        Get the result rows of a request, served from report_cache once the request has results.
+        The rows of a request are written when it finishes, so they are cached until
+        new rows are written for the request.
+
+        Returns:
+            DataMediator, shared with the other callers, don't modify it
+        """
+        result = self.report_cache.get(request_id)
+        if result is not None:
+            return result
+        header = ("REQUEST_ID", "DOCKER_ID", "GPU_MODEL", "FRAMEWORK", "TOPOLOGY", "BATCH_SIZE", "SOURCE", "ITERATION", "SCORE", "IMAGES_PRE_SEC", "MAIL_ADDRESS", "CACHED")
+        result = DataMediator(header)
+        cursor = self.cursor()
+        email = ""
+        try:
+            search_email = "SELECT MAIL_ADDRESS FROM request_reports WHERE REQUEST_ID = %s;"
+            cursor.execute(search_email, (request_id,))
+            self.connection.commit()
+            if cursor.rowcount == 1:
+                email = cursor.fetchone()[0]
+            else:
+
+                farmer_log.error("The request email have wrong number. The rowcount[%d]" % cursor.rowcount)
+                farmer_log.error(cursor.fetchall())
+
+            search_image = "SELECT \
+            REQUEST_ID,\
+            DOCKER_ID,\
+            GPU_MODEL,\
+            FRAMEWORK,\
+            TOPOLOGY,\
+            BATCH_SIZE,\
+            SOURCE,\
+            ITERATION,\
+            SCORE,\
+            IMAGES_PRE_SEC,\
+            CACHED FROM result_reports WHERE REQUEST_ID = %s;"
+            farmer_log.debug(search_image)
+            cursor.execute(search_image, (request_id,))
+            self.connection.commit()
+
+            rowcount = cursor.rowcount
+            farmer_log.debug("The result row count is %d" % rowcount)
+            for i in range(rowcount):
+                output = cursor.fetchone()
+                farmer_log.info(output)
+                result.append((output[0], \
+                              output[1], \
+                              output[2], \
+                              output[3], \
+                              output[4], \
+                              output[5], \
+                              output[6], \
+                              output[7], \
+                              "%.2f" % output[8], \
+                              "%.2f" % output[9], \
+                              email, \
+                              bool(output[10])))
+                farmer_log.info(output)
+            if len(result) > 0:
+                self.report_cache.put(request_id, result)
+        except Exception as e:
+            farmer_log.error("get_result_by_request_id:" + e.message)
+            self.connection.rollback()
+        finally:
+            cursor.close()
+        return result
+
+    def has_image_in_db_by_cuda_cuddn(self, cuda_string, cuddn_string):
+        result = False
+        cursor = self.cursor()
+        try:
+            seach_image = "SELECT repository, tag FROM docker_images WHERE CUDA_VERSION_STRING = %s AND CUDNN_VERSION_STRING = %s;"
+            farmer_log.debug(seach_image)
+            cursor.execute(seach_image, (cuda_string, cuddn_string))
+            farmer_log.debug(cursor.rowcount)
+            if (-1 != cursor.rowcount) and (0 != cursor.rowcount):
+                result = True
+            output = cursor.fetchall()
+            farmer_log.info(output)
+        except Exception as e:
+            self.connection.rollback()
+            farmer_log.error("has_image_in_db_by_cuda_cuddn" + e.message)
+        finally:
+            cursor.close()
+        return result
+
+    def get_detailed_info_from_db(self, repository, tag):
+        row = None
+        cursor = self.cursor()
+        try:
+            select_sql = "SELECT * FROM docker_images WHERE REPOSITORY = %s AND TAG = %s;"
+            farmer_log.info(select_sql)
+            cursor.execute(select_sql, (repository, tag))
+            numrows = int(cursor.rowcount)
+            if numrows == 1:
+                row = cursor.fetchone()
+            else:
+                farmer_log.error("the result numrows[%d] which is not 1." % numrows)
+            output = cursor.fetchall()
+            farmer_log.info(output)
+        except Exception as e:
+            farmer_log.error("get_detailed_info_from_db" + e.message)
+        finally:
+            cursor.close()
+        return row
+
+
+def create_storage(name='mysql', host='DPMSystem.sh.intel.com', user='root', passwd='tracing',
+                   dataset='automations_test', path='automations_test.db'):
+    """
+        Args:
+            name: 'mysql' or 'sqlite'
+            host, user, passwd, dataset: the MySQL server and database of 'mysql'
+            path: the database file of 'sqlite'
+        Returns:
+            SQL_wrapper
+    """
+    if name == 'mysql':
+        from MySql_wrapper import Mysql_wrapper
+        return Mysql_wrapper(host, user, passwd, dataset)
+    if name == 'sqlite':
+        from sqlite_wrapper import Sqlite_wrapper
+        return Sqlite_wrapper(path)
+    raise Exception('Unknown storage backend [%s]' % name)
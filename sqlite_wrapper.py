@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+"""
+    This file defines the embedded SQLite storage.
+    It keeps the tables and the queries of SQL_wrapper in one local file in WAL
+    mode, so a single node farm, or a test, runs without the MySQL server.
+    The connections and cursors below behave like the MySQLdb ones the queries
+    are written for: %s parameters, rowcount of the selected rows, autocommit.
+"""
+import datetime
+import sqlite3
+import farmer_log
+from sql_wrapper import SQL_wrapper
+
+
+def convert_datetime(value):
+    for time_format in ('%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d'):
+        try:
+            return datetime.datetime.strptime(value, time_format)
+        except ValueError:
+            pass
+    return value
+
+# DATETIME columns are read back as datetime, as MySQLdb does
+sqlite3.register_converter("DATETIME", convert_datetime)
+
+
+class SqliteCursor(object):
+    """
+        sqlite3 cursor taking %s parameters, the selected rows are fetched
+        on execute so rowcount counts them
+    """
+
+    def __init__(self, cursor):
+        self.cursor   = cursor
+        self.rows     = []
+        self.rowcount = -1
+
+    def execute(self, sql, args = None):
+        if args is None:
+            self.cursor.execute(sql)
+        else:
+            self.cursor.execute(sql.replace('%s', '?'), tuple(args))
+        self.store_result()
+        return self.rowcount
+
+    def executemany(self, sql, seq_of_args):
+        self.cursor.executemany(sql.replace('%s', '?'), [tuple(args) for args in seq_of_args])
+        self.store_result()
+        return self.rowcount
+
+    def store_result(self):
+        if self.cursor.description is not None:
+            self.rows = list(self.cursor.fetchall())
+            self.rowcount = len(self.rows)
+        else:
+            self.rows = []
+            self.rowcount = self.cursor.rowcount
+
+    def fetchone(self):
+        if not self.rows:
+            return None
+        return self.rows.pop(0)
+
+    def fetchall(self):
+        rows = self.rows
+        self.rows = []
+        return rows
+
+    def close(self):
+        self.cursor.close()
+
+
+class SqliteConnection(object):
+    """
+        sqlite3 connection in autocommit mode, an explicit BEGIN starts a transaction
+        Attributes:
+            timeout : seconds a statement waits for the lock of another writer
+    """
+    timeout = 30.0
+
+    def __init__(self, path):
+        # the pool hands a connection to one thread at a time
+        self.connection = sqlite3.connect(path, timeout = self.timeout, isolation_level = None,
+                                          check_same_thread = False, detect_types = sqlite3.PARSE_DECLTYPES)
+        # readers don't block the writer, and a commit doesn't wait for the disk
+        self.connection.execute("PRAGMA journal_mode = WAL;")
+        self.connection.execute("PRAGMA synchronous = NORMAL;")
+
+    def cursor(self):
+        return SqliteCursor(self.connection.cursor())
+
+    def commit(self):
+        self.connection.commit()
+
+    def rollback(self):
+        self.connection.rollback()
+
+    def ping(self):
+        self.connection.execute("SELECT 1;")
+
+    def close(self):
+        self.connection.close()
+
+
+class Sqlite_wrapper(SQL_wrapper):
+    BEGIN_SQL      = "BEGIN;"
+    REPORT_AGE_SQL = "REPORT_TIME >= datetime('now', 'localtime', '-' || %s || ' seconds')"
+    NEXT_DAY_SQL   = "date(%s, '+1 day')"
+
+    def __init__(self, path):
+        self.path = path
+        SQL_wrapper.__init__(self)
+
+    def connect(self):
+        return SqliteConnection(self.path)
+
+    def create_tables(self, cursor):
+        """
+        Create the tables of schema version 2, with the columns the first migrations
+        add to the MySQL tables: SQLite can't add a column defaulting to the current time.
+        Returns:
+            2
+        """
+        create_accounts_table_cmd = """CREATE TABLE IF NOT EXISTS accounts
+        (id             INTEGER         PRIMARY KEY AUTOINCREMENT,
+         USER           VARCHAR(255)    NOT NULL,
+         PASSWORD       VARCHAR(64)     NOT NULL,
+         MAIL           VARCHAR(255)    NOT NULL,
+         HAVE_LOGINED   BOOL            NOT NULL);"""
+
+        create_docker_images_table_cmd  = """CREATE TABLE IF NOT EXISTS docker_images
+        (id                   INTEGER      PRIMARY KEY AUTOINCREMENT,
+         REPOSITORY           VARCHAR(255) NOT NULL,
+         TAG                  VARCHAR(128) NOT NULL,
+         CUDA_VERSION         FLOAT        NOT NULL,
+         CUDA_VERSION_STRING  VARCHAR(64)  NOT NULL,
+         CUDNN_VERSION        FLOAT        NOT NULL,
+         CUDNN_VERSION_STRING VARCHAR(64)  NOT NULL,
+         TENSORFLOW           BOOL         NOT NULL,
+         CAFFE                BOOL         NOT NULL);"""
+
+        create_request_reports_table_cmd = """CREATE TABLE IF NOT EXISTS request_reports
+        (id              INTEGER      PRIMARY KEY AUTOINCREMENT,
+         REQUEST_ID      VARCHAR(64)  NOT NULL,
+         DOCKER_ID       VARCHAR(64)  NOT NULL,
+         GPU_MODEL       VARCHAR(64)  NOT NULL,
+         MAIL_ADDRESS    VARCHAR(255) NOT NULL,
+         FRAMEWORK       VARCHAR(32)  NOT NULL,
+         TOPOLOGY        VARCHAR(500) NOT NULL,
+         BATCH_SIZE      INT          NOT NULL,
+         ITERATION       INT          NOT NULL,
+         REQUEST_TIME    DATETIME     NOT NULL DEFAULT (datetime('now', 'localtime')));"""
+
+        create_result_report_table_cmd = """CREATE TABLE IF NOT EXISTS result_reports
+        (id             INTEGER      PRIMARY KEY AUTOINCREMENT,
+         REQUEST_ID     VARCHAR(64)  NOT NULL,
+         DOCKER_ID      VARCHAR(64)  NOT NULL,
+         GPU_MODEL      VARCHAR(64)  NOT NULL,
+         FRAMEWORK      VARCHAR(32)  NOT NULL,
+         TOPOLOGY       VARCHAR(64)  NOT NULL,
+         BATCH_SIZE     INT          NOT NULL,
+         SOURCE         VARCHAR(64)  NOT NULL,
+         ITERATION      INT          NOT NULL,
+         SCORE          DOUBLE       NOT NULL,
+         IMAGES_PRE_SEC DOUBLE       NOT NULL,
+         DURATION       DOUBLE       NOT NULL DEFAULT 0,
+         CONFIG_HASH    VARCHAR(40)  NOT NULL DEFAULT '',
+         CACHED         BOOL         NOT NULL DEFAULT 0,
+         REPORT_TIME    DATETIME     NOT NULL DEFAULT (datetime('now', 'localtime')));"""
+
+        self.create_table(create_accounts_table_cmd, cursor)
+        self.create_table(create_docker_images_table_cmd, cursor)
+        self.create_table(create_request_reports_table_cmd, cursor)
+        self.create_table(create_result_report_table_cmd, cursor)
+        return 2
+
+    def add_column_if_missing(self, table, column, definition, cursor):
+        cursor.execute("PRAGMA table_info(%s);" % table)
+        if column not in [row[1] for row in cursor.fetchall()]:
+            alter_sql = "ALTER TABLE %s ADD COLUMN %s %s;" % (table, column, definition)
+            farmer_log.info("upgrade table : [%s]" % alter_sql)
+            cursor.execute(alter_sql)
+
+    def add_index_if_missing(self, table, index, columns, cursor):
+        create_sql = "CREATE INDEX IF NOT EXISTS %s ON %s (%s);" % (index, table, columns)
+        farmer_log.info("upgrade table : [%s]" % create_sql)
+        cursor.execute(create_sql)
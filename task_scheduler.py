@@ -3,37 +3,89 @@ import os
 import sys
 import workload
 from xml_parser import *
-from MySql_wrapper import Mysql_wrapper
+from sql_wrapper import create_storage
 from cmd_generator import *
 from workload import * 
-import pandas
 import cmd_generator
 import time
+import heapq
 import threading
-from docker_control import Docker_Monitor
+from docker_control import Docker_Monitor, Container_Pool
 from threading import Thread
 from gpu_control import *
+from gpu_backend import create_backend
+from gpu_telemetry import TelemetrySeries
+from fair_share import FairShareQueue
+from runtime_estimator import RuntimeEstimator
+from result_cache import ResultCache
+from report_export import ReportExporter
+from request_journal import RequestJournal
+from request_log import RequestLog
 from enum import Enum
+from collections import OrderedDict
 
 
 class Task_Scheduler(object):
 
-    TASK_STATE = Enum("Pendding", "Running", "Finish")
+    TASK_STATE = Enum("Pending", "Dispatched", "Running", "Finish", "Failure")
+    # allowed state changes, keyed by str(state)
+    TRANSITIONS = {
+        "Pending"    : ("Dispatched", "Finish"),
+        "Dispatched" : ("Running", "Failure"),
+        "Running"    : ("Finish", "Failure"),
+        "Finish"     : (),
+        "Failure"    : (),
+    }
+    retry_interval = 5.0
+    default_runtime = 600.0
+    # telemetry points kept for a finished request
+    history_points = 300
+    # finished requests kept as stubs, and journal records appended before it is compacted
+    finished_requests = 256
+    journal_records = 4096
     
-    def __init__(self):
-        self.sql_wrapper    = Mysql_wrapper('DPMSystem.sh.intel.com', 'root', 'tracing', 'automations_test')
+    def __init__(self, gpu_backend='auto', idle_window=None, journal_path='requests.journal', sql_wrapper=None):
+        """
+            Args:
+                gpu_backend: 'nvml', 'nvidia-smi', 'fake' or 'auto', see gpu_backend.create_backend
+                idle_window: seconds a GPU must be idle before a request runs on it,
+                             default GPUDevice.idle_window
+                journal_path: file of the request journal, the requests in it are recovered
+                sql_wrapper: SQL_wrapper storing the reports, default the MySQL server,
+                             see sql_wrapper.create_storage
+        """
+        self.sql_wrapper    = sql_wrapper if sql_wrapper is not None else create_storage('mysql')
         self.docker_control = Docker_Monitor()
-        self.gpu_monitor    = GPUMonitor()
+        self.container_pool = Container_Pool()
+        self.gpu_monitor    = GPUMonitor(create_backend(gpu_backend))
         self.gpu_monitor.init_local_gpu_lists()
         self.gpu_monitor.register_listener(self)
+        # the pending and running requests, the finished ones are stubs in self.finished
         self.requests = {}
-        self.pending_requests = []
-        self.prepare_env()
+        self.finished = OrderedDict()
+        self.pending_requests = FairShareQueue(runtime=self.expected_runtime)
+        self.average_runtime = {}
+        self.runtime_estimator = RuntimeEstimator()
+        self.result_cache = ResultCache(self.sql_wrapper)
+        self.report_exporter = ReportExporter(self.sql_wrapper)
+        self.idle_window = idle_window
+        self.journal = RequestJournal(journal_path)
+        self.state_listeners = []
         self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        self.dispatch_requested = False
+        self.stopped = False
+        self.prepare_env()
+        self.recover()
+        self.dispatcher = threading.Thread(target=self.dispatch_loop, name='dispatcher')
+        self.dispatcher.daemon = True
+        self.dispatcher.start()
 
     def prepare_env(self):
         self.sql_wrapper.init_database()
         self.docker_control.get_local_images(self.sql_wrapper)
+        self.container_pool.remove_stale()
+        self.runtime_estimator.load(self.sql_wrapper)
 
     def build_image(self):
         pass
@@ -53,67 +105,370 @@ class Task_Scheduler(object):
     def parse_new_request_from_xml(self, filepath):
         xml_parser = XMLParser(filepath)
         request = xml_parser.parse_xml()
+        request['xml_path'] = filepath
         gpu_device = self.gpu_monitor.get_gpu_from_model(request['gpu_model'])
         if gpu_device is None:
             farmer_log.error('Internal Fatal Error, Wrong GPU Model Name')
             raise Exception('Internal Fatal Error')
         # Add some keys request dicts
-        request['gpu_id'] = gpu_device.gpuid
+        # gpu_device shows one GPU of the model until the request leases its own
+        request['gpu_id'] = None
         request['gpu_device'] = gpu_device
-        request['history_temperature'] = []
-        request['history_freq'] = []
-        request['history_power'] = []
-        request['raw_buffer'] = bytearray()
+        request['submit_time'] = time.time()
+        request['start_time'] = None
+        request['finish_time'] = None
+        # the telemetry series is allocated when the request starts running
+        request['telemetry'] = None
+        request['raw_log'] = RequestLog(request['request_id'])
+        request['cache_checked'] = False
+        request['expected_runtime'] = self.runtime_estimator.predict(request)
         return request 
 
+    def set_state(self, request, state):
+        current = str(request['state'])
+        if str(state) not in self.__class__.TRANSITIONS[current]:
+            raise Exception('Request %s can not change from %s to %s' % (request['request_id'], current, state))
+        request['state'] = state
+        self.journal.record(request)
+        self.notify_state(request)
+
+    def add_state_listener(self, listener):
+        """
+            Args:
+                listener: function(request) called when a request is submitted or changes state,
+                          from the thread making the change
+        """
+        self.state_listeners.append(listener)
+
+    def notify_state(self, request):
+        for listener in list(self.state_listeners):
+            listener(request)
+
     def assign_request(self, filepath):
         """
             scheduler tries to assign one request to one specified GPU
         """
-        # This lock is to protect assign_request. There're multiple process/threads may execute assign requests.
-        # So I use one lock here for safety.
-        self.lock.acquire()
+        # the xml is parsed without the lock, self.lock only covers adding the request
+        # to self.requests, the journal and the pending queue
         request = self.parse_new_request_from_xml(filepath)
-        request["state"] = self.__class__.TASK_STATE.Pendding
-        self.requests[request['request_id']] = request
-        self.pending_requests.append(request)
-        self.lock.release()
-        t = threading.Thread(target=self.schedule)
-        t.start()
-
-    def schedule(self):
-        """
-            Only one thread can be run here
-        """
-        self.lock.acquire()
-        for request in self.pending_requests:
-            if self.request_runnable(request):
-                request['gpu_device'].blocked = True 
-                request["state"] = self.__class__.TASK_STATE.Running
-                self.test_start(request)
-                request['gpu_device'].blocked = False
+        with self.condition:
+            request["state"] = self.__class__.TASK_STATE.Pending
+            self.requests[request['request_id']] = request
+            self.journal.record(request)
+            self.notify_state(request)
+            # the dispatcher looks the results up, they are not queried on the caller's thread
+            self.pending_requests.append(request)
+            self.wake_dispatcher()
+
+    def finish_from_cache(self, request):
+        """
+            finish a pending request at once when all of its configurations are cached,
+            in the dispatcher thread
+            Returns:
+                True if the request is finished
+        """
+        image = self.get_image(request)
+        if image is None:
+            return False
+        configs = self.result_cache.get_configs(request, image.image_id, self.gpu_monitor.backend.get_driver_version())
+        cached = self.result_cache.lookup(request, configs)
+        if len(configs) == 0 or len(cached) < len(configs):
+            return False
+        if not self.save_results(request, 'cached', configs, [], cached):
+            return False
+        request['start_time'] = request['finish_time'] = time.time()
+        request['raw_log'].close()
+        with self.lock:
+            self.pending_requests.remove(request)
+            self.set_state(request, self.__class__.TASK_STATE.Finish)
+        farmer_log.info("request %s is served from the result cache" % request['request_id'])
+        self.evict(request)
+        return True
+
+    def recover(self):
+        """
+            rebuild the requests journaled by the last run of the server.
+            Pending requests are queued again. A request which was running when the
+            server stopped lost its container, it is finished when its results
+            reached the database and queued again otherwise. The finished requests
+            are only kept as stubs.
+        """
+        for record in self.journal.replay().values():
+            if record['state'] in ("Dispatched", "Running"):
+                if len(self.sql_wrapper.get_result_by_request_id(record['request_id'])) > 0:
+                    record['state'] = "Finish"
+                    record['finish_time'] = record['finish_time'] or time.time()
+                else:
+                    record['state'] = "Pending"
+                    record['start_time'] = None
+                    record['gpu_id'] = None
+                farmer_log.info("request %s was running, recovered as %s" % (record['request_id'], record['state']))
+            if record['state'] != "Pending":
+                record['telemetry'] = None
+                self.finished[record['request_id']] = record
+                continue
+            try:
+                request = self.load_request(record)
+            except Exception as e:
+                farmer_log.error("can't recover request %s [%s]" % (record['request_id'], e))
+                continue
+            self.requests[request['request_id']] = request
+            self.pending_requests.append(request)
+        while len(self.finished) > self.finished_requests:
+            self.finished.popitem(last=False)
+        self.compact_journal()
+
+    def load_request(self, record):
+        """
+            rebuild a request from its journal record or its stub
+        """
+        request = self.parse_new_request_from_xml(record['xml_path'])
+        for key in ('submit_time', 'start_time', 'finish_time', 'gpu_id'):
+            request[key] = record[key]
+        for gpu_device in self.gpu_monitor.gpulists:
+            if gpu_device.gpuid == request['gpu_id']:
+                request['gpu_device'] = gpu_device
+        request['state'] = getattr(self.__class__.TASK_STATE, record['state'])
+        if record['state'] in ("Finish", "Failure"):
+            request['telemetry'] = record.get('telemetry')
+            request['raw_log'].close()
+        return request
+
+    def evict(self, request):
+        """
+            replace a finished request by its stub: the journal fields, the state and
+            the trimmed telemetry. Only the finished_requests latest stubs are kept.
+        """
+        stub = self.journal.make_record(request)
+        stub['telemetry'] = request['telemetry']
+        with self.lock:
+            self.finished[request['request_id']] = stub
+            self.requests.pop(request['request_id'], None)
+            while len(self.finished) > self.finished_requests:
+                self.finished.popitem(last=False)
+        if self.journal.appended > self.journal_records:
+            self.compact_journal()
+
+    def compact_journal(self):
+        """
+            rewrite the journal with the requests in memory, the dropped stubs go away
+            self.lock is held until the journal is replaced, so a request submitted
+            meanwhile is journaled in the new file and not overwritten by it.
+        """
+        with self.lock:
+            requests = list(self.requests.values()) + list(self.finished.values())
+            self.journal.compact(sorted(requests, key=lambda request: request['submit_time']))
+
+    def find_request(self, request_id):
+        """
+            Returns:
+                the request, or the stub of a finished request, None if it is unknown
+                both have the journal fields, 'state' and 'telemetry'
+        """
+        request = self.requests.get(request_id)
+        if request is None:
+            request = self.finished.get(request_id)
+        return request
+
+    def get_request(self, request_id):
+        """
+            Returns:
+                the request, a finished request is rebuilt from its stub
+            Raises:
+                KeyError if the request is unknown
+        """
+        request = self.requests.get(request_id)
+        if request is not None:
+            return request
+        return self.load_request(self.finished[request_id])
+
+    def wake_dispatcher(self):
+        """
+            make the dispatcher run one more pass, the caller holds self.lock
+        """
+        self.dispatch_requested = True
+        self.condition.notify()
+
+    def dispatch_loop(self):
+        """
+            Only this thread leases GPUs. It wakes up on every new request and
+            every finished run, and every retry_interval seconds for GPUs
+            which were not idle yet.
+        """
+        while not self.stopped:
+            try:
+                self.dispatch()
+            except Exception as e:
+                farmer_log.error("dispatch error [%s]" % e)
+            with self.condition:
+                if not self.dispatch_requested:
+                    self.condition.wait(self.__class__.retry_interval)
+                self.dispatch_requested = False
+
+    def stop(self):
+        """
+            stop the dispatcher, the requests already running are not interrupted
+        """
+        with self.condition:
+            self.stopped = True
+            self.wake_dispatcher()
+        self.dispatcher.join()
+
+    def dispatch(self):
+        """
+            hand every pending request with a free GPU to a worker thread
+            Every request runs on one GPU, so when the first request of a GPU model
+            can't lease one, none of the following requests of the model can:
+            they are skipped until the next pass, there is nothing to backfill.
+            The idle checks of the GPUs may run nvidia-smi, so self.lock is only
+            held to commit a lease.
+        """
+        now = time.time()
+        busy_models = set()
+        for request in self.pending_requests.ordered(now):
+            if not request['cache_checked']:
+                request['cache_checked'] = True
+                if self.finish_from_cache(request):
+                    continue
+            if request['gpu_model'] in busy_models:
+                continue
+            gpu_device = self.lease_gpu(request)
+            if gpu_device is None:
+                busy_models.add(request['gpu_model'])
+                continue
+            with self.lock:
                 self.pending_requests.remove(request)
-        self.lock.release()
-                
+                request['gpu_device'] = gpu_device
+                request['gpu_id'] = gpu_device.gpuid
+                self.set_state(request, self.__class__.TASK_STATE.Dispatched)
+            worker = threading.Thread(target=self.run_request, args=(request, gpu_device),
+                                      name='gpu%d-worker' % gpu_device.gpuid)
+            worker.daemon = True
+            worker.start()
+
+    def run_request(self, request, gpu_device):
+        """
+            run one request on its leased GPU, in the worker thread of the GPU
+        """
+        request['telemetry'] = TelemetrySeries()
+        try:
+            request['start_time'] = time.time()
+            self.set_state(request, self.__class__.TASK_STATE.Running)
+            self.pending_requests.start(request, request['start_time'])
+            gpu_device.attach_series(request['telemetry'])
+            results = self.test_start(request)
+            request['finish_time'] = time.time()
+            self.update_average_runtime(request)
+            self.runtime_estimator.add_results(request['gpu_model'], results)
+            self.set_state(request, self.__class__.TASK_STATE.Finish)
+        except Exception as e:
+            farmer_log.error("request %s failed [%s]" % (request['request_id'], e))
+            request['finish_time'] = time.time()
+            self.set_state(request, self.__class__.TASK_STATE.Failure)
+        finally:
+            self.pending_requests.finish(request, request['finish_time'])
+            gpu_device.detach_series(request['telemetry'])
+            request['telemetry'].trim(self.__class__.history_points)
+            request['raw_log'].close()
+            self.gpu_monitor.release_gpu(gpu_device)
+            self.evict(request)
+            with self.condition:
+                self.wake_dispatcher()
     
-    def request_runnable(self, request):
-        return False if request['gpu_device'].blocked else True
+    def update_average_runtime(self, request):
+        runtime = request['finish_time'] - request['start_time']
+        average = self.average_runtime.get(request['gpu_model'])
+        self.average_runtime[request['gpu_model']] = runtime if average is None else 0.8 * average + 0.2 * runtime
+
+    def expected_runtime(self, request):
+        """
+            Returns:
+                the runtime predicted from history, or the average runtime of the GPU model
+        """
+        if request.get('expected_runtime') is not None:
+            return request['expected_runtime']
+        return self.average_runtime.get(request['gpu_model'], self.__class__.default_runtime)
+
+    def expected_free_time(self, gpu_device, now):
+        """
+            Returns:
+                when the GPU is expected to be free, now when it is not leased
+        """
+        request = self.requests.get(gpu_device.leased_request) if gpu_device.blocked else None
+        if request is None:
+            return now
+        start_time = request['start_time'] or now
+        return max(now, start_time + self.expected_runtime(request))
+
+    def get_queue_info(self):
+        """
+            get the running and pending requests, with queue position and estimated wait
+            The wait is simulated by handing the pending requests, in queue order, to the
+            GPU of their model which gets free first.
+            It runs on the IOLoop, so it doesn't take self.lock: the pending queue has
+            its own lock, and a request is removed from it before it is dispatched.
+            Returns:
+                list of dicts, running requests first, then pending ones in queue order
+        """
+        now = time.time()
+        pending = self.pending_requests.ordered(now)
+        running = [request for request in self.requests.values()
+                   if str(request['state']) in ("Dispatched", "Running")]
+        free_times = {}
+        for gpu_model in self.gpu_monitor.gpu_models_set:
+            free_times[gpu_model] = [self.expected_free_time(g, now) - now
+                                     for g in self.gpu_monitor.get_gpus_from_model(gpu_model)]
+            heapq.heapify(free_times[gpu_model])
+        result = []
+        for request in running:
+            result.append(self.make_queue_item(request, None, 0.0))
+        positions = {}
+        for request in pending:
+            times = free_times[request['gpu_model']]
+            start = heapq.heappop(times)
+            heapq.heappush(times, start + self.expected_runtime(request))
+            positions[request['gpu_model']] = positions.get(request['gpu_model'], 0) + 1
+            result.append(self.make_queue_item(request, positions[request['gpu_model']], start))
+        return result
+
+    def make_queue_item(self, request, position, estimated_wait):
+        item = {}
+        item['request_id'] = request['request_id']
+        item['email'] = request['email']
+        item['gpu_model'] = request['gpu_model']
+        item['priority'] = request['priority']
+        item['state'] = str(request['state'])
+        item['position'] = position
+        item['estimated_wait'] = int(estimated_wait)
+        item['expected_runtime'] = int(self.expected_runtime(request))
+        return item
+
+    def lease_gpu(self, request):
+        """
+            lease any free and idle GPU of the requested model
+        """
+        return self.gpu_monitor.lease_gpu(request['gpu_model'], request['request_id'],
+                                          lambda gpu_device: self.request_runnable(request, gpu_device))
+
+    def request_runnable(self, request, gpu_device):
+        return gpu_device.is_gpu_idle(self.idle_window)
     
-    def workload_run(self, container, request):
+    def workload_run(self, container, request, skip=()):
         gpuid = request['gpu_id']
         request_id = request['request_id']
-        gpuid = 1
         test_workload = None
         print(request['framework'])
         if request['framework'] == 'caffe':
-            test_workload = Caffe_Workload(container, request['request_id'], request['profiling'])
+            test_workload = Caffe_Workload(container.name, request['request_id'], request['profiling'])
         else:
-            test_workload = Tensorflow_Workload(container, request['request_id'], request['profiling']) 
-        test_workload.copy()
-        results = test_workload.run_batch(request['topology'], request['iterations'], request['batch_size'], gpuid, request['raw_buffer'], request['source'])
+            test_workload = Tensorflow_Workload(container.name, request['request_id'], request['profiling']) 
+        if test_workload.framework not in container.prepared:
+            test_workload.copy()
+            container.prepared.add(test_workload.framework)
+        results = test_workload.run_batch(request['topology'], request['iterations'], request['batch_size'], gpuid, request['raw_log'], request['source'], skip)
         return results; 
  
-    def test_start(self, request):
+    def get_image(self, request):
         index = self.docker_control.get_image_index(request['cuda_string'], request['cudnn_string'], request['caffe'], request['tensorflow'])
         if index == -1:
             # TODO
@@ -121,44 +476,84 @@ class Task_Scheduler(object):
             # TODO
             # docker control inert docker_image_info into database
             index = self.docker_control.get_image_index(request['cuda_string'], request['cudnn_string'], request['caffe'], request['tensorflow'])
-        request_id = request['request_id']
-        image = self.docker_control.get_image(index)
-        container = get_random_container()
-        execute(run_docker(container, image.repository, image.tag))
-        results = self.workload_run(container, request)
-        self.sql_wrapper.inert_item_in_request_reports(request_id, container,
+        if index == -1:
+            return None
+        return self.docker_control.get_image(index)
+
+    def test_start(self, request):
+        """
+            run the configurations of the request which are not cached
+            Returns:
+                the results measured in this run
+        """
+        image = self.get_image(request)
+        configs = self.result_cache.get_configs(request, image.image_id, self.gpu_monitor.backend.get_driver_version())
+        cached = self.result_cache.lookup(request, configs)
+        container_name = 'cached'
+        results = []
+        if len(cached) < len(configs):
+            container = self.container_pool.acquire(image, request['gpu_id'])
+            try:
+                results = self.workload_run(container, request, cached.keys())
+            except Exception:
+                self.container_pool.release(container, healthy=False)
+                raise
+            self.container_pool.release(container)
+            container_name = container.name
+        if not self.save_results(request, container_name, configs, results, cached):
+            raise Exception('Can not save the results of request %s' % request['request_id'])
+        return results
+
+    def save_results(self, request, container, configs, results, cached):
+        """
+            write the request report and its result rows in one transaction
+            Returns:
+                True if they are written
+        """
+        measured = dict(((result['topology'], result['batch_size']), result) for result in results)
+        rows = []
+        for (topology, batch_size, config_hash) in configs:
+            result = cached.get((topology, batch_size), measured.get((topology, batch_size)))
+            if result is None:
+                continue
+            rows.append((result['framework'],
+                         result['topology'],
+                         result['batch_size'],
+                         result['source'],
+                         result['iterations'],
+                         result['score'],
+                         result['training_images_per_second'],
+                         result['duration'],
+                         config_hash,
+                         (topology, batch_size) in cached))
+        return self.sql_wrapper.inert_request_with_results(request['request_id'], container,
            request["gpu_model"], request["email"], request["framework"],
-           request["topology"], request["batch_size"], request["iterations"])
-        for result in results:
-            self.sql_wrapper.inert_item_in_result_reports(\
-                request_id, \
-                container, \
-                request["gpu_model"], \
-                result['framework'], \
-                result['topology'],\
-                result['batch_size'],\
-                result['source'],\
-                result['iterations'],\
-                result['score'],\
-                result['training_images_per_second']
-            )
-        #execute(stop_docker(container))
-        request["state"] = self.__class__.TASK_STATE.Finish
-        return True
+           request["topology"], request["batch_size"], request["iterations"], rows)
 
     def response_gpu_state_request(self, request_id):
-        request = self.requests[request_id]
+        request = self.get_request(request_id)
         gpu_device = request['gpu_device']
-        return gpu_device.response_status_as_json(request)    
+        return gpu_device.response_status_as_json()    
 
-    def make_download_file(self, request_id):
-        dataMediator = self.sql_wrapper.get_result_by_request_id(request_id)
-        dataFrame = pandas.DataFrame(dataMediator.to_data_frame())
-        filename = request_id + ".xlsx"
-        dataFrame.to_excel("./xlsx/" + filename, index = False)
-        return filename
+    def get_request_history(self, request_id, start_time=None, end_time=None, resolution=None):
+        """
+            get the GPU telemetry sampled while the request is running
+            Args:
+                start_time, end_time: time window, None for the whole run
+                resolution: maximum number of points, None for all stored points
+        """
+        request = self.find_request(request_id)
+        if request is None:
+            raise KeyError(request_id)
+        if request['telemetry'] is None:
+            return TelemetrySeries.empty_range()
+        return request['telemetry'].get_range(start_time, end_time, resolution)
 
 if __name__ == "__main__":
     scheduler = Task_Scheduler()
     scheduler.assign_request(sys.argv[1])
+    request = list(scheduler.requests.values())[0]
+    while str(request['state']) not in ("Finish", "Failure"):
+        time.sleep(1)
     print("print buffer")
+    print(request['raw_log'].read())
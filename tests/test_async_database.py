@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+import threading
+import unittest
+import tornado.testing
+from async_database import AsyncDatabase
+
+
+class FakeStorage(object):
+    """
+        SQL_wrapper that blocks until released, keeps the threads of its queries
+    """
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.threads = []
+
+    def get_request_reports(self, count, older=None, newer=None, filters=None):
+        self.threads.append(threading.current_thread())
+        self.release.wait(5.0)
+        return (count, older, newer, filters)
+
+    def exists_mail(self, mail):
+        self.threads.append(threading.current_thread())
+        return mail == 'a@intel.com'
+
+
+class AsyncDatabaseTest(tornado.testing.AsyncTestCase):
+
+    def setUp(self):
+        tornado.testing.AsyncTestCase.setUp(self)
+        self.storage = FakeStorage()
+        self.database = AsyncDatabase(self.storage, 2)
+
+    def tearDown(self):
+        self.storage.release.set()
+        self.database.shutdown()
+        tornado.testing.AsyncTestCase.tearDown(self)
+
+    @tornado.testing.gen_test
+    def test_query_runs_off_the_ioloop(self):
+        self.storage.release.set()
+        result = yield self.database.get_request_reports(10, older=('2016-01-01 00:00:00', 3))
+        self.assertEqual(result, (10, ('2016-01-01 00:00:00', 3), None, None))
+        self.assertIsNot(self.storage.threads[0], threading.current_thread())
+
+    @tornado.testing.gen_test
+    def test_blocked_query_does_not_block_the_others(self):
+        pending = self.database.get_request_reports(10)
+        exists = yield self.database.exists_mail('a@intel.com')
+        self.assertTrue(exists)
+        self.assertFalse(pending.done())
+        self.storage.release.set()
+        yield pending
+
+    @tornado.testing.gen_test
+    def test_run(self):
+        result = yield self.database.run(sorted, [3, 1, 2])
+        self.assertEqual(result, [1, 2, 3])
+
+    @tornado.testing.gen_test
+    def test_error_is_raised_by_the_future(self):
+        with self.assertRaises(ValueError):
+            yield self.database.run(int, 'abc')
+
+    def test_max_workers(self):
+        self.assertEqual(self.database.max_workers, 2)
+        database = AsyncDatabase(self.storage)
+        self.assertEqual(database.max_workers, AsyncDatabase.max_workers)
+        database.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+import datetime
+import unittest
+from common import DataMediator, RequestObject, ResultObject
+
+RESULT_HEADER = ("REQUEST_ID", "DOCKER_ID", "GPU_MODEL", "FRAMEWORK", "TOPOLOGY", "BATCH_SIZE", "SOURCE",
+                 "ITERATION", "SCORE", "IMAGES_PRE_SEC", "MAIL_ADDRESS", "CACHED")
+
+
+def make_result(batch_size, cached=False):
+    return ('request_1', 'container_1', 'Tesla M40', 'Caffe', 'googlenet', batch_size, 'synthetic', 100,
+            '312.50', '156.25', 'a@intel.com', cached)
+
+
+class DataMediatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.results = DataMediator(RESULT_HEADER, [make_result(32), make_result(64, True)])
+
+    def test_columns(self):
+        self.assertEqual(len(self.results), 2)
+        self.assertEqual(self.results.column('BATCH_SIZE'), [32, 64])
+        self.assertEqual(self.results[1], make_result(64, True))
+        self.assertEqual(list(self.results), [make_result(32), make_result(64, True)])
+        self.assertEqual(list(self.results.select(('TOPOLOGY', 'CACHED'))),
+                         [('googlenet', False), ('googlenet', True)])
+
+    def test_append_extend_pop(self):
+        self.results.append(make_result(128))
+        self.results.extend([make_result(256)])
+        self.results.extend([])
+        self.assertEqual(self.results.column('BATCH_SIZE'), [32, 64, 128, 256])
+        self.assertEqual(self.results.pop(), make_result(256))
+        self.assertEqual(self.results.pop(0), make_result(32))
+        self.assertEqual(self.results.column('BATCH_SIZE'), [64, 128])
+
+    def test_empty(self):
+        results = DataMediator(RESULT_HEADER)
+        self.assertEqual(len(results), 0)
+        self.assertEqual(list(results), [])
+        self.assertEqual(len(DataMediator(())), 0)
+
+    def test_data_frame(self):
+        frame = self.results.to_data_frame()
+        self.assertEqual(sorted(frame.keys()), sorted(RESULT_HEADER))
+        self.assertIs(frame['SCORE'], self.results.column('SCORE'))
+
+    def test_result_objects(self):
+        objects = self.results.to_result_objects()
+        self.assertEqual([(item.batch_size, item.email, item.cached) for item in objects],
+                         [(32, 'a@intel.com', False), (64, 'a@intel.com', True)])
+        without_cached = DataMediator(RESULT_HEADER[:-1], [make_result(32)[:-1]])
+        self.assertFalse(without_cached.to_result_objects()[0].cached)
+
+    def test_request_objects(self):
+        request_time = datetime.datetime(2016, 11, 2, 10, 20, 30)
+        requests = DataMediator(DataMediator.REQUEST_FIELDS + ('id', ),
+                                [('request_1', 'container_1', 'Tesla M40', 'a@intel.com', 'caffe',
+                                  "['googlenet']", 32, 100, request_time, 7)])
+        objects = requests.to_request_objects()
+        self.assertEqual(objects[0].mail_addr, 'a@intel.com')
+        self.assertEqual(objects[0].request_time, request_time)
+        self.assertEqual(objects[0].profile_file, 'request_1.zip')
+
+    def test_objects_are_slotted(self):
+        for item in self.results.to_result_objects() + [RequestObject(*range(9))]:
+            self.assertFalse(hasattr(item, '__dict__'))
+            with self.assertRaises(AttributeError):
+                item.unknown = 1
+        self.assertIn('cached', ResultObject.__slots__)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+import unittest
+from fair_share import FairShareQueue, parse_weights
+
+
+def make_request(request_id, email, submit_time, priority=None):
+    request = {'request_id': request_id, 'email': email, 'submit_time': submit_time}
+    if priority is not None:
+        request['priority'] = priority
+    return request
+
+
+class FairShareQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = FairShareQueue()
+
+    def order(self, now):
+        return [request['request_id'] for request in self.queue.ordered(now)]
+
+    def test_default_priority(self):
+        request = make_request('request_1', 'a@intel.com', 0.0, priority='urgent')
+        self.queue.append(request)
+        self.assertEqual(request['priority'], FairShareQueue.default_class)
+        self.assertIn(request, self.queue)
+        self.queue.remove(request)
+        self.assertEqual(len(self.queue), 0)
+
+    def test_first_come_first_served(self):
+        for i in range(3):
+            self.queue.append(make_request('request_%d' % i, 'a@intel.com', float(i)))
+        self.assertEqual(self.order(10.0), ['request_0', 'request_1', 'request_2'])
+
+    def test_light_user_goes_first(self):
+        sweep = [make_request('sweep_%d' % i, 'a@intel.com', 0.0) for i in range(4)]
+        for request in sweep:
+            self.queue.append(request)
+        self.queue.start(sweep[0], now=0.0)
+        self.queue.remove(sweep[0])
+        self.queue.finish(sweep[0], now=7200.0)
+        self.queue.append(make_request('single', 'b@intel.com', 7000.0))
+        self.assertEqual(self.order(7200.0)[0], 'single')
+
+    def test_running_requests_are_charged(self):
+        request = make_request('request_1', 'a@intel.com', 0.0)
+        self.queue.start(request, now=0.0)
+        self.assertEqual(self.queue.get_usage('a@intel.com', 100.0), 100.0)
+        self.queue.finish(request, now=100.0)
+        self.assertAlmostEqual(self.queue.get_usage('a@intel.com', 100.0), 100.0)
+        self.assertAlmostEqual(self.queue.get_usage('a@intel.com', 100.0 + FairShareQueue.half_life), 50.0)
+
+    def test_priority_classes_and_aging(self):
+        self.queue.append(make_request('normal', 'b@intel.com', 7000.0))
+        self.queue.append(make_request('low', 'c@intel.com', 7200.0, priority='low'))
+        self.assertEqual(self.order(7200.0)[-1], 'low')
+        # the low priority request gets ahead of newer high priority requests in the end
+        self.queue.append(make_request('high', 'd@intel.com', 16200.0, priority='high'))
+        order = self.order(16200.0)
+        self.assertLess(order.index('low'), order.index('high'))
+
+    def test_weights(self):
+        queue = FairShareQueue(weights={'a@intel.com': 4.0})
+        for (email, request_id) in (('a@intel.com', 'heavy'), ('b@intel.com', 'light')):
+            request = make_request(request_id + '_run', email, 0.0)
+            queue.start(request, now=0.0)
+            queue.finish(request, now=1000.0)
+        queue.append(make_request('light', 'b@intel.com', 1000.0))
+        queue.append(make_request('heavy', 'a@intel.com', 1000.0))
+        # a used as much as b, with 4 times its share
+        self.assertEqual([request['request_id'] for request in queue.ordered(1000.0)], ['heavy', 'light'])
+
+    def test_shortest_job_first(self):
+        runtimes = {'long': 3000.0, 'short': 60.0}
+        queue = FairShareQueue(runtime=lambda request: runtimes[request['request_id']])
+        queue.append(make_request('long', 'a@intel.com', 0.0))
+        queue.append(make_request('short', 'b@intel.com', 10.0))
+        self.assertEqual([request['request_id'] for request in queue.ordered(20.0)], ['short', 'long'])
+
+    def test_runtime_does_not_cross_priority_classes(self):
+        runtimes = {'long_high': 3 * 3600.0, 'short_normal': 60.0, 'short_low': 60.0}
+        queue = FairShareQueue(runtime=lambda request: runtimes[request['request_id']])
+        queue.append(make_request('short_low', 'a@intel.com', 0.0, priority='low'))
+        queue.append(make_request('short_normal', 'b@intel.com', 0.0))
+        queue.append(make_request('long_high', 'c@intel.com', 0.0, priority='high'))
+        self.assertEqual([request['request_id'] for request in queue.ordered(0.0)],
+                         ['long_high', 'short_normal', 'short_low'])
+
+
+class ParseWeightsTest(unittest.TestCase):
+
+    def test_parse(self):
+        self.assertEqual(parse_weights('a@intel.com:2, b@intel.com:0.5,'), {'a@intel.com': 2.0, 'b@intel.com': 0.5})
+        self.assertEqual(parse_weights(''), {})
+
+    def test_malformed(self):
+        self.assertRaises(ValueError, parse_weights, 'a@intel.com')
+        self.assertRaises(ValueError, parse_weights, ':2')
+        self.assertRaises(ValueError, parse_weights, 'a@intel.com:heavy')
+        self.assertRaises(ValueError, parse_weights, 'a@intel.com:0')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+import os
+import unittest
+import gpu_backend
+from gpu_backend import FakeBackend, NvidiaSmiBackend, create_backend, square_wave_script
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+class FakePopen(object):
+    """
+        replaces os.popen, every command prints the fixture of the first matching key
+    """
+
+    def __init__(self, outputs):
+        self.outputs = outputs
+        self.commands = []
+
+    def __call__(self, command):
+        self.commands.append(command)
+        for (key, name) in self.outputs:
+            if key in command:
+                return open(os.path.join(FIXTURES, name))
+        raise AssertionError('unexpected command [%s]' % command)
+
+
+class NvidiaSmiBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.popen = gpu_backend.os.popen
+        self.backend = NvidiaSmiBackend()
+
+    def tearDown(self):
+        gpu_backend.os.popen = self.popen
+
+    def replay(self, *outputs):
+        gpu_backend.os.popen = FakePopen(outputs)
+        return gpu_backend.os.popen
+
+    def test_one_query_for_all_gpus(self):
+        popen = self.replay(('--query-gpu', 'query_gpu_4x_m40.csv'))
+        snapshots = self.backend.get_snapshots()
+        self.assertEqual(sorted(snapshots.keys()), [0, 1, 2, 3])
+        self.assertEqual(len(popen.commands), 1)
+        self.assertIn('--format=csv,noheader,nounits', popen.commands[0])
+        self.assertIsNone(snapshots[2].power)
+
+    def test_not_supported_fields(self):
+        self.replay(('--query-gpu', 'query_gpu_titan_x.csv'))
+        snapshots = self.backend.get_snapshots()
+        self.assertEqual(snapshots[0].core_frequency, [135, None, None, 1392])
+        self.assertIsNone(snapshots[1].temperature)
+
+    def test_running_process(self):
+        self.replay(('pmon', 'pmon_gpu0.txt'))
+        processes = self.backend.get_running_process(0)
+        self.assertEqual([(pid, command) for (pid, command, sm, mem) in processes],
+                         [('23145', 'caffe'), ('23188', 'python')])
+
+    def test_no_running_process(self):
+        self.replay(('pmon', 'pmon_idle.txt'))
+        self.assertEqual(self.backend.get_running_process(0), [])
+
+
+class FakeBackendTest(unittest.TestCase):
+
+    def test_controls(self):
+        backend = FakeBackend(2)
+        backend.set_frequency(1, 1114, 3004)
+        backend.set_autoboost(1, 0)
+        snapshot = backend.get_snapshots()[1]
+        self.assertEqual(snapshot.core_frequency[1], 1114)
+        self.assertEqual(snapshot.memory_frequency[1], 3004)
+        self.assertFalse(backend.get_autoboost(1))
+        self.assertTrue(backend.get_autoboost(0))
+
+    def test_square_wave(self):
+        backend = FakeBackend(1)
+        gpu = backend.gpus[0]
+        script = square_wave_script(period=10.0, busy_ratio=0.5)
+        script(gpu, 2.0)
+        self.assertEqual(gpu.sm_utilization, 0.97)
+        script(gpu, 7.0)
+        self.assertEqual(gpu.sm_utilization, 0.0)
+
+
+class CreateBackendTest(unittest.TestCase):
+
+    def test_names(self):
+        self.assertIsInstance(create_backend('fake'), FakeBackend)
+        self.assertIsInstance(create_backend('nvidia-smi'), NvidiaSmiBackend)
+        self.assertRaises(Exception, create_backend, 'cuda')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+import os
+import json
+import time
+import unittest
+import gpu_backend
+from gpu_backend import FakeBackend, NvidiaSmiBackend
+from gpu_control import GPUDevice, GPUMonitor
+from gpu_telemetry import GPUSnapshot, GPUTelemetryCollector, TelemetryRingBuffer, TelemetrySeries, \
+                          parse_query_output
+from tests.test_gpu_backend import FakePopen
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+class FixtureBackend(FakeBackend):
+    """
+        FakeBackend returning the snapshots of a recorded nvidia-smi query
+    """
+
+    def __init__(self, name):
+        FakeBackend.__init__(self, 2, 'GeForce GTX TITAN X')
+        with open(os.path.join(FIXTURES, name)) as fp:
+            self.lines = fp.readlines()
+
+    def get_snapshots(self):
+        return parse_query_output(self.lines)
+
+
+class GPUDeviceStatusTest(unittest.TestCase):
+
+    def setUp(self):
+        self.popen = gpu_backend.os.popen
+        gpu_backend.os.popen = FakePopen([('--query-gpu', 'query_gpu_4x_m40.csv'),
+                                          ('Auto Boost', 'autoboost_on.txt')])
+
+    def tearDown(self):
+        gpu_backend.os.popen = self.popen
+
+    def test_one_query_for_all_gpus(self):
+        collector = GPUTelemetryCollector(NvidiaSmiBackend(), max_age=60.0)
+        gpus = [GPUDevice('127.0.0.1', gpuid, collector) for gpuid in range(4)]
+        statuses = [json.loads(gpu.response_status_as_json()) for gpu in gpus]
+        queries = [command for command in gpu_backend.os.popen.commands if '--query-gpu' in command]
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(statuses[0]['gpu_model'], 'Tesla M40')
+        self.assertEqual(statuses[0]['sm_utilization'], '0.97')
+        self.assertEqual(statuses[0]['core_freq_ratio'], 100)
+        self.assertEqual(statuses[0]['autoboost'], 'On')
+        self.assertEqual(statuses[1]['instant_core_freq'], 324)
+        self.assertEqual(statuses[1]['application_mem_freq'], 3004)
+        self.assertIsNone(statuses[2]['power'])
+        self.assertEqual(statuses[3]['temperature'], 51)
+
+
+class GPUDeviceIdleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.gpu = GPUDevice('127.0.0.1', 0, GPUTelemetryCollector(FakeBackend(1)))
+        self.gpu.history = TelemetryRingBuffer(3)
+
+    def sample(self, age, sm_utilization=0.0):
+        self.gpu.history.append(GPUSnapshot(0, 'GPU-fake-0000', 'Tesla M40', [], [], sm_utilization, 0.0,
+                                            30, 15.0, time.time() - age))
+
+    def test_idle_for_the_window(self):
+        for age in (30.0, 20.0, 10.0):
+            self.sample(age)
+        self.assertTrue(self.gpu.is_gpu_idle(25.0))
+        self.sample(5.0, 0.97)
+        self.assertFalse(self.gpu.is_gpu_idle(25.0))
+
+    def test_history_shorter_than_the_window(self):
+        self.sample(2.0)
+        self.sample(1.0)
+        self.assertFalse(self.gpu.is_gpu_idle(60.0))
+        # the full history covers a window longer than itself
+        self.sample(0.0)
+        self.assertTrue(self.gpu.is_gpu_idle(60.0))
+
+
+class GPUMonitorSampleTest(unittest.TestCase):
+
+    def make_monitor(self, backend):
+        monitor = GPUMonitor(backend)
+        monitor.init_local_gpu_lists()
+        return monitor
+
+    def test_not_available_fields(self):
+        monitor = self.make_monitor(FixtureBackend('query_gpu_titan_x.csv'))
+        series = TelemetrySeries()
+        monitor.gpulists[1].attach_series(series)
+        monitor.sample()
+        status = json.loads(monitor.gpulists[1].response_status_as_json())
+        self.assertEqual(status['sm_utilization'], 'N/A')
+        self.assertEqual(status['mem_utilization'], 'N/A')
+        self.assertEqual(status['core_freq_ratio'], 0)
+        self.assertIsNone(status['temperature'])
+        self.assertEqual(len(monitor.gpulists[1].history), 1)
+        self.assertEqual(len(series), 1)
+        status = json.loads(monitor.gpulists[0].response_status_as_json())
+        self.assertEqual(status['sm_utilization'], '0.00')
+        self.assertEqual(status['temperature'], 41)
+
+    def test_bad_gpu_does_not_stop_the_others(self):
+        backend = FakeBackend(2)
+        monitor = self.make_monitor(backend)
+        monitor.gpulists[0].record = None
+        backend.gpus[1].temperature = 55
+        monitor.sample()
+        status = json.loads(monitor.gpulists[1].response_status_as_json())
+        self.assertEqual(status['temperature'], 55)
+
+
+if __name__ == '__main__':
+    unittest.main()
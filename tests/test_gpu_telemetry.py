@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+import os
+import unittest
+from gpu_backend import FakeBackend
+from gpu_telemetry import GPUSnapshot, GPUTelemetryCollector, TelemetryRingBuffer, TelemetrySeries, \
+                          parse_query_output
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name)) as fp:
+        return fp.readlines()
+
+
+def make_snapshot(timestamp):
+    return GPUSnapshot(0, None, None, [], [], 0.0, 0.0, 0, 0.0, float(timestamp))
+
+
+class ParseQueryOutputTest(unittest.TestCase):
+    """
+        output of "nvidia-smi --query-gpu=... --format=csv,noheader,nounits"
+    """
+
+    def test_multi_gpu(self):
+        snapshots = parse_query_output(read_fixture('query_gpu_4x_m40.csv'), 10.0)
+        self.assertEqual(sorted(snapshots.keys()), [0, 1, 2, 3])
+        snapshot = snapshots[0]
+        self.assertEqual(snapshot.gpu_uuid, 'GPU-3d0b4c5e-8a21-6a0f-1c2d-7e9f3b5a1c11')
+        self.assertEqual(snapshot.gpu_model, 'Tesla M40')
+        self.assertEqual(snapshot.core_frequency, [1114, 1114, 948, 1114])
+        self.assertEqual(snapshot.memory_frequency, [3004, 3004, 3004, 3004])
+        self.assertAlmostEqual(snapshot.sm_utilization, 0.97)
+        self.assertAlmostEqual(snapshot.memory_utilization, 0.61)
+        self.assertEqual(snapshot.temperature, 64)
+        self.assertEqual(snapshot.power, 187.53)
+        self.assertEqual(snapshot.timestamp, 10.0)
+        self.assertEqual(snapshots[1].core_frequency[0], 324)
+        self.assertEqual(snapshots[3].sm_utilization, 0.45)
+
+    def test_not_available_fields(self):
+        snapshots = parse_query_output(read_fixture('query_gpu_4x_m40.csv'), 10.0)
+        self.assertIsNone(snapshots[2].power)
+        self.assertEqual(snapshots[2].temperature, 30)
+
+    def test_not_supported_fields(self):
+        # older drivers don't support application clocks on GeForce boards
+        snapshots = parse_query_output(read_fixture('query_gpu_titan_x.csv'), 10.0)
+        self.assertEqual(snapshots[0].core_frequency, [135, None, None, 1392])
+        self.assertEqual(snapshots[0].memory_frequency, [405, None, None, 3505])
+        self.assertIsNone(snapshots[0].power)
+
+    def test_all_fields_not_available(self):
+        snapshot = parse_query_output(read_fixture('query_gpu_titan_x.csv'), 10.0)[1]
+        self.assertEqual(snapshot.core_frequency, [None, None, None, None])
+        self.assertIsNone(snapshot.sm_utilization)
+        self.assertIsNone(snapshot.temperature)
+
+    def test_blank_and_broken_lines_are_skipped(self):
+        snapshots = parse_query_output(read_fixture('query_gpu_titan_x.csv'), 10.0)
+        self.assertEqual(sorted(snapshots.keys()), [0, 1])
+
+
+class TelemetryRingBufferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.history = TelemetryRingBuffer(3)
+
+    def test_empty(self):
+        self.assertEqual(len(self.history), 0)
+        self.assertIsNone(self.history.latest())
+        self.assertIsNone(self.history.oldest())
+        self.assertEqual(self.history.slice(), [])
+
+    def test_oldest_entries_are_overwritten(self):
+        for timestamp in range(5):
+            self.history.append(make_snapshot(timestamp))
+        self.assertEqual(len(self.history), 3)
+        self.assertEqual(self.history.latest().timestamp, 4.0)
+        self.assertEqual(self.history.oldest().timestamp, 2.0)
+
+    def test_slice(self):
+        for timestamp in range(5):
+            self.history.append(make_snapshot(timestamp))
+        self.assertEqual([item.timestamp for item in self.history.slice()], [2.0, 3.0, 4.0])
+        self.assertEqual([item.timestamp for item in self.history.slice(3.0)], [3.0, 4.0])
+        self.assertEqual([item.timestamp for item in self.history.slice(0.0, 3.0)], [2.0, 3.0])
+        self.assertEqual(self.history.slice(5.0), [])
+
+
+class TelemetrySeriesTest(unittest.TestCase):
+
+    def fill(self, series, count):
+        for timestamp in range(count):
+            series.append(float(timestamp), {'freq': timestamp, 'temperature': 40, 'power': None})
+
+    def test_buckets_are_merged_in_pairs(self):
+        series = TelemetrySeries(4)
+        self.fill(series, 10)
+        self.assertLessEqual(len(series), 4)
+        self.assertEqual(series.bucket_samples, 4)
+        points = series.get_range()
+        self.assertEqual(points['timestamp'], [0.0, 4.0, 8.0])
+        self.assertEqual(points['freq'], [1.5, 5.5, 8.5])
+        self.assertEqual(points['freq_min'], [0.0, 4.0, 8.0])
+        self.assertEqual(points['freq_max'], [3.0, 7.0, 9.0])
+        self.assertEqual(points['temperature'], [40.0, 40.0, 40.0])
+
+    def test_unsupported_channel(self):
+        series = TelemetrySeries(4)
+        self.fill(series, 10)
+        points = series.get_range()
+        self.assertEqual(points['power'], [None, None, None])
+        self.assertEqual(points['power_min'], [None, None, None])
+
+    def test_missing_samples_are_skipped(self):
+        series = TelemetrySeries(2)
+        for (timestamp, power) in enumerate([None, 100.0, float('nan'), 120.0, 80.0]):
+            series.append(float(timestamp), {'freq': 1000, 'temperature': None, 'power': power})
+        points = series.get_range()
+        self.assertEqual(points['power'], [110.0, 80.0])
+        self.assertEqual(points['power_min'], [100.0, 80.0])
+        self.assertEqual(points['power_max'], [120.0, 80.0])
+        self.assertEqual(points['freq'], [1000.0, 1000.0])
+
+    def test_range_and_resolution(self):
+        series = TelemetrySeries(4)
+        self.fill(series, 10)
+        self.assertEqual(series.get_range(resolution=2)['freq'], [3.5, 8.5])
+        self.assertEqual(series.get_range(start_time=4.0)['timestamp'], [4.0, 8.0])
+        self.assertEqual(series.get_range(end_time=4.0)['timestamp'], [0.0, 4.0])
+
+    def test_trim(self):
+        series = TelemetrySeries(4)
+        self.fill(series, 10)
+        series.trim(2)
+        self.assertEqual(len(series), 2)
+        self.assertEqual(len(series.timestamps), 2)
+        self.assertEqual(len(series.sums['freq']), 2)
+        self.assertEqual(series.get_range()['freq'], [3.5, 8.5])
+
+    def test_empty_range(self):
+        self.assertEqual(TelemetrySeries(4).get_range(), TelemetrySeries.empty_range())
+        self.assertEqual(TelemetrySeries.empty_range()['freq_max'], [])
+
+
+class CountingBackend(FakeBackend):
+
+    def __init__(self):
+        FakeBackend.__init__(self, 2)
+        self.queries = 0
+
+    def get_snapshots(self):
+        self.queries += 1
+        return FakeBackend.get_snapshots(self)
+
+
+class GPUTelemetryCollectorTest(unittest.TestCase):
+
+    def test_one_query_for_all_gpus(self):
+        backend = CountingBackend()
+        collector = GPUTelemetryCollector(backend, max_age=60.0)
+        self.assertEqual(collector.get_snapshot(0).gpuid, 0)
+        self.assertEqual(collector.get_snapshot(1).gpuid, 1)
+        self.assertIsNone(collector.get_snapshot(2))
+        self.assertEqual(backend.queries, 1)
+
+    def test_refresh(self):
+        backend = CountingBackend()
+        collector = GPUTelemetryCollector(backend, max_age=60.0)
+        collector.get_snapshots()
+        collector.get_snapshots(refresh=True)
+        self.assertEqual(backend.queries, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
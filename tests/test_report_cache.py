@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+import unittest
+from report_cache import ReportCache
+from tests.test_sql_wrapper import StorageTestCase, make_row
+
+
+class ReportCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = ReportCache(2)
+        self.results = [1]
+        self.cache.put('request_1', self.results)
+        self.cache.put('request_2', [2])
+
+    def test_least_recently_used_is_dropped(self):
+        self.assertEqual(self.cache.get('request_1'), [1])
+        self.cache.put('request_3', [3])
+        self.assertNotIn('request_2', self.cache)
+        self.assertIn('request_1', self.cache)
+        self.assertEqual(len(self.cache), 2)
+
+    def test_artifacts(self):
+        self.cache.put_artifact('request_1', 'xlsx', 'request_1.xlsx', self.results)
+        self.assertEqual(self.cache.get_artifact('request_1', 'xlsx'), 'request_1.xlsx')
+        self.assertIsNone(self.cache.get_artifact('request_1', 'csv'))
+
+    def test_artifact_of_other_results_is_not_kept(self):
+        self.cache.put_artifact('request_2', 'xlsx', 'request_2.xlsx', [2])
+        self.assertIsNone(self.cache.get_artifact('request_2', 'xlsx'))
+
+    def test_artifacts_are_dropped_with_the_results(self):
+        self.cache.put_artifact('request_1', 'xlsx', 'request_1.xlsx', self.results)
+        self.cache.put('request_1', [1, 1])
+        self.assertIsNone(self.cache.get_artifact('request_1', 'xlsx'))
+        self.cache.invalidate('request_1')
+        self.assertIsNone(self.cache.get('request_1'))
+
+    def test_disabled(self):
+        cache = ReportCache(0)
+        cache.put('request_1', [1])
+        self.assertIsNone(cache.get('request_1'))
+
+    def test_metrics(self):
+        self.cache.get('request_1')
+        self.cache.get('request_9')
+        metrics = self.cache.get_metrics()
+        self.assertEqual((metrics['hits'], metrics['misses'], metrics['entries']), (1, 1, 2))
+
+
+class ReadThroughTest(StorageTestCase):
+
+    def test_results_are_cached(self):
+        self.insert_request('request_1', [make_row('googlenet', 32)])
+        results = self.storage.get_result_by_request_id('request_1')
+        self.assertIs(self.storage.get_result_by_request_id('request_1'), results)
+        self.assertEqual(self.storage.report_cache.get_metrics()['hits'], 1)
+
+    def test_new_rows_invalidate(self):
+        self.insert_request('request_1', [make_row('googlenet', 32)])
+        self.storage.get_result_by_request_id('request_1')
+        self.storage.inert_item_in_result_reports('request_1', 'container_1', 'Tesla M40', 'Caffe', 'googlenet',
+                                                  64, 'synthetic', 100, 300.0, 150.0)
+        self.assertNotIn('request_1', self.storage.report_cache)
+        self.assertEqual(self.storage.get_result_by_request_id('request_1').column('BATCH_SIZE'), [32, 64])
+
+    def test_request_without_results_is_not_cached(self):
+        self.insert_request('request_1', [])
+        self.assertEqual(len(self.storage.get_result_by_request_id('request_1')), 0)
+        self.assertNotIn('request_1', self.storage.report_cache)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+import os
+import csv
+import unittest
+from report_export import ReportExporter
+from tests.test_sql_wrapper import StorageTestCase, make_row
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+
+class ReportExporterTest(StorageTestCase):
+
+    def setUp(self):
+        StorageTestCase.setUp(self)
+        self.exporter = ReportExporter(self.storage, os.path.join(self.directory, 'reports'))
+        self.insert_request('request_1', [make_row('googlenet', 32), make_row('googlenet', 64)])
+        self.insert_request('request_2', [make_row(u'r\xe9snet', 32)])
+
+    def read_csv(self, path):
+        with open(path, 'rb') as fp:
+            return list(csv.reader(fp))
+
+    def test_csv(self):
+        rows = self.read_csv(self.exporter.export(['request_1'], 'csv'))
+        self.assertEqual(rows[0][:3], ['REQUEST_ID', 'DOCKER_ID', 'GPU_MODEL'])
+        self.assertEqual([row[5] for row in rows[1:]], ['32', '64'])
+
+    def test_requests_in_one_file(self):
+        rows = self.read_csv(self.exporter.export(['request_1', 'request_2'], 'csv'))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[3][4], u'r\xe9snet'.encode('utf-8'))
+
+    def test_rendered_once(self):
+        path = self.exporter.export(['request_1'], 'csv')
+        os.utime(path, (0, 0))
+        self.assertEqual(self.exporter.export(['request_1'], 'csv'), path)
+        self.assertEqual(os.stat(path).st_mtime, 0)
+        self.assertNotEqual(self.exporter.export(['request_1', 'request_2'], 'csv'), path)
+        self.assertEqual(len(os.listdir(self.exporter.directory)), 2)
+
+    def test_new_results_change_the_digest(self):
+        path = self.exporter.export(['request_1'], 'csv')
+        self.storage.inert_item_in_result_reports('request_1', 'container_1', 'Tesla M40', 'Caffe', 'googlenet',
+                                                  128, 'synthetic', 100, 300.0, 150.0)
+        self.assertNotEqual(self.exporter.export(['request_1'], 'csv'), path)
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            self.exporter.export(['request_1'], 'pdf')
+        with self.assertRaises(LookupError):
+            self.exporter.export(['request_9'], 'csv')
+        with self.assertRaises(LookupError):
+            self.exporter.export([], 'csv')
+
+    def test_failed_write_leaves_no_file(self):
+        def write_csv(path, request_ids):
+            raise IOError('disk full')
+        self.exporter.write_csv = write_csv
+        with self.assertRaises(IOError):
+            self.exporter.export(['request_1'], 'csv')
+        self.assertEqual(os.listdir(self.exporter.directory), [])
+
+    @unittest.skipIf(openpyxl is None, 'openpyxl is not installed')
+    def test_xlsx(self):
+        path = self.exporter.export(['request_1', 'request_2'], 'xlsx')
+        sheet = openpyxl.load_workbook(path).active
+        self.assertEqual(sheet.max_row, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+import os
+import shutil
+import tempfile
+import unittest
+from request_journal import RequestJournal
+
+
+def make_request(request_id, state, submit_time=1.0):
+    return {'request_id': request_id, 'xml_path': 'xml/%s.xml' % request_id, 'submit_time': submit_time,
+            'start_time': None, 'finish_time': None, 'gpu_id': None, 'state': state, 'raw_log': object()}
+
+
+class RequestJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'requests.journal')
+        self.journal = RequestJournal(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_empty(self):
+        self.assertEqual(list(self.journal.replay().keys()), [])
+
+    def test_last_record_wins(self):
+        request = make_request('request_1', 'Pending')
+        self.journal.record(request)
+        request['state'] = 'Running'
+        request['gpu_id'] = 1
+        self.journal.record(request)
+        self.journal.record(make_request('request_2', 'Pending', 2.0))
+        records = self.journal.replay()
+        self.assertEqual(list(records.keys()), ['request_1', 'request_2'])
+        self.assertEqual(records['request_1']['state'], 'Running')
+        self.assertEqual(records['request_1']['gpu_id'], 1)
+        self.assertNotIn('raw_log', records['request_1'])
+        self.assertEqual(self.journal.appended, 3)
+
+    def test_broken_line_is_skipped(self):
+        self.journal.record(make_request('request_1', 'Pending'))
+        with open(self.path, 'a') as fp:
+            fp.write('{"request_id": "request_2", "sta')
+        self.assertEqual(list(self.journal.replay().keys()), ['request_1'])
+
+    def test_compact(self):
+        request = make_request('request_1', 'Pending')
+        for state in ('Pending', 'Dispatched', 'Running'):
+            request['state'] = state
+            self.journal.record(request)
+        self.journal.compact([request])
+        self.assertEqual(len(open(self.path).readlines()), 1)
+        self.assertEqual(self.journal.appended, 0)
+        request['state'] = 'Finish'
+        self.journal.record(request)
+        self.assertEqual(self.journal.replay()['request_1']['state'], 'Finish')
+
+
+if __name__ == '__main__':
+    unittest.main()
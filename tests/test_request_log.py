@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+import os
+import shutil
+import tempfile
+import unittest
+from request_log import RequestLog
+
+
+class RequestLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.log = RequestLog('request_1', self.directory)
+        self.log.tail_size = 16
+        for i in range(100):
+            self.log.extend(('line %02d\n' % i).encode('ascii'))
+
+    def tearDown(self):
+        self.log.close()
+        shutil.rmtree(self.directory)
+
+    def test_bounded_tail(self):
+        self.assertEqual(len(self.log), 800)
+        self.assertLessEqual(len(self.log.tail), 2 * self.log.tail_size)
+
+    def test_read(self):
+        self.assertEqual(self.log.read(0, 8), b'line 00\n')
+        self.assertEqual(self.log.read(792), b'line 99\n')
+        self.assertEqual(self.log.read(800), b'')
+        self.assertEqual(self.log.get_tail(8), b'line 99\n')
+
+    def test_closed_log_is_read_from_the_file(self):
+        self.log.close()
+        self.assertTrue(self.log.closed)
+        self.assertIsNone(self.log.tail)
+        self.assertEqual(self.log.read(792), b'line 99\n')
+        self.assertEqual(self.log.read(400, 8), b'line 50\n')
+
+    def test_reopen(self):
+        self.log.close()
+        self.assertEqual(len(RequestLog('request_1', self.directory)), 800)
+
+    def test_listeners(self):
+        calls = []
+        self.log.add_listener(lambda: calls.append(self.log.closed))
+        self.log.extend(b'more\n')
+        self.log.extend(b'')
+        self.log.close()
+        self.assertEqual(calls, [False, True])
+        self.assertEqual(self.log.listeners, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
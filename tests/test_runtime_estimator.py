@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+import unittest
+from common import DataMediator
+from runtime_estimator import RuntimeEstimator
+
+
+class FakeStorage(object):
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def get_runtime_history(self, count):
+        history = DataMediator(["GPU_MODEL", "FRAMEWORK", "TOPOLOGY", "BATCH_SIZE", "ITERATION", "DURATION"])
+        history.extend(self.rows[:count])
+        return history
+
+
+class RuntimeEstimatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.estimator = RuntimeEstimator()
+        self.estimator.add_sample('Tesla M40', 'Caffe', 'googlenet', 32, 100, 40.0)
+        self.estimator.add_sample('Tesla M40', 'Caffe', 'googlenet', 64, 100, 82.0)
+        self.estimator.add_sample('Tesla M40', 'Caffe', 'googlenet', 32, 1000, 390.0)
+
+    def test_nearest_match_is_scaled(self):
+        self.estimator.neighbours = 1
+        self.assertEqual(self.estimator.predict_config('Tesla M40', 'caffe', 'googlenet', 32, 200), 80.0)
+
+    def test_no_history(self):
+        self.assertIsNone(self.estimator.predict_config('Tesla M40', 'caffe', 'vgg_19', 32, 200))
+        self.assertIsNone(self.estimator.predict_config('Tesla P100', 'caffe', 'googlenet', 32, 100))
+
+    def test_invalid_samples_are_ignored(self):
+        self.estimator.add_sample('Tesla M40', 'Caffe', 'vgg_19', 32, 100, 0.0)
+        self.estimator.add_results('Tesla M40', [{'framework': 'Caffe', 'topology': 'vgg_19',
+                                                  'batch_size': 32, 'iterations': 100}])
+        self.assertIsNone(self.estimator.predict_config('Tesla M40', 'caffe', 'vgg_19', 32, 100))
+
+    def test_request(self):
+        self.estimator.neighbours = 1
+        request = {'gpu_model': 'Tesla M40', 'framework': 'caffe', 'topology': ['googlenet'],
+                   'batch_size': 0, 'iterations': 100}
+        # the default batch sizes of googlenet are 32 and 1
+        self.assertEqual(self.estimator.predict(request), self.estimator.setup_overhead + 40.0 + 40.0 / 32)
+        request['topology'] = ['googlenet', 'vgg_19']
+        self.assertIsNone(self.estimator.predict(request))
+
+    def test_load(self):
+        estimator = RuntimeEstimator()
+        estimator.load(FakeStorage([('Tesla M40', 'Caffe', 'vgg_19', 32, 100, 120.0)]))
+        self.assertEqual(estimator.predict_config('Tesla M40', 'caffe', 'vgg_19', 32, 100), 120.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+import os
+import shutil
+import tempfile
+import unittest
+from schema_migrations import MIGRATIONS, migrate
+from sqlite_wrapper import Sqlite_wrapper
+
+
+class RecordingCursor(object):
+    """
+        cursor of a database without any table, keeps the statements
+    """
+
+    def __init__(self, version=None):
+        self.version = version
+        self.statements = []
+        self.row = None
+
+    def execute(self, sql, args=None):
+        self.statements.append(' '.join(sql.split()))
+        self.row = (self.version, ) if sql.startswith("SELECT MAX(VERSION)") else None
+        if sql.startswith("INSERT INTO schema_version"):
+            self.version = args[0]
+
+    def fetchone(self):
+        return self.row
+
+
+class RecordingStorage(object):
+
+    def __init__(self):
+        self.steps = []
+
+    def add_column_if_missing(self, table, column, definition, cursor):
+        self.steps.append(('column', table, column))
+
+    def add_index_if_missing(self, table, index, columns, cursor):
+        self.steps.append(('index', table, index))
+
+
+class MigrateTest(unittest.TestCase):
+
+    def test_from_version_0(self):
+        storage = RecordingStorage()
+        cursor = RecordingCursor()
+        self.assertEqual(migrate(storage, cursor), MIGRATIONS[-1][0])
+        self.assertIn(('column', 'result_reports', 'CONFIG_HASH'), storage.steps)
+        self.assertIn(('index', 'request_reports', 'idx_request_reports_request_time'), storage.steps)
+        self.assertTrue([sql for sql in cursor.statements if sql.startswith('ALTER TABLE request_reports')])
+
+    def test_latest_version_is_not_upgraded(self):
+        storage = RecordingStorage()
+        cursor = RecordingCursor(MIGRATIONS[-1][0])
+        migrate(storage, cursor)
+        self.assertEqual(storage.steps, [])
+
+    def test_created_version_skips_older_migrations(self):
+        storage = RecordingStorage()
+        cursor = RecordingCursor()
+        migrate(storage, cursor, created_version=2)
+        self.assertNotIn(('column', 'result_reports', 'CONFIG_HASH'), storage.steps)
+        self.assertIn(('index', 'accounts', 'idx_accounts_mail'), storage.steps)
+
+
+class SqliteMigrationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'farm.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def query(self, storage, sql):
+        cursor = storage.cursor()
+        try:
+            cursor.execute(sql)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def test_indexes_and_version(self):
+        storage = Sqlite_wrapper(self.path)
+        storage.init_database()
+        indexes = [row[1] for row in self.query(storage, "PRAGMA index_list(request_reports);")]
+        self.assertIn('idx_request_reports_request_time', indexes)
+        self.assertIn('idx_request_reports_mail_time', indexes)
+        versions = [row[0] for row in self.query(storage, "SELECT VERSION FROM schema_version ORDER BY VERSION;")]
+        self.assertEqual(versions, [2, 3, 4])
+
+    def test_init_again(self):
+        Sqlite_wrapper(self.path).init_database()
+        storage = Sqlite_wrapper(self.path)
+        storage.init_database()
+        self.assertEqual(len(self.query(storage, "SELECT VERSION FROM schema_version;")), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
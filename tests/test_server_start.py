@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import unittest
+import tornado.gen
+import tornado.web
+import tornado.testing
+import tornado.websocket
+import tornado.httpclient
+from async_database import AsyncDatabase
+from sqlite_wrapper import Sqlite_wrapper
+from tests.test_task_scheduler import REQUEST_XML, FakeScheduler
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+# server_start makes its working directories on import, keep them out of the tree
+CWD = os.getcwd()
+WORK_DIRECTORY = tempfile.mkdtemp()
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(WORK_DIRECTORY)
+try:
+    import server_start
+finally:
+    os.chdir(CWD)
+    sys.path.pop(0)
+
+COOKIE_SECRET = 'test-cookie-secret'
+
+
+def tearDownModule():
+    shutil.rmtree(WORK_DIRECTORY)
+
+
+class ServerTestCase(tornado.testing.AsyncHTTPTestCase):
+    """
+        the handlers of server_start on a FakeScheduler, signed in as a@intel.com
+        Attributes:
+            handlers: routes of the application under test
+    """
+    handlers = []
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp()
+        # the request logs and the reports are written in the working directory
+        os.chdir(self.directory)
+        FakeScheduler.runnable = True
+        self.scheduler = FakeScheduler('fake', 0.0, os.path.join(self.directory, 'requests.journal'),
+                                       Sqlite_wrapper(os.path.join(self.directory, 'farm.db')))
+        server_start.scheduler = self.scheduler
+        server_start.database = AsyncDatabase(self.scheduler.sql_wrapper, 2)
+        tornado.testing.AsyncHTTPTestCase.setUp(self)
+
+    def tearDown(self):
+        tornado.testing.AsyncHTTPTestCase.tearDown(self)
+        self.scheduler.stop()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def get_app(self):
+        return tornado.web.Application(self.handlers, cookie_secret=COOKIE_SECRET, login_url='/sign_in')
+
+    def sign_in(self, headers=None):
+        headers = dict(headers or {})
+        mail = tornado.web.create_signed_value(COOKIE_SECRET, 'mail', 'a@intel.com')
+        headers['Cookie'] = 'mail=%s' % mail.decode('ascii')
+        return headers
+
+    def fetch_signed(self, path, **kwargs):
+        kwargs['headers'] = self.sign_in(kwargs.get('headers'))
+        return self.fetch(path, **kwargs)
+
+    def write_request(self, request_id, **kwargs):
+        path = os.path.join(self.directory, '%s.xml' % request_id)
+        values = {'request_id': request_id, 'email': 'a@intel.com', 'profiling': 'false', 'force_rerun': 'true'}
+        values.update(kwargs)
+        with open(path, 'w') as fp:
+            fp.write(REQUEST_XML % values)
+        return path
+
+    def run_request(self, request_id, output=b'', **kwargs):
+        """
+            run one request to its end on the FakeScheduler
+        """
+        self.scheduler.output = output
+        self.scheduler.assign_request(self.write_request(request_id, **kwargs))
+        for _ in range(1000):
+            if request_id in self.scheduler.finished:
+                return self.scheduler.finished[request_id]
+            time.sleep(0.01)
+        self.fail('request %s did not finish' % request_id)
+
+
+def parse_events(body):
+    """
+        Returns:
+            list of dicts of the fields of every Server-Sent Event
+    """
+    events = []
+    for block in body.split('\n\n'):
+        fields = {}
+        for line in block.split('\n'):
+            if line and not line.startswith(':'):
+                (name, _, value) = line.partition(': ')
+                fields[name] = value
+        if fields:
+            events.append(fields)
+    return events
+
+
+class LogOffsetTest(unittest.TestCase):
+
+    def test_parse_offset(self):
+        self.assertEqual(server_start.parse_offset('12'), 12)
+        self.assertEqual(server_start.parse_offset('-5'), 0)
+        with self.assertRaises(tornado.web.HTTPError) as context:
+            server_start.parse_offset('abc')
+        self.assertEqual(context.exception.status_code, 400)
+
+    def test_utf8_prefix(self):
+        data = u'caf\xe9 \u6d4b'.encode('utf-8')
+        self.assertEqual(server_start.utf8_prefix(data), data)
+        self.assertEqual(server_start.utf8_prefix(data[:-1]), data[:-3])
+        self.assertEqual(server_start.utf8_prefix(data[:-2]), data[:-3])
+        self.assertEqual(server_start.utf8_prefix(data[:4]), b'caf')
+        self.assertEqual(server_start.utf8_prefix(b''), b'')
+
+
+class RawLogTest(ServerTestCase):
+    handlers = [(r'/rawlog', server_start.TestRawLogResponse),
+                (r'/rawlogstream', server_start.TestRawLogStream)]
+
+    def test_read_from_offset(self):
+        self.run_request('request_1', b'line 1\nline 2\n')
+        self.assertEqual(self.fetch('/rawlog?request=request_1&offset=7').body, b'line 2\n')
+        self.assertEqual(self.fetch('/rawlog?request=request_1&offset=-5').body, b'line 1\nline 2\n')
+        self.assertEqual(self.fetch('/rawlog?request=request_1&offset=abc').code, 400)
+        self.assertEqual(self.fetch('/rawlog?request=request_2&offset=0').code, 404)
+
+    def test_stream(self):
+        self.run_request('request_1', b'line 1\nline 2\n')
+        events = parse_events(self.fetch('/rawlogstream?request=request_1').body)
+        self.assertEqual(events[0], {'id': '14', 'data': json.dumps('line 1\nline 2\n')})
+        self.assertEqual(events[-1]['event'], 'end')
+        events = parse_events(self.fetch('/rawlogstream?request=request_1',
+                                         headers={'Last-Event-ID': '7'}).body)
+        self.assertEqual(events[0], {'id': '14', 'data': json.dumps('line 2\n')})
+        response = self.fetch('/rawlogstream?request=request_1', headers={'Last-Event-ID': 'x'})
+        self.assertEqual(response.code, 400)
+
+    def test_stream_does_not_split_characters(self):
+        self.run_request('request_1', u'a\xe9\n'.encode('utf-8'))
+        chunk_size = server_start.TestRawLogStream.CHUNK_SIZE
+        server_start.TestRawLogStream.CHUNK_SIZE = 2
+        try:
+            events = parse_events(self.fetch('/rawlogstream?request=request_1').body)
+        finally:
+            server_start.TestRawLogStream.CHUNK_SIZE = chunk_size
+        text = u''.join(json.loads(event['data']) for event in events if 'id' in event)
+        self.assertEqual(text, u'a\xe9\n')
+
+
+class PushChannelTest(ServerTestCase):
+    handlers = [(r'/push', server_start.PushChannel)]
+
+    def setUp(self):
+        ServerTestCase.setUp(self)
+        server_start.push_hub = server_start.PushHub()
+
+    def connect(self, signed_in=True):
+        url = 'ws://127.0.0.1:%d/push' % self.get_http_port()
+        headers = self.sign_in() if signed_in else {}
+        return tornado.websocket.websocket_connect(tornado.httpclient.HTTPRequest(url, headers=headers))
+
+    @tornado.gen.coroutine
+    def subscribe(self, socket, topic):
+        socket.write_message(json.dumps({'subscribe': topic}))
+        message = yield socket.read_message()
+        raise tornado.gen.Return(json.loads(message))
+
+    @tornado.testing.gen_test
+    def test_not_signed_in(self):
+        socket = yield self.connect(signed_in=False)
+        message = yield socket.read_message()
+        self.assertIsNone(message)
+
+    @tornado.testing.gen_test
+    def test_request_state(self):
+        self.run_request('request_1')
+        socket = yield self.connect()
+        message = yield self.subscribe(socket, 'request:request_1')
+        self.assertEqual(message['state'], 'Finish')
+        socket.close()
+
+    @tornado.testing.gen_test
+    def test_gpu_status_changes(self):
+        monitor = self.scheduler.gpu_monitor
+        monitor.sample()
+        socket = yield self.connect()
+        message = yield self.subscribe(socket, 'gpu:0')
+        self.assertEqual(message['status']['temperature'], 30)
+        # nothing changed since the full status
+        monitor.sample()
+        server_start.push_hub.on_sample()
+        monitor.backend.gpus[0].temperature = 55
+        monitor.sample()
+        server_start.push_hub.on_sample()
+        message = json.loads((yield socket.read_message()))
+        self.assertEqual(message, {'topic': 'gpu:0', 'status': {'temperature': 55}})
+        socket.close()
+
+    @tornado.testing.gen_test
+    def test_tasks(self):
+        self.scheduler.runnable = False
+        socket = yield self.connect()
+        message = yield self.subscribe(socket, 'tasks')
+        self.assertEqual(message['queue'], [])
+        self.scheduler.assign_request(self.write_request('request_1'))
+        server_start.push_hub.on_state('request_1')
+        message = json.loads((yield socket.read_message()))
+        self.assertEqual([item['request_id'] for item in message['queue']], ['request_1'])
+        socket.close()
+
+
+class HistoryTest(ServerTestCase):
+    handlers = [(r'/history', server_start.TestHistory)]
+
+    def test_not_signed_in(self):
+        response = self.fetch('/history', follow_redirects=False)
+        self.assertEqual(response.code, 302)
+
+    def test_filters(self):
+        self.run_request('request_1')
+        response = self.fetch_signed('/history?email=a%40intel.com')
+        self.assertEqual(response.code, 200)
+        self.assertIn(b'request_1', response.body)
+        self.assertIn(b'email=a%40intel.com', response.body)
+
+    def test_non_ascii_filter(self):
+        self.run_request('request_1')
+        response = self.fetch_signed('/history?topology=r%C3%A9snet')
+        self.assertEqual(response.code, 200)
+        self.assertNotIn(b'request_1', response.body)
+        self.assertIn(b'topology=r%C3%A9snet', response.body)
+
+    def test_bad_cursor(self):
+        self.assertEqual(self.fetch_signed('/history?older=yesterday').code, 400)
+        self.assertEqual(self.fetch_signed('/history?date_from=yesterday').code, 400)
+
+
+class DownloadTest(ServerTestCase):
+
+    def get_app(self):
+        os.mkdir(os.path.join(self.directory, 'binaries'))
+        with open(os.path.join(self.directory, 'binaries', 'hpl.tar'), 'wb') as fp:
+            fp.write(b'0123456789')
+        self.handlers = [(r'/hpc_download', server_start.HPCBinariesDownloader,
+                          {'path': os.path.join(self.directory, 'binaries')}),
+                         (r'/download', server_start.ResultReportDownloader,
+                          {'path': self.scheduler.report_exporter.directory})]
+        return ServerTestCase.get_app(self)
+
+    def test_not_signed_in(self):
+        response = self.fetch('/hpc_download?binary=hpl.tar', follow_redirects=False)
+        self.assertEqual(response.code, 302)
+
+    def test_binary(self):
+        response = self.fetch_signed('/hpc_download?binary=hpl.tar')
+        self.assertEqual(response.body, b'0123456789')
+        self.assertEqual(response.headers['Content-Disposition'], 'attachment; filename=hpl.tar')
+        response = self.fetch_signed('/hpc_download?binary=hpl.tar',
+                                     headers={'If-None-Match': response.headers['Etag']})
+        self.assertEqual(response.code, 304)
+
+    def test_range(self):
+        response = self.fetch_signed('/hpc_download?binary=hpl.tar', headers={'Range': 'bytes=4-6'})
+        self.assertEqual(response.code, 206)
+        self.assertEqual(response.body, b'456')
+
+    def test_invalid_names(self):
+        for name in ('..%2Ffarm.db', '.hidden', 'missing.tar', ''):
+            self.assertEqual(self.fetch_signed('/hpc_download?binary=%s' % name).code, 404)
+
+    def insert_results(self):
+        self.scheduler.sql_wrapper.inert_request_with_results(
+            'request_2', 'container_1', 'Tesla M40', 'a@intel.com', 'caffe', ['googlenet'], 32, 100,
+            [('Caffe', 'googlenet', 32, 'synthetic', 100, 312.5, 156.25, 12.0, '', False)])
+
+    def test_results(self):
+        self.insert_results()
+        response = self.fetch_signed('/download?request=request_2&format=csv')
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.headers['Content-Disposition'], 'attachment; filename=request_2.csv')
+        self.assertIn(b'googlenet', response.body)
+        etag = response.headers['Etag']
+        response = self.fetch_signed('/download?request=request_2&format=csv', headers={'If-None-Match': etag})
+        self.assertEqual(response.code, 304)
+
+    @unittest.skipIf(openpyxl is None, 'openpyxl is not installed')
+    def test_results_default_format(self):
+        self.insert_results()
+        response = self.fetch_signed('/download?request=request_2')
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.headers['Content-Disposition'], 'attachment; filename=request_2.xlsx')
+
+    def test_results_errors(self):
+        self.assertEqual(self.fetch_signed('/download?request=request_9&format=csv').code, 404)
+        self.assertEqual(self.fetch_signed('/download?request=request_9&format=pdf').code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
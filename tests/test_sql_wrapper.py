@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from sql_wrapper import ConnectionPool, PooledCursor
+from sqlite_wrapper import Sqlite_wrapper
+
+
+class FakeCursor(object):
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnection(object):
+
+    def __init__(self, number):
+        self.number = number
+        self.broken = False
+        self.closed = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def ping(self):
+        if self.broken:
+            raise Exception('MySQL server has gone away')
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnector(object):
+
+    def __init__(self):
+        self.connections = []
+        self.fail = False
+
+    def __call__(self):
+        if self.fail:
+            raise Exception('can not connect')
+        self.connections.append(FakeConnection(len(self.connections)))
+        return self.connections[-1]
+
+
+class ConnectionPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.connect = FakeConnector()
+        self.pool = ConnectionPool(self.connect)
+
+    def test_min_size_is_opened(self):
+        self.pool.configure(min_size=2, max_size=4)
+        self.assertEqual(len(self.connect.connections), 2)
+        self.assertEqual(self.pool.get_metrics()['idle'], 2)
+
+    def test_nested_cursors_share_the_connection(self):
+        outer = PooledCursor(self.pool)
+        inner = PooledCursor(self.pool)
+        self.assertIs(outer.connection, inner.connection)
+        inner.close()
+        self.assertIs(self.pool.connection, outer.connection)
+        outer.close()
+        self.assertIsNone(self.pool.connection)
+        self.assertEqual(self.pool.get_metrics()['active'], 0)
+
+    def test_threads_do_not_share_connections(self):
+        cursor = PooledCursor(self.pool)
+        other = []
+        thread = threading.Thread(target=lambda: other.append(PooledCursor(self.pool)))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0].connection, cursor.connection)
+        self.assertEqual(self.pool.get_metrics()['active'], 2)
+
+    def test_max_size_waits_for_a_release(self):
+        self.pool.configure(max_size=1)
+        cursor = PooledCursor(self.pool)
+        acquired = threading.Event()
+
+        def acquire():
+            PooledCursor(self.pool).close()
+            acquired.set()
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        self.assertFalse(acquired.wait(0.1))
+        cursor.close()
+        self.assertTrue(acquired.wait(5.0))
+        thread.join()
+        self.assertEqual(len(self.connect.connections), 1)
+        self.assertGreater(self.pool.get_metrics()['max_wait'], 0.0)
+
+    def test_stale_connection_is_replaced(self):
+        self.pool.check_interval = 0.0
+        self.connect.connections[0].broken = True
+        time.sleep(0.01)
+        cursor = PooledCursor(self.pool)
+        self.assertEqual(cursor.connection.number, 1)
+        self.assertTrue(self.connect.connections[0].closed)
+        cursor.close()
+
+    def test_failed_connect_frees_its_slot(self):
+        self.pool.configure(max_size=2)
+        cursor = PooledCursor(self.pool)
+        self.connect.fail = True
+        result = []
+
+        def acquire():
+            try:
+                PooledCursor(self.pool)
+            except Exception as e:
+                result.append(e)
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        thread.join()
+        self.assertEqual(len(result), 1)
+        self.assertEqual(self.pool.get_metrics()['size'], 1)
+        cursor.close()
+
+
+def make_row(topology, batch_size, config_hash='', cached=False):
+    return ('Caffe', topology, batch_size, 'synthetic', 100, 312.5, 156.25, 12.0, config_hash, cached)
+
+
+class StorageTestCase(unittest.TestCase):
+    """
+        the queries of SQL_wrapper on a SQLite file
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.storage = Sqlite_wrapper(os.path.join(self.directory, 'farm.db'))
+        self.storage.init_database()
+
+    def tearDown(self):
+        self.storage.pool.close()
+        shutil.rmtree(self.directory)
+
+    def insert_request(self, request_id, rows, gpu_model='Tesla M40', email='a@intel.com', framework='caffe',
+                       topology=('googlenet', )):
+        return self.storage.inert_request_with_results(request_id, 'container_1', gpu_model, email, framework,
+                                                       list(topology), 32, 100, rows)
+
+
+class ResultReportsTest(StorageTestCase):
+
+    def test_request_with_results(self):
+        self.assertTrue(self.insert_request('request_1', [make_row('googlenet', 32), make_row('googlenet', 64)]))
+        results = self.storage.get_result_by_request_id('request_1')
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results.column('BATCH_SIZE'), [32, 64])
+        self.assertEqual(results.column('MAIL_ADDRESS'), ['a@intel.com', 'a@intel.com'])
+        self.assertEqual(results.column('SCORE'), ['312.50', '312.50'])
+
+    def test_values_are_parameters(self):
+        topology = "googlenet'); DROP TABLE result_reports; --"
+        self.assertTrue(self.insert_request('request_1', [make_row(topology, 32)], email="o'brien@intel.com"))
+        results = self.storage.get_result_by_request_id('request_1')
+        self.assertEqual(results.column('TOPOLOGY'), [topology])
+        self.assertEqual(results.column('MAIL_ADDRESS'), ["o'brien@intel.com"])
+
+    def test_failed_row_rolls_the_request_back(self):
+        self.assertFalse(self.insert_request('request_1', [make_row('googlenet', 32), ('Caffe', 'alexnet')]))
+        self.assertEqual(len(self.storage.get_result_by_request_id('request_1')), 0)
+        self.assertEqual(len(self.storage.get_request_reports(10)), 0)
+
+
+class RequestReportsTest(StorageTestCase):
+
+    def setUp(self):
+        StorageTestCase.setUp(self)
+        for number in range(1, 6):
+            email = 'a@intel.com' if number % 2 else 'b@intel.com'
+            topology = 'googlenet' if number < 5 else 'resnet'
+            self.insert_request('request_%d' % number, [make_row(topology, 32)], email=email, topology=[topology])
+
+    def page(self, count, **kwargs):
+        rows = self.storage.get_request_reports(count, **kwargs)
+        return ([request_id for request_id in rows.column('REQUEST_ID')],
+                [(rows.column('REQUEST_TIME')[i], rows.column('id')[i]) for i in range(len(rows))])
+
+    def test_keyset_pages(self):
+        (request_ids, keys) = self.page(2)
+        self.assertEqual(request_ids, ['request_5', 'request_4'])
+        (request_ids, older_keys) = self.page(2, older=keys[-1])
+        self.assertEqual(request_ids, ['request_3', 'request_2'])
+        self.assertEqual(self.page(2, older=older_keys[-1])[0], ['request_1'])
+        self.assertEqual(self.page(2, newer=older_keys[0])[0], ['request_5', 'request_4'])
+
+    def test_filters(self):
+        self.assertEqual(self.page(10, filters={'email': 'b@intel.com'})[0], ['request_4', 'request_2'])
+        self.assertEqual(self.page(10, filters={'topology': 'resnet'})[0], ['request_5'])
+        self.assertEqual(self.page(10, filters={'email': 'a@intel.com', 'topology': 'googlenet'})[0],
+                         ['request_3', 'request_1'])
+        self.assertEqual(self.page(10, filters={'date_to': '2000-01-01'})[0], [])
+        self.assertEqual(len(self.page(10, filters={'date_from': '2000-01-01'})[0]), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+import os
+import shutil
+import datetime
+import tempfile
+import unittest
+from sqlite_wrapper import SqliteConnection, Sqlite_wrapper, convert_datetime
+
+
+class ConvertDatetimeTest(unittest.TestCase):
+
+    def test_formats(self):
+        self.assertEqual(convert_datetime('2016-11-02 10:20:30'), datetime.datetime(2016, 11, 2, 10, 20, 30))
+        self.assertEqual(convert_datetime('2016-11-02 10:20:30.500000'),
+                         datetime.datetime(2016, 11, 2, 10, 20, 30, 500000))
+        self.assertEqual(convert_datetime('2016-11-02'), datetime.datetime(2016, 11, 2))
+        self.assertEqual(convert_datetime('yesterday'), 'yesterday')
+
+
+class SqliteConnectionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.connection = SqliteConnection(os.path.join(self.directory, 'farm.db'))
+        self.cursor = self.connection.cursor()
+        self.cursor.execute("CREATE TABLE items (NAME VARCHAR(64), CREATED DATETIME);")
+
+    def tearDown(self):
+        self.cursor.close()
+        self.connection.close()
+        shutil.rmtree(self.directory)
+
+    def test_parameters_and_rowcount(self):
+        self.cursor.executemany("INSERT INTO items (NAME, CREATED) VALUES (%s, %s);",
+                                [('a', '2016-11-02 10:20:30'), ("o'brien", '2016-11-03 00:00:00')])
+        self.assertEqual(self.cursor.rowcount, 2)
+        self.assertEqual(self.cursor.execute("SELECT NAME FROM items WHERE NAME = %s;", ("o'brien", )), 1)
+        self.assertEqual(self.cursor.fetchone(), ("o'brien", ))
+        self.assertIsNone(self.cursor.fetchone())
+
+    def test_datetime_columns(self):
+        self.cursor.execute("INSERT INTO items (NAME, CREATED) VALUES (%s, %s);", ('a', '2016-11-02 10:20:30'))
+        self.cursor.execute("SELECT CREATED FROM items;")
+        self.assertEqual(self.cursor.fetchall(), [(datetime.datetime(2016, 11, 2, 10, 20, 30), )])
+
+    def test_autocommit_and_transactions(self):
+        self.cursor.execute("INSERT INTO items (NAME) VALUES (%s);", ('a', ))
+        self.cursor.execute(Sqlite_wrapper.BEGIN_SQL)
+        self.cursor.execute("INSERT INTO items (NAME) VALUES (%s);", ('b', ))
+        self.connection.rollback()
+        self.cursor.execute("SELECT NAME FROM items;")
+        self.assertEqual(self.cursor.fetchall(), [('a', )])
+
+    def test_wal_mode(self):
+        self.cursor.execute("PRAGMA journal_mode;")
+        self.assertEqual(self.cursor.fetchone(), ('wal', ))
+
+
+class SqliteWrapperTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.storage = Sqlite_wrapper(os.path.join(self.directory, 'farm.db'))
+        self.storage.init_database()
+
+    def tearDown(self):
+        self.storage.pool.close()
+        shutil.rmtree(self.directory)
+
+    def test_add_column_if_missing(self):
+        cursor = self.storage.cursor()
+        try:
+            self.storage.add_column_if_missing('accounts', 'TEAM', "VARCHAR(64) NOT NULL DEFAULT ''", cursor)
+            self.storage.add_column_if_missing('accounts', 'TEAM', "VARCHAR(64) NOT NULL DEFAULT ''", cursor)
+            cursor.execute("PRAGMA table_info(accounts);")
+            columns = [row[1] for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+        self.assertEqual(columns.count('TEAM'), 1)
+
+    def test_request_time_default(self):
+        self.assertTrue(self.storage.inert_request_with_results('request_1', 'container_1', 'Tesla M40',
+                                                                'a@intel.com', 'caffe', ['googlenet'], 32, 100, []))
+        rows = self.storage.get_request_reports(10)
+        self.assertIsInstance(rows.column('REQUEST_TIME')[0], datetime.datetime)
+
+
+if __name__ == '__main__':
+    unittest.main()
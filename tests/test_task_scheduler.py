@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from docker_control import Container, Docker_Image
+from sqlite_wrapper import Sqlite_wrapper
+from task_scheduler import Task_Scheduler
+from workload import Workload
+
+REQUEST_XML = """<root>
+    <request_id>%(request_id)s</request_id>
+    <framework>bvlc caffe</framework>
+    <batch_size>32</batch_size>
+    <cudnn>cudnn-5.1</cudnn>
+    <cuda>cuda-8.0</cuda>
+    <iterations>100</iterations>
+    <gpu_model>Tesla M40</gpu_model>
+    <gpu_boost>Off</gpu_boost>
+    <email>%(email)s</email>
+    <topology>googlenet</topology>
+    <profiling>%(profiling)s</profiling>
+    <force_rerun>%(force_rerun)s</force_rerun>
+</root>
+"""
+
+
+class FakeContainerPool(object):
+
+    def __init__(self):
+        self.released = []
+
+    def acquire(self, image, gpuid):
+        return Container('container_test', image, gpuid)
+
+    def release(self, container, healthy=True):
+        self.released.append(healthy)
+
+
+class FakeScheduler(Task_Scheduler):
+    """
+        Task_Scheduler on the fake GPUs and a SQLite database, without docker:
+        the workloads return one result per configuration
+    """
+    runnable = True
+    fail = False
+    # when set, the workloads wait for it
+    gate = None
+    # raw output written by the workloads
+    output = b''
+
+    def prepare_env(self):
+        self.runs = []
+        self.checks = []
+        self.container_pool = FakeContainerPool()
+        image = Docker_Image('caffe', 'latest', 'sha256:0123456789ab', '1 day ago', '4 GB')
+        image.get_image_property(8.0, 'cuda_8.0.27', 5.1, 'cudnn-8.0-linux-x64-v5.1-rc', False, True)
+        self.docker_control.images = [image]
+        self.sql_wrapper.init_database()
+        self.runtime_estimator.load(self.sql_wrapper)
+
+    def request_runnable(self, request, gpu_device):
+        self.checks.append((request['request_id'], gpu_device.gpuid))
+        return self.runnable and Task_Scheduler.request_runnable(self, request, gpu_device)
+
+    def workload_run(self, container, request, skip=()):
+        self.runs.append(request['request_id'])
+        if self.gate is not None:
+            self.gate.wait(10.0)
+        request['raw_log'].extend(self.output)
+        if self.fail:
+            raise Exception('workload failed')
+        results = []
+        for topology in request['topology']:
+            for batch_size in Workload.get_batch_sizes(topology, request['batch_size']):
+                if (topology, batch_size) in skip:
+                    continue
+                results.append({'framework': 'Caffe', 'topology': topology, 'batch_size': batch_size,
+                                'source': request['source'], 'iterations': request['iterations'],
+                                'score': 100.0, 'training_images_per_second': 50.0, 'duration': 12.0})
+        return results
+
+
+class TaskSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp()
+        # the request logs and the reports are written in the working directory
+        os.chdir(self.directory)
+        self.journal_path = os.path.join(self.directory, 'requests.journal')
+        self.database_path = os.path.join(self.directory, 'farm.db')
+        self.schedulers = []
+        self.scheduler = self.make_scheduler()
+
+    def tearDown(self):
+        for scheduler in self.schedulers:
+            scheduler.stop()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def make_scheduler(self, runnable=True):
+        FakeScheduler.runnable = runnable
+        scheduler = FakeScheduler('fake', 0.0, self.journal_path, Sqlite_wrapper(self.database_path))
+        self.schedulers.append(scheduler)
+        return scheduler
+
+    def write_request(self, request_id, email='a@intel.com', profiling=False, force_rerun=False):
+        path = os.path.join(self.directory, '%s.xml' % request_id)
+        with open(path, 'w') as fp:
+            fp.write(REQUEST_XML % {'request_id': request_id, 'email': email,
+                                    'profiling': 'true' if profiling else 'false',
+                                    'force_rerun': 'true' if force_rerun else 'false'})
+        return path
+
+    def submit(self, request_id, **kwargs):
+        self.scheduler.assign_request(self.write_request(request_id, **kwargs))
+
+    def wait_until(self, condition, timeout=10.0):
+        deadline = time.time() + timeout
+        while not condition():
+            if time.time() > deadline:
+                self.fail('timed out')
+            time.sleep(0.01)
+
+    def wait_state(self, request_id):
+        """
+            Returns:
+                the state of the request once it is finished and evicted
+        """
+        self.wait_until(lambda: request_id in self.scheduler.finished)
+        return self.scheduler.finished[request_id]['state']
+
+    def test_transitions(self):
+        TASK_STATE = Task_Scheduler.TASK_STATE
+        request = {'request_id': 'request_1', 'xml_path': None, 'submit_time': 1.0, 'start_time': None,
+                   'finish_time': None, 'gpu_id': None, 'state': TASK_STATE.Pending}
+        self.assertRaises(Exception, self.scheduler.set_state, request, TASK_STATE.Running)
+        self.scheduler.set_state(request, TASK_STATE.Dispatched)
+        self.scheduler.set_state(request, TASK_STATE.Running)
+        self.scheduler.set_state(request, TASK_STATE.Failure)
+        self.assertRaises(Exception, self.scheduler.set_state, request, TASK_STATE.Pending)
+        self.assertEqual(self.scheduler.journal.replay()['request_1']['state'], 'Failure')
+
+    def test_run(self):
+        states = []
+        self.scheduler.add_state_listener(lambda request: states.append(str(request['state'])))
+        self.submit('request_1')
+        self.assertEqual(self.wait_state('request_1'), 'Finish')
+        self.assertEqual(states, ['Pending', 'Dispatched', 'Running', 'Finish'])
+        self.assertEqual(self.scheduler.runs, ['request_1'])
+        self.assertEqual(self.scheduler.container_pool.released, [True])
+        results = self.scheduler.sql_wrapper.get_result_by_request_id('request_1')
+        self.assertEqual(len(results), 1)
+        self.assertFalse(results.column('CACHED')[0])
+        # the GPU is released
+        self.assertEqual([g.blocked for g in self.scheduler.gpu_monitor.gpulists], [False, False])
+
+    def test_failure(self):
+        self.scheduler.fail = True
+        self.submit('request_1')
+        self.assertEqual(self.wait_state('request_1'), 'Failure')
+        self.assertEqual(self.scheduler.container_pool.released, [False])
+        self.assertEqual(len(self.scheduler.sql_wrapper.get_result_by_request_id('request_1')), 0)
+
+    def test_one_worker_per_gpu(self):
+        self.scheduler.gate = threading.Event()
+        self.submit('request_1', force_rerun=True)
+        self.submit('request_2', force_rerun=True)
+        self.submit('request_3', force_rerun=True)
+        self.wait_until(lambda: len(self.scheduler.runs) == 2)
+        running = [self.scheduler.requests[request_id] for request_id in self.scheduler.runs]
+        self.assertEqual(sorted(request['gpu_id'] for request in running), [0, 1])
+        self.assertEqual(str(self.scheduler.requests['request_3']['state']), 'Pending')
+        self.scheduler.gate.set()
+        for request_id in ('request_1', 'request_2', 'request_3'):
+            self.assertEqual(self.wait_state(request_id), 'Finish')
+
+    def test_finished_request_is_evicted(self):
+        self.submit('request_1')
+        self.wait_state('request_1')
+        self.assertNotIn('request_1', self.scheduler.requests)
+        stub = self.scheduler.find_request('request_1')
+        self.assertEqual(stub['state'], 'Finish')
+        self.assertNotIn('raw_log', stub)
+        request = self.scheduler.get_request('request_1')
+        self.assertEqual(str(request['state']), 'Finish')
+        self.assertTrue(request['raw_log'].closed)
+        self.assertEqual(request['gpu_id'], stub['gpu_id'])
+        self.assertEqual(self.scheduler.get_request_history('request_1')['timestamp'], [])
+
+    def test_stubs_are_bounded(self):
+        self.scheduler.finished_requests = 1
+        self.scheduler.journal_records = 0
+        self.submit('request_1')
+        self.wait_state('request_1')
+        self.submit('request_2')
+        self.wait_state('request_2')
+        self.assertEqual(list(self.scheduler.finished.keys()), ['request_2'])
+        self.assertIsNone(self.scheduler.find_request('request_1'))
+        self.assertRaises(KeyError, self.scheduler.get_request, 'request_1')
+        # the worker compacts the journal after evicting request_2
+        self.wait_until(lambda: list(self.scheduler.journal.replay().keys()) == ['request_2'])
+
+    def test_request_submitted_during_compaction(self):
+        self.submit('request_1')
+        self.wait_state('request_1')
+        compact = self.scheduler.journal.compact
+        submitter = threading.Thread(target=self.submit, args=('request_2', ), kwargs={'force_rerun': True})
+
+        def compact_while_submitting(requests):
+            submitter.start()
+            # without self.lock, request_2 would be journaled now and overwritten
+            time.sleep(0.1)
+            compact(requests)
+        self.scheduler.journal.compact = compact_while_submitting
+        self.scheduler.compact_journal()
+        submitter.join()
+        self.assertIn('request_2', self.scheduler.journal.replay())
+
+    def test_cached_results(self):
+        self.submit('request_1')
+        self.wait_state('request_1')
+        self.submit('request_2', email='b@intel.com')
+        self.assertEqual(self.wait_state('request_2'), 'Finish')
+        self.assertEqual(self.scheduler.runs, ['request_1'])
+        results = self.scheduler.sql_wrapper.get_result_by_request_id('request_2')
+        self.assertEqual(len(results), 1)
+        self.assertTrue(results.column('CACHED')[0])
+        # the copied rows are not measured runs
+        self.assertEqual(len(self.scheduler.sql_wrapper.get_runtime_history(10)), 1)
+
+    def test_force_rerun(self):
+        self.submit('request_1')
+        self.wait_state('request_1')
+        self.submit('request_2', force_rerun=True)
+        self.wait_state('request_2')
+        self.assertEqual(self.scheduler.runs, ['request_1', 'request_2'])
+
+    def test_profiling_is_not_cached(self):
+        self.submit('request_1', profiling=True)
+        self.wait_state('request_1')
+        self.submit('request_2', profiling=True)
+        self.wait_state('request_2')
+        self.assertEqual(self.scheduler.runs, ['request_1', 'request_2'])
+
+    def test_busy_model_is_checked_once(self):
+        self.scheduler.stop()
+        self.scheduler.runnable = False
+        for request_id in ('request_1', 'request_2', 'request_3'):
+            self.submit(request_id, force_rerun=True)
+        self.scheduler.dispatch()
+        # the requests after the first one can't get a GPU of the model either
+        self.assertEqual(sorted(self.scheduler.checks), [('request_1', 0), ('request_1', 1)])
+
+    def test_queue_info(self):
+        self.scheduler.runnable = False
+        self.submit('request_1')
+        self.submit('request_2', email='b@intel.com')
+        queue = self.scheduler.get_queue_info()
+        self.assertEqual([item['request_id'] for item in queue], ['request_1', 'request_2'])
+        self.assertEqual([item['state'] for item in queue], ['Pending', 'Pending'])
+        self.assertEqual([item['position'] for item in queue], [1, 2])
+        self.assertEqual([item['estimated_wait'] for item in queue], [0, 0])
+
+    def test_recover(self):
+        self.submit('request_2')
+        self.wait_state('request_2')
+        self.scheduler.runnable = False
+        # not served by the results of request_2
+        self.submit('request_1', force_rerun=True)
+        # request_3 was running when the server stopped, without results
+        self.submit('request_3', force_rerun=True)
+        request = self.scheduler.requests['request_3']
+        request['state'] = Task_Scheduler.TASK_STATE.Running
+        request['gpu_id'] = 1
+        self.scheduler.journal.record(request)
+        recovered = self.make_scheduler(runnable=False)
+        self.assertEqual(sorted(recovered.requests.keys()), ['request_1', 'request_3'])
+        self.assertEqual(str(recovered.requests['request_3']['state']), 'Pending')
+        self.assertIsNone(recovered.requests['request_3']['gpu_id'])
+        self.assertEqual(sorted(request['request_id'] for request in recovered.pending_requests),
+                         ['request_1', 'request_3'])
+        self.assertEqual(list(recovered.finished.keys()), ['request_2'])
+        self.assertEqual(len(open(self.journal_path).readlines()), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,7 @@
 import os
 import re
 import sys
+import time
 import pandas
 from collections import OrderedDict
 from cmd_generator import *
@@ -36,7 +37,7 @@ class Workload(object):
 
     def make_empty_result(self):
         result = {}
-        keys = ['framework', 'topology', 'batch_size', 'source', 'iterations', 'score', 'training_images_per_second']
+        keys = ['framework', 'topology', 'batch_size', 'source', 'iterations', 'score', 'training_images_per_second', 'duration']
         for key in keys:
             result[key] = None
         result['forward_timing'] = OrderedDict()
@@ -46,14 +47,26 @@ class Workload(object):
     def sudo_docker_wrapper(self, command):
         return 'sudo docker exec %s %s' % (self.container, command)
 
-    def run_batch(self, topologies, iterations, batch_size, gpuid, global_buffer, source):
+    @classmethod
+    def get_batch_sizes(cls, topology, batch_size):
+        """
+            Returns:
+                the batch sizes run for one topology, the defaults when batch_size is 0
+        """
+        if batch_size == 0:
+            return cls.batch_size.get(topology, ())
+        return [batch_size, ]
+
+    def run_batch(self, topologies, iterations, batch_size, gpuid, global_buffer, source, skip=()):
+        """
+            Args:
+                skip: (topology, batch_size) configurations not to run
+        """
         results = []
         for topology in topologies:
-            if batch_size == 0:
-                bzs = self.__class__.batch_size[topology]
-            else:
-                bzs = [batch_size, ]
-            for bz in bzs:
+            for bz in self.__class__.get_batch_sizes(topology, batch_size):
+                if (topology, bz) in skip:
+                    continue
                 result_item = self.run_specific_config(topology, iterations, bz, gpuid, source, global_buffer)
                 results.append(result_item)
         if (self.nvprof):
@@ -80,9 +93,24 @@ class Workload(object):
 
 
     @abstractmethod
-    def parse_from_log(self, lines):
+    def parse_line(self, line, result):
+        """
+            parse one line of the output into result, as it is read
+        """
+        pass
+
+    @abstractmethod
+    def finish_result(self, result):
+        """
+            compute the scores of result once the whole output is parsed
+        """
         pass
 
+    def parse_from_log(self, lines, result):
+        for line in lines:
+            self.parse_line(line, result)
+        return self.finish_result(result)
+
     def run_specific_config(self, topology, iterations, batch_size, gpuid, source, global_buffer):
         '''
             
@@ -103,15 +131,17 @@ class Workload(object):
         result['iterations'] = iterations
         assert(topology in self.__class__.topology.keys())
         command = self.sudo_docker_wrapper(self.generate_run_comamnd(topology, iterations, batch_size, gpuid, source))
-        local_buffer = []
+        start_time = time.time()
         fp = Popen(command, shell=True, stdin=PIPE, stdout=PIPE, stderr=STDOUT, close_fds=True)
         while True:
             line = fp.stdout.readline()
             global_buffer.extend(line)
-            local_buffer.append(line) 
+            # parsed as it comes, the output is only kept in the request log
+            self.parse_line(line, result)
             if line == '' and fp.poll() != None:
                 break
-        self.parse_from_log(local_buffer, result)
+        result['duration'] = time.time() - start_time
+        self.finish_result(result)
         return result
 
 
@@ -138,16 +168,16 @@ class Tensorflow_Workload(Workload):
     def build_in_docker(self):
         pass
 
-    def parse_from_log(self, lines, result):
-        for line in lines:
-            m = re.match(r"(.*)Forward across(.*)steps, (.*)\+/\-(.*)", line)
-            if m is not None:
-                result['Average Forward Pass'] = float(m.group(3))
-                continue
-            m = re.match(r"(.*)Forward-backward across(.*)steps, (.*)\+/\-(.*)", line)
-            if m is not None:
-                result['Average Pass'] = float(m.group(3))
-                continue
+    def parse_line(self, line, result):
+        m = re.match(r"(.*)Forward across(.*)steps, (.*)\+/\-(.*)", line)
+        if m is not None:
+            result['Average Forward Pass'] = float(m.group(3))
+            return
+        m = re.match(r"(.*)Forward-backward across(.*)steps, (.*)\+/\-(.*)", line)
+        if m is not None:
+            result['Average Pass'] = float(m.group(3))
+
+    def finish_result(self, result):
         result['score'] = 1.0 * result['batch_size'] / (result['Average Forward Pass'] + sys.float_info.epsilon)
         result['training_images_per_second'] = 1.0 * result['batch_size'] / (result['Average Pass'] + sys.float_info.epsilon)
         return result 
@@ -186,30 +216,30 @@ class Caffe_Workload(Workload):
         pass
 
 
-    def parse_from_log(self, lines, result):
-        for line in lines:
-            # Get Average Forward Pass Time
-            m = re.match('.*Average Forward pass.*', line.strip())
-            if m is not None:
-                result['Average Forward pass'] = float(line.split(' ')[-2])
-                continue
-            # Get Average Backward Pass Time
-            m = re.match('.*Average Backward pass.*', line.strip())
-            if m is not None:
-                result['Average Backward pass'] = float(line.split(' ')[-2])
-                continue
-            m = re.match(r"(.*)\](.*)forward:(.*)ms", line)
-            if m is not None:
-                layer_name = m.group(2).strip()
-                timing = float(m.group(3).strip())
-                result['forward_timing'][layer_name] = timing
-                continue
-            m = re.match(r"(.*)\](.*)backward:(.*)ms", line)
-            if m is not None:
-                layer_name = m.group(2).strip()
-                timing = float(m.group(3).strip())
-                result['backward_timing'][layer_name] = timing
-                continue
+    def parse_line(self, line, result):
+        # Get Average Forward Pass Time
+        m = re.match('.*Average Forward pass.*', line.strip())
+        if m is not None:
+            result['Average Forward pass'] = float(line.split(' ')[-2])
+            return
+        # Get Average Backward Pass Time
+        m = re.match('.*Average Backward pass.*', line.strip())
+        if m is not None:
+            result['Average Backward pass'] = float(line.split(' ')[-2])
+            return
+        m = re.match(r"(.*)\](.*)forward:(.*)ms", line)
+        if m is not None:
+            layer_name = m.group(2).strip()
+            timing = float(m.group(3).strip())
+            result['forward_timing'][layer_name] = timing
+            return
+        m = re.match(r"(.*)\](.*)backward:(.*)ms", line)
+        if m is not None:
+            layer_name = m.group(2).strip()
+            timing = float(m.group(3).strip())
+            result['backward_timing'][layer_name] = timing
+
+    def finish_result(self, result):
         result['score'] = 1000.0 * result['batch_size'] / (result['Average Forward pass'] + sys.float_info.epsilon) 
         result['training_images_per_second'] = 1000.0 * result['batch_size'] / (result['Average Backward pass'] + result['Average Forward pass'] + sys.float_info.epsilon)
         return result 
@@ -57,6 +57,7 @@ class XMLParser(object):
         self.config_dicts['cudnn_string'] = self.__class__.cudnn_strings[str(self.config_dicts['cudnn'])] 
         self.config_dicts['cuda_string'] = self.__class__.cuda_strings[str(self.config_dicts['cuda'])] 
         self.config_dicts['profiling'] = True if self.config_dicts['profiling'] == 'true' else False
+        self.config_dicts['force_rerun'] = True if self.config_dicts.get('force_rerun') == 'true' else False
         self.config_dicts['tensorflow'] = False
         self.config_dicts['caffe'] = False
         self.config_dicts[self.config_dicts['framework']] = True